@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from .async_db import run_query
+from .models import Enrollment
+from .performance import record_cache
+
+
+class CourseAccess(namedtuple('CourseAccess', ['is_owner', 'is_admin', 'is_enrolled'])):
+    """Outcome of the owner / admin / active-enrollment checks for one course"""
+
+    @property
+    def allowed(self):
+        return self.is_owner or self.is_admin or self.is_enrolled
+
+
+NO_ACCESS = CourseAccess(is_owner=False, is_admin=False, is_enrolled=False)
+
+
+# ==================== CACHE BACKENDS ====================
+
+class LRUAccessCache:
+    """
+    In-process LRU cache. Signal invalidation only reaches the current
+    process, so entries also expire after `timeout` seconds; use
+    DjangoAccessCache with a shared cache when running several workers.
+    """
+
+    def __init__(self, max_entries=10000, timeout=60):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoAccessCache:
+    """Stores decisions in one of the caches configured in settings.CACHES"""
+
+    def __init__(self, alias='default', timeout=300, key_prefix='course-access'):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, key):
+        return f'{self.key_prefix}:{key}'
+
+    def get(self, key):
+        return self.cache.get(self.make_key(key))
+
+    def set(self, key, value):
+        self.cache.set(self.make_key(key), value, self.timeout)
+
+    def delete(self, key):
+        self.cache.delete(self.make_key(key))
+
+    def clear(self):
+        self.cache.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_access_cache():
+    """Return the shared cache backend configured by COURSE_ACCESS_CACHE"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, 'COURSE_ACCESS_CACHE', {})
+                backend_class = import_string(config.get('BACKEND', 'core.access.LRUAccessCache'))
+                _backend = backend_class(**config.get('OPTIONS', {}))
+    return _backend
+
+
+# ==================== ACCESS DECISIONS ====================
+
+def _generation_key(course_id):
+    return f'generation:{course_id}'
+
+
+def _decision_key(cache, user_id, course_id):
+    # Course-wide changes bump the generation instead of enumerating users
+    generation = cache.get(_generation_key(course_id)) or 0
+    return f'{user_id}:{course_id}:{generation}'
+
+
+def _get_request_memo(request):
+    request = getattr(request, '_request', request)
+    memo = getattr(request, '_course_access_memo', None)
+    if memo is None:
+        memo = request._course_access_memo = {}
+    return memo
+
+
+def is_enrolled(user_id, course_id):
+    return Enrollment.objects.filter(student_id=user_id, course_id=course_id, is_active=True).exists()
+
+
+def _decide(user, course, enrolled):
+    return CourseAccess(
+        is_owner=user.role == 'teacher' and course.instructor_id == user.pk,
+        is_admin=user.role == 'admin',
+        is_enrolled=user.role == 'student' and enrolled,
+    )
+
+
+def _cached_decision(cache, key, user):
+    cached = cache.get(key)
+    # A role change must not reuse a decision computed for the old role
+    if cached is not None and cached[0] == user.role:
+        record_cache(True)
+        return CourseAccess(*cached[1])
+    record_cache(False)
+    return None
+
+
+def get_course_access(request, course):
+    """
+    Decide whether request.user may see the members-only content of course.
+    Decisions are memoized on the request and shared through the access
+    cache, so the enrollment lookup runs at most once per (user, course)
+    until an Enrollment or Course signal invalidates it.
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return NO_ACCESS
+
+    memo = _get_request_memo(request)
+    memo_key = (user.pk, course.pk)
+    if memo_key in memo:
+        return memo[memo_key]
+
+    cache = get_access_cache()
+    key = _decision_key(cache, user.pk, course.pk)
+    access = _cached_decision(cache, key, user)
+    if access is None:
+        access = _decide(user, course, user.role == 'student' and is_enrolled(user.pk, course.pk))
+        cache.set(key, (user.role, tuple(access)))
+
+    memo[memo_key] = access
+    return access
+
+
+async def aget_course_access(request, course_id, fetch_course):
+    """
+    get_course_access for the async views, fetching the course as well:
+    on a cache miss the enrollment lookup, which only needs the id, runs
+    alongside the fetch_course awaitable. Returns (course, access), with
+    course None when fetch_course found nothing.
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return await fetch_course, NO_ACCESS
+
+    cache = get_access_cache()
+    key = _decision_key(cache, user.pk, course_id)
+    access = _cached_decision(cache, key, user)
+    if access is not None:
+        return await fetch_course, access
+
+    if user.role == 'student':
+        course, enrolled = await asyncio.gather(fetch_course, run_query(is_enrolled, user.pk, course_id))
+    else:
+        course, enrolled = await fetch_course, False
+    if course is None:
+        return None, NO_ACCESS
+
+    access = _decide(user, course, enrolled)
+    cache.set(key, (user.role, tuple(access)))
+    _get_request_memo(request)[(user.pk, course.pk)] = access
+    return course, access
+
+
+def invalidate_enrollment(student_id, course_id):
+    cache = get_access_cache()
+    cache.delete(_decision_key(cache, student_id, course_id))
+
+
+def invalidate_course(course_id):
+    cache = get_access_cache()
+    key = _generation_key(course_id)
+    cache.set(key, (cache.get(key) or 0) + 1)
+
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Course, Category, Lesson, Material, Enrollment, QuestionAnswer
+from .models import Course, Category, Lesson, Material, Enrollment, QuestionAnswer, UploadSession
 # Register your models here.
 
 
@@ -8,4 +8,5 @@ admin.site.register(Course)
 admin.site.register(Lesson)
 admin.site.register(Material)
 admin.site.register(Enrollment)
-admin.site.register(QuestionAnswer)
\ No newline at end of file
+admin.site.register(QuestionAnswer)
+admin.site.register(UploadSession)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.core import checks
+        from . import signals  # noqa: F401
+        from .replicas import check_pin_cache
+
+        checks.register(check_pin_cache, checks.Tags.database)
@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Threads for run_query, ASYNC_QUERY_THREADS of them; each keeps its own
+    database connection, so this also bounds the connections they hold
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_QUERY_THREADS', 32), thread_name_prefix='async-query'
+                )
+    return _executor
+
+
+def _with_connection_cleanup(func):
+    def run(*args, **kwargs):
+        # Worker threads keep their connections between calls, so check
+        # them the way request_started/request_finished do for requests
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return run
+
+
+async def run_query(func, *args, **kwargs):
+    """
+    Run blocking ORM work in a worker thread with its own database
+    connection. Django's async ORM methods all run on the request's single
+    connection thread, one query at a time; independent queries gathered
+    through run_query really run in parallel. Being other connections,
+    they do not see uncommitted writes of the calling thread.
+    """
+    run = sync_to_async(_with_connection_cleanup(func), thread_sensitive=False, executor=get_executor())
+    return await run(*args, **kwargs)
@@ -0,0 +1,195 @@
+import asyncio
+import functools
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, Throttled
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from . import views
+from .access import aget_course_access
+from .async_db import run_query
+from .catalog_cache import catalog_cache_key, get_cached_response, cache_response
+from .conditional import queryset_validators
+from .counters import COUNTER_FIELDS
+from .models import Course, Enrollment
+
+# Async versions of the busiest GET endpoints, routed in place of the sync
+# views when ASYNC_READ_VIEWS is set (run under ASGI). Independent queries
+# of a request run concurrently through run_query; every other method,
+# and browsable API requests, go to the sync DRF view.
+
+
+def async_api_view(sync_view, authenticated=False):
+    """
+    Serve GET with the decorated coroutine, which receives a DRF Request
+    authenticated off the event loop and returns a Response
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+            drf_request = Request(
+                request,
+                parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+                negotiator=api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS(),
+            )
+            try:
+                renderer, media_type = drf_request.negotiator.select_renderer(
+                    drf_request, [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+                )
+            except APIException:
+                renderer = None
+            if renderer is None or renderer.format != 'json':
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+            try:
+                # JWT authentication may look up the user or its token version
+                await run_query(getattr, drf_request, 'user')
+                if authenticated and not drf_request.user.is_authenticated:
+                    raise NotAuthenticated()
+                # The shared bucket store locks and maps a file
+                await sync_to_async(check_throttles, thread_sensitive=False)(drf_request)
+                response = await handler(drf_request, *args, **kwargs)
+            except (APIException, Http404) as exc:
+                response = handle_exception(drf_request, exc)
+
+            if isinstance(response, Response):
+                response.accepted_renderer = renderer
+                response.accepted_media_type = media_type
+                response.renderer_context = {'request': drf_request, 'response': response}
+                patch_vary_headers(response, ['Accept'])
+                response.render()
+            return response
+
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+def handle_exception(request, exc):
+    """What APIView.handle_exception does for the sync views"""
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        header = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+        if header:
+            exc.auth_header = header
+        else:
+            exc.status_code = 403
+    response = api_settings.EXCEPTION_HANDLER(exc, {'request': request})
+    if response is None:
+        raise exc
+    return response
+
+
+def check_throttles(request):
+    """What APIView.check_throttles does with the default throttle classes"""
+    throttles = [throttle() for throttle in api_settings.DEFAULT_THROTTLE_CLASSES]
+    durations = [throttle.wait() for throttle in throttles if not throttle.allow_request(request, None)]
+    if durations:
+        raise Throttled(max((duration for duration in durations if duration is not None), default=None))
+
+
+def parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def cached_course_list(request):
+    cache_key = catalog_cache_key(request, 'course_list', counters=True)
+    return cache_key, get_cached_response(request, cache_key) if cache_key else None
+
+# ==================== COURSES ====================
+
+@async_api_view(views.course_list_create)
+async def course_list_create(request):
+    # Search results are too varied to be worth sharing
+    cache_key = None
+    if not request.query_params.get('search'):
+        cache_key, cached = await sync_to_async(cached_course_list, thread_sensitive=False)(request)
+        if cached is not None:
+            return cached
+
+    # Resolving the search backend may inspect the database
+    queryset, serializer_class, builder = await run_query(views.course_list_query, request)
+    # The validators' aggregate and the page are independent queries; a
+    # 304 discards the page, a much rarer outcome than a 200
+    validators, page = await asyncio.gather(
+        run_query(queryset_validators, request, queryset, 'category', totals=COUNTER_FIELDS),
+        run_query(views.course_list_page, request, queryset, serializer_class, builder),
+    )
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+
+    response = validators.apply(page)
+    if cache_key:
+        await sync_to_async(cache_response, thread_sensitive=False)(cache_key, response, validators)
+    return response
+
+
+@async_api_view(views.course_detail)
+async def course_detail(request, pk):
+    fetch = Course.objects.select_related('category', 'instructor').filter(pk=pk).afirst()
+    course, access = await aget_course_access(request, pk, fetch)
+    if course is None:
+        return Response({'detail': 'Course not found'}, status=404)
+    return views.course_detail_response(request, course, access.allowed)
+
+# ==================== LESSONS ====================
+
+@async_api_view(views.lesson_list_create)
+async def lesson_list_create(request):
+    course_id = request.query_params.get('course')
+    if not course_id:
+        return Response({'detail': 'Course ID is required'}, status=400)
+    course_id = parse_id(course_id)
+    if course_id is None:
+        return Response({'detail': 'Course not found'}, status=404)
+
+    # Lessons are fetched alongside the course and access check and
+    # dropped when either fails
+    (course, access), lessons = await asyncio.gather(
+        aget_course_access(request, course_id, Course.objects.filter(pk=course_id).afirst()),
+        run_query(views.course_lessons, request, course_id),
+    )
+    if course is None:
+        return Response({'detail': 'Course not found'}, status=404)
+    if not access.allowed:
+        return Response({'detail': 'You do not have permission to view these lessons'}, status=403)
+    return Response(lessons)
+
+# ==================== ENROLLMENTS ====================
+
+@async_api_view(views.enrollment_list, authenticated=True)
+async def enrollment_list(request):
+    if request.user.role == 'teacher':
+        course_id = request.query_params.get('course')
+        if not course_id:
+            return Response({'detail': 'Course ID is required'}, status=400)
+        course_id = parse_id(course_id)
+        if course_id is None:
+            return Response({'detail': 'Course not found'}, status=404)
+
+        (course, access), response = await asyncio.gather(
+            aget_course_access(request, course_id, Course.objects.filter(pk=course_id).afirst()),
+            run_query(views.paginated_enrollments, request, Enrollment.objects.filter(course_id=course_id)),
+        )
+        if course is None:
+            return Response({'detail': 'Course not found'}, status=404)
+        if not access.is_owner:
+            return Response({'detail': 'You can only view enrollments for your own courses'}, status=403)
+        return response
+
+    elif request.user.role == 'student':
+        return await run_query(views.paginated_enrollments, request, Enrollment.objects.filter(student=request.user))
+
+    elif request.user.role == 'admin':
+        return await run_query(views.paginated_enrollments, request, views.admin_enrollments(request))
+
+    return Response({'detail': 'Unauthorized role'}, status=403)
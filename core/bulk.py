@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import serializers, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .counters import count_created
+
+
+class PreloadedRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that resolves ids from instances loaded up front
+    for the whole payload instead of running one query per item
+    """
+
+    def __init__(self, instances, **kwargs):
+        self.instances = instances
+        super().__init__(queryset=kwargs.pop('queryset'), **kwargs)
+
+    def to_internal_value(self, data):
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.instances[pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+def collect_ids(items, field):
+    ids = set()
+    for item in items:
+        try:
+            ids.add(int(item.get(field)))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return ids
+
+
+def get_bulk_items(request):
+    """Return the list payload of a bulk request, or an error Response"""
+    items = request.data
+    if isinstance(items, dict):
+        items = items.get('items')
+    if not isinstance(items, list) or not items:
+        return None, Response({'detail': 'Expected a non-empty list of items'}, status=400)
+
+    max_items = getattr(settings, 'BULK_MAX_ITEMS', 5000)
+    if len(items) > max_items:
+        return None, Response({'detail': f'At most {max_items} items per request'}, status=400)
+    return items, None
+
+
+def bulk_create_response(request, items, serializer_class, related, check=None, invalidate=None):
+    """
+    Validate every item with one serializer instance, create the valid
+    ones with a single bulk_create in one transaction and report a result
+    per item, the new id or the errors (201 when all were created, 207
+    when some failed, 400 when none were). With ?atomic=true any failure
+    creates nothing.
+
+    related maps field names to {pk: instance} dicts preloaded for the
+    payload; check(attrs) returns (status, detail) to reject an item after
+    validation, e.g. for ownership or duplicates. invalidate(created) runs
+    after the insert and again on commit, like the signal receivers do.
+    """
+    # No request in the context: ?fields= must not drop writable fields
+    child = serializer_class()
+    # Uniqueness is left to check() and the database constraints; the
+    # serializer's validators would query once per item
+    child.validators = []
+    for name, instances in related.items():
+        model = child.Meta.model._meta.get_field(name).related_model
+        child.fields[name] = PreloadedRelatedField(instances, queryset=model._default_manager.none())
+
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            attrs = child.run_validation(item)
+        except ValidationError as error:
+            results[index] = {'index': index, 'status': 400, 'errors': error.detail}
+            continue
+
+        rejected = check(attrs) if check else None
+        if rejected:
+            results[index] = {'index': index, 'status': rejected[0], 'errors': {'detail': rejected[1]}}
+            continue
+        valid.append((index, attrs))
+
+    atomic = request.query_params.get('atomic', '').lower() in ('1', 'true', 'yes')
+    failed = len(items) - len(valid)
+    if atomic and failed:
+        for index, _ in valid:
+            results[index] = {'index': index, 'status': 424, 'errors': {'detail': 'Not created: another item failed'}}
+        valid = []
+
+    created = []
+    if valid:
+        model = child.Meta.model
+        instances = [model(**attrs) for _, attrs in valid]
+        try:
+            with transaction.atomic():
+                created = model.objects.bulk_create(instances, batch_size=500)
+                # bulk_create skips save() and its signals
+                count_created(model, created)
+                if invalidate:
+                    invalidate(created)
+                    transaction.on_commit(lambda: invalidate(created))
+        except IntegrityError:
+            # A concurrent request inserted a conflicting row after check()
+            return Response({'detail': 'Conflicting concurrent write, nothing was created; retry the request'}, status=409)
+
+        # Ids only: re-serializing thousands of rows with their nested
+        # course would cost more than the insert
+        for (index, _), instance in zip(valid, created):
+            results[index] = {'index': index, 'status': 201, 'id': instance.pk}
+
+    if not failed:
+        response_status = status.HTTP_201_CREATED
+    elif created:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    return Response({'created': len(created), 'failed': len(items) - len(created), 'results': results}, status=response_status)
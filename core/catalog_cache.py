@@ -0,0 +1,90 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+from .conditional import Validators
+from .performance import record_cache
+
+GENERATION_KEY = 'catalog:generation'
+# Bumped by counter updates, which change list payloads without saving a
+# Course; part of the response cache keys, but kept apart from the
+# generation so enrollments only replace course lists
+COUNTERS_KEY = 'catalog:counters'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_version(key, value=None):
+    cache = get_cache()
+    if value is None:
+        value = cache.get(key)
+    if value is None:
+        # Start from a fresh value rather than 1, so an evicted counter can
+        # never line up with entries written under an older generation
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def get_generation():
+    return get_version(GENERATION_KEY)
+
+
+def bump_generation():
+    """Invalidate every cached catalog response at once"""
+    bump_version(GENERATION_KEY)
+
+
+def bump_counters():
+    bump_version(COUNTERS_KEY)
+
+
+def catalog_cache_key(request, name, counters=False):
+    """
+    Cache key for an anonymous catalog GET, or None when the request must
+    not be served from the shared cache. Responses showing counters are
+    keyed by the counters version as well.
+    """
+    if request.method != 'GET' or request.user.is_authenticated:
+        return None
+
+    # The host is part of the key because links and file URLs are absolute
+    params = sorted(request.query_params.lists())
+    digest = hashlib.sha1(repr((request.get_host(), params)).encode('utf-8')).hexdigest()
+    if not counters:
+        return f'catalog:{get_generation()}:{name}:{digest}'
+    versions = get_cache().get_many([GENERATION_KEY, COUNTERS_KEY])
+    generation = get_version(GENERATION_KEY, versions.get(GENERATION_KEY))
+    return f'catalog:{generation}:{get_version(COUNTERS_KEY, versions.get(COUNTERS_KEY))}:{name}:{digest}'
+
+
+def get_cached_response(request, key):
+    entry = get_cache().get(key)
+    record_cache(entry is not None)
+    if entry is None:
+        return None
+
+    validators = Validators(entry['etag'], last_modified=entry['last_modified'])
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    return validators.apply(Response(entry['data']))
+
+
+def cache_response(key, response, validators):
+    get_cache().set(key, {
+        'data': response.data,
+        'etag': validators.etag,
+        'last_modified': validators.last_modified,
+    }, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
@@ -0,0 +1,74 @@
+import hashlib
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+class Validators:
+    """
+    ETag / Last-Modified pair for a response, derived from cheap aggregates
+    instead of the serialized payload. The ETag covers the row count, so a
+    deleted row changes it even though no updated_at moved; clients should
+    prefer If-None-Match over If-Modified-Since.
+    """
+
+    def __init__(self, etag, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def for_request(cls, request, *parts, last_modified=None):
+        user = request.user
+        # Payloads differ per role (teacher filtering, access limits)
+        viewer = (user.pk, user.role) if user and user.is_authenticated else None
+        fingerprint = repr((request.get_full_path(), viewer, last_modified, parts))
+        etag = '"%s"' % hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+        return cls(etag, last_modified=last_modified)
+
+    @property
+    def last_modified_timestamp(self):
+        if self.last_modified is None:
+            return None
+        return int(self.last_modified.timestamp())
+
+    def not_modified(self, request):
+        """Return a 304 (or 412) response if the request's preconditions match"""
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified_timestamp
+        )
+        if response is not None:
+            return self.apply(response)
+        return None
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified_timestamp)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+def queryset_validators(request, queryset, *related, totals=()):
+    """
+    Validators for a list response: one aggregate query over the filtered
+    queryset for the row count, the newest updated_at of the rows and of
+    the related rows they embed (e.g. 'category'), and the sums of
+    `totals`, columns that change without touching updated_at
+    """
+    fields = {'updated_at': 'updated_at'}
+    fields.update({name: f'{name}__updated_at' for name in related})
+    stats = queryset.order_by().aggregate(
+        count=Count('pk'),
+        **{f'{name}_max': Max(path) for name, path in fields.items()},
+        **{f'{name}_sum': Sum(name) for name in totals}
+    )
+    timestamps = [stats[f'{name}_max'] for name in fields if stats[f'{name}_max'] is not None]
+    sums = [stats[f'{name}_sum'] for name in totals]
+    last_modified = max(timestamps) if timestamps else None
+    return Validators.for_request(request, stats['count'], *timestamps, *sums, last_modified=last_modified)
+
+
+def instance_validators(request, instance, *related, variant=None):
+    """Validators for a detail response built from already-loaded instances"""
+    timestamps = [instance.updated_at] + [getattr(instance, name).updated_at for name in related]
+    return Validators.for_request(request, instance.pk, variant, *timestamps, last_modified=max(timestamps))
@@ -0,0 +1,139 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, QuerySet, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from .catalog_cache import bump_counters
+from .models import Course, Enrollment, Lesson, Material, QuestionAnswer
+
+# Counted model -> (Course counter field, foreign key attname on the model,
+# Course lookup matching that key, path from the model to its course)
+COUNTERS = {
+    Enrollment: ('enrollment_count', 'course_id', 'pk', 'course'),
+    Lesson: ('lesson_count', 'course_id', 'pk', 'course'),
+    Material: ('material_count', 'course_id', 'pk', 'course'),
+    QuestionAnswer: ('question_count', 'lesson_id', 'lesson', 'lesson__course'),
+}
+
+COUNTER_FIELDS = tuple(counter[0] for counter in COUNTERS.values())
+
+
+def adjust_counter(model, key, delta):
+    """
+    Add delta to the counter of the course that key (a course id, or a
+    lesson id for questions) belongs to, as a single UPDATE
+    """
+    field, _, lookup, _ = COUNTERS[model]
+    adjust_courses(Course.objects.filter(**{lookup: key}), field, delta)
+
+
+def adjust_courses(courses, field, delta):
+    if delta:
+        courses.update(**{field: Greatest(F(field) + delta, Value(0))})
+        # New catalog ETags, again once readers can see the new count
+        bump_counters()
+        transaction.on_commit(bump_counters)
+
+
+def counted_state(instance):
+    """(counted key, is_active) of an instance, or None if either is deferred"""
+    attname = COUNTERS[type(instance)][1]
+    values = instance.__dict__
+    if attname not in values or 'is_active' not in values:
+        return None
+    return values[attname], values['is_active']
+
+
+def count_created(model, instances):
+    """Counter updates for rows inserted with bulk_create, one UPDATE per course"""
+    if model not in COUNTERS:
+        return
+    totals = {}
+    for instance in instances:
+        state = counted_state(instance)
+        if state and state[1]:
+            totals[state[0]] = totals.get(state[0], 0) + 1
+    for key, delta in totals.items():
+        adjust_counter(model, key, delta)
+
+
+# ==================== SIGNAL RECEIVERS ====================
+
+def remember_state(sender, instance, **kwargs):
+    instance._counter_state = counted_state(instance)
+
+
+def load_state(sender, instance, raw=False, **kwargs):
+    # Instances loaded with deferred fields fetch the stored state once
+    if raw or instance._state.adding or instance._counter_state is not None:
+        return
+    attname = COUNTERS[sender][1]
+    stored = sender._default_manager.filter(pk=instance.pk).values_list(attname, 'is_active').first()
+    instance._counter_state = tuple(stored) if stored else None
+
+
+def update_counters(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else instance._counter_state
+    new = counted_state(instance)
+
+    if old != new:
+        if old and old[1]:
+            adjust_counter(sender, old[0], -1)
+        if new and new[1]:
+            adjust_counter(sender, new[0], 1)
+        if sender is Lesson and old and new and old[0] != new[0]:
+            move_questions(instance, old[0], new[0])
+    instance._counter_state = new
+
+
+def move_questions(lesson, old_course_id, new_course_id):
+    """Questions are counted through their lesson, so follow it to its new course"""
+    count = QuestionAnswer.objects.filter(lesson=lesson, is_active=True).count()
+    adjust_courses(Course.objects.filter(pk=old_course_id), 'question_count', -count)
+    adjust_courses(Course.objects.filter(pk=new_course_id), 'question_count', count)
+
+
+def release_counters(sender, instance, origin=None, **kwargs):
+    # Rows removed along with their course need no counter updates
+    if isinstance(origin, Course) or (isinstance(origin, QuerySet) and origin.model is Course):
+        return
+    state = instance._counter_state or counted_state(instance)
+    if state and state[1]:
+        adjust_counter(sender, state[0], -1)
+
+
+# ==================== RECONCILIATION ====================
+
+def count_subquery(model):
+    path = COUNTERS[model][3]
+    counted = (
+        model.objects
+        .filter(**{path: OuterRef('pk')}, is_active=True)
+        .order_by()
+        .values(path)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted), 0)
+
+
+def with_actual_counts(queryset):
+    """Annotate courses with actual_<counter> values recounted from the rows"""
+    return queryset.annotate(**{
+        f'actual_{COUNTERS[model][0]}': count_subquery(model) for model in COUNTERS
+    })
+
+
+def recount(course_ids):
+    """
+    Set the counters of the courses to their actual values. The rows are
+    locked first, so counter updates in flight are committed (and counted)
+    before the recount and later ones wait for it; the recount and the write
+    are one UPDATE.
+    """
+    with transaction.atomic():
+        locked = list(Course.objects.select_for_update().filter(pk__in=course_ids).values_list('pk', flat=True))
+        Course.objects.filter(pk__in=locked).update(**{
+            COUNTERS[model][0]: count_subquery(model) for model in COUNTERS
+        })
+    bump_counters()
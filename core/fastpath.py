@@ -0,0 +1,139 @@
+from collections.abc import Mapping
+from django.conf import settings
+from rest_framework import serializers
+from .performance import measure
+
+# Fields whose representation is the column value itself
+PLAIN_FIELDS = (
+    serializers.IntegerField,
+    serializers.FloatField,
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+# Fields that format a column value (datetimes, decimals, uuids, dates)
+FORMATTED_FIELDS = (
+    serializers.DateTimeField,
+    serializers.DateField,
+    serializers.DecimalField,
+    serializers.UUIDField,
+)
+
+
+def from_values(*lookups):
+    """
+    Mark a serializer method as the .values() counterpart of a
+    SerializerMethodField: values_<name>(*columns) receives the named
+    columns instead of the instance
+    """
+    def decorate(method):
+        method.values_lookups = lookups
+        return method
+    return decorate
+
+
+class Unsupported(Exception):
+    pass
+
+
+class ValuesRowBuilder:
+    """
+    Read-only rendering of a serializer's fields straight from
+    queryset.values() rows, skipping get_attribute/to_representation per
+    field and the model instance construction. Compiled once per
+    serializer; raises Unsupported for fields it cannot map to columns
+    (nested serializers, method fields without a values_ counterpart).
+    """
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.request = serializer.context.get('request')
+        self.lookups = []
+        self.columns = []
+        for name, field in serializer.fields.items():
+            if not field.write_only:
+                self.columns.append(self.compile(name, field))
+
+    def add_lookup(self, lookup):
+        if lookup not in self.lookups:
+            self.lookups.append(lookup)
+        return lookup
+
+    def compile(self, name, field):
+        """
+        (name, lookup, convert, method_lookups): convert turns a non-null
+        column value into the representation (None when it already is
+        one); method fields instead receive their method_lookups columns
+        """
+        if isinstance(field, serializers.SerializerMethodField):
+            method = getattr(self.serializer, f'values_{name}', None)
+            if method is None or not hasattr(method, 'values_lookups'):
+                raise Unsupported(name)
+            return name, None, method, [self.add_lookup(lookup) for lookup in method.values_lookups]
+
+        if isinstance(field, serializers.BaseSerializer) or field.source == '*':
+            raise Unsupported(name)
+        lookup = self.add_lookup('__'.join(field.source_attrs))
+
+        if hasattr(field, 'values_url'):
+            # Files behind an access-checked endpoint link to it by pk
+            return name, None, field.values_url, [self.add_lookup('id'), lookup]
+        if isinstance(field, serializers.FileField):
+            return name, lookup, self.file_url(field), None
+        if isinstance(field, FORMATTED_FIELDS):
+            return name, lookup, field.to_representation, None
+        if isinstance(field, PLAIN_FIELDS):
+            return name, lookup, None, None
+        raise Unsupported(name)
+
+    def file_url(self, field):
+        storage = self.serializer.Meta.model._meta.get_field(field.source_attrs[-1]).storage
+        use_url = getattr(field, 'use_url', True)
+        request = self.request
+
+        def convert(name):
+            # Like FileField.to_representation, empty names render as None
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+        return convert
+
+    def values(self, queryset, *extra):
+        """queryset.values() with every column the rows need, plus extra"""
+        return queryset.values(*self.lookups, *[lookup for lookup in extra if lookup not in self.lookups])
+
+    def build(self, rows):
+        with measure('serialize'):
+            return self._build(rows)
+
+    def _build(self, rows):
+        data = []
+        for row in rows:
+            item = {}
+            for name, lookup, convert, method_lookups in self.columns:
+                if method_lookups is not None:
+                    item[name] = convert(*[row[column] for column in method_lookups])
+                    continue
+                value = row[lookup]
+                item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
+
+
+def get_row_builder(serializer_class, context):
+    """A ValuesRowBuilder for the serializer, or None to use DRF serialization"""
+    if not getattr(settings, 'API_FAST_SERIALIZATION', True):
+        return None
+    try:
+        return ValuesRowBuilder(serializer_class(context=context))
+    except Unsupported:
+        return None
+
+
+def is_row(instance):
+    return isinstance(instance, Mapping)
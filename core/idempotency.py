@@ -0,0 +1,46 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+
+def get_cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+
+def idempotency_key(request, scope):
+    """
+    Cache key for the request's Idempotency-Key header, scoped to the user
+    and endpoint, or None when the client sent no key
+    """
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return None
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return f'idempotency:{scope}:{request.user.pk}:{digest}'
+
+
+def replay(request, cache_key, fingerprint):
+    """
+    The stored response for a repeated key, a 422 when the key was used for
+    a different request, or None when the key is new
+    """
+    stored = get_cache().get(cache_key)
+    if stored is None:
+        return None
+    if stored['fingerprint'] != fingerprint:
+        return Response({'detail': 'Idempotency-Key was already used for a different request'}, status=422)
+    response = Response(stored['data'], status=stored['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def remember(cache_key, fingerprint, response):
+    if cache_key and response.status_code < 500:
+        timeout = getattr(settings, 'IDEMPOTENCY_KEY_TIMEOUT', 24 * 60 * 60)
+        get_cache().set(cache_key, {
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'data': dict(response.data),
+        }, timeout)
+    return response
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .performance import record_cache
+
+# Pillow save() format name per URL extension
+FORMATS = {
+    'webp': 'WEBP',
+    'avif': 'AVIF',
+}
+
+
+def get_banner_settings():
+    return {
+        'WIDTHS': [320, 640, 960, 1280],
+        'FORMATS': ['avif', 'webp'],
+        'QUALITY': {'webp': 80, 'avif': 55},
+        'CACHE_DIR': os.path.join(settings.MEDIA_ROOT, 'banner_cache'),
+        'MAX_CACHE_BYTES': 512 * 1024 ** 2,
+        'MAX_AGE': 365 * 24 * 60 * 60,
+        **getattr(settings, 'BANNER_VARIANTS', {}),
+    }
+
+
+def source_version(name):
+    """Short hash of the banner's storage name; uploads get new names"""
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:10]
+
+
+# ==================== DERIVATIVES ====================
+
+class UnreadableImage(Exception):
+    """The source is not an image Pillow can decode (or is truncated)"""
+
+
+def load_resized(source_path, width):
+    """The image at source_path, resized to width (never upscaled)"""
+    try:
+        with Image.open(source_path) as image:
+            # JPEG decoders can scale by 1/2..1/8 while decoding
+            image.draft('RGB', (width, width * image.height // max(image.width, 1)))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+            image.load()
+            return image
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError) as e:
+        raise UnreadableImage(str(e)) from e
+
+
+def render_variant(source_path, width, fmt, quality):
+    """Encode the image at source_path resized to width, or raise UnreadableImage"""
+    image = load_resized(source_path, width)
+    handle, temp_path = tempfile.mkstemp(dir=get_banner_settings()['CACHE_DIR'], suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            image.save(output, FORMATS[fmt], quality=quality)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+
+class DerivativeCache:
+    """
+    Directory of encoded banner variants, bounded to MAX_CACHE_BYTES by
+    evicting the least recently used files (mtime is refreshed on use)
+    """
+    touch_interval = 3600
+    lock_stripes = 64
+
+    def __init__(self):
+        self._locks = [threading.Lock() for _ in range(self.lock_stripes)]
+        self._written = 0
+
+    def _lock_for(self, key):
+        return self._locks[hash(key) % self.lock_stripes]
+
+    def get(self, source_path, source_name, width, fmt):
+        """Return the path of the variant, encoding it on first use"""
+        config = get_banner_settings()
+        stat = os.stat(source_path)
+        key = hashlib.sha1(f'{source_name}:{stat.st_size}:{stat.st_mtime_ns}'.encode('utf-8')).hexdigest()[:20]
+        path = os.path.join(config['CACHE_DIR'], f'{key}-{width}.{fmt}')
+
+        if self._touch(path):
+            record_cache(True)
+            return path
+        record_cache(False)
+
+        # One encode per variant per process; other processes may race, and
+        # the rename makes that harmless
+        with self._lock_for(path):
+            if self._touch(path):
+                return path
+            os.makedirs(config['CACHE_DIR'], exist_ok=True)
+            temp_path = render_variant(source_path, width, fmt, config['QUALITY'][fmt])
+            os.replace(temp_path, path)
+            self._written += os.path.getsize(path)
+
+        # Re-scan once a twentieth of the budget has been written
+        if self._written > config['MAX_CACHE_BYTES'] // 20:
+            self._written = 0
+            self.prune()
+        return path
+
+    def _touch(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        now = time.time()
+        if now - mtime > self.touch_interval:
+            os.utime(path, (now, now))
+        return True
+
+    def prune(self):
+        """Delete least recently used variants until the cache is under 90% of its budget"""
+        config = get_banner_settings()
+        entries = []
+        try:
+            with os.scandir(config['CACHE_DIR']) as scan:
+                for entry in scan:
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return 0
+
+        total = sum(size for _, size, _ in entries)
+        if total <= config['MAX_CACHE_BYTES']:
+            return 0
+
+        target = config['MAX_CACHE_BYTES'] * 9 // 10
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+derivative_cache = DerivativeCache()
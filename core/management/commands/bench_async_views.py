@@ -0,0 +1,203 @@
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.test import RequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from core.models import Category, Course, Enrollment, Lesson
+from users.authentication import add_token_claims
+from users.models import User
+
+PREFIX = 'bench-async'
+
+
+def add_latency(seconds):
+    """Delay every query by a network round trip, on every connection"""
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+    if connection.connection is not None:
+        connection.execute_wrappers.append(delay)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the sync views, run the way a threaded WSGI worker runs them, with '
+        'the async views (ASYNC_READ_VIEWS) on one ASGI event loop, at high concurrency. '
+        'Requests go through the full middleware stack in-process; --latency adds a '
+        'database round trip to every query. Rows are created up front and deleted '
+        'afterwards, since the worker threads need committed data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=200, help='Clients, each sending requests back to back')
+        parser.add_argument('--threads', type=int, default=8, help='Threads of the sync worker')
+        parser.add_argument('--latency', type=float, default=2.0, help='Milliseconds added to each query')
+        parser.add_argument('--courses', type=int, default=200)
+        parser.add_argument('--mode', choices=['sync', 'async'], help='Run one side only (used internally)')
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            return self.run_mode(options)
+
+        self.cleanup()
+        self.populate(options['courses'])
+        try:
+            for mode in ('sync', 'async'):
+                env = {**os.environ, 'ASYNC_READ_VIEWS': '1' if mode == 'async' else '0'}
+                arguments = [
+                    f"--{name}={options[name]}" for name in ('requests', 'concurrency', 'threads', 'latency', 'courses')
+                ]
+                # URLs are routed at import time, so each side gets its own process
+                result = subprocess.run(
+                    [sys.executable, '-m', 'django', 'bench_async_views', f'--mode={mode}', *arguments],
+                    env=env, capture_output=True, text=True,
+                )
+                if result.returncode:
+                    raise CommandError(result.stderr)
+                self.stdout.write(result.stdout.rstrip())
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        Category.objects.filter(title=PREFIX).delete()
+        User.objects.filter(username__startswith=PREFIX).delete()
+
+    def populate(self, size):
+        category = Category.objects.create(title=PREFIX)
+        teacher = User.objects.create(username=f'{PREFIX}-teacher', role='teacher')
+        student = User.objects.create(username=f'{PREFIX}-student', role='student')
+        courses = Course.objects.bulk_create([
+            Course(
+                title=f'Benchmark course {index}', description='Benchmark course',
+                banner='course_banners/download.jpeg', price=10, duration=5, is_active=True,
+                category=category, instructor=teacher,
+            )
+            for index in range(size)
+        ])
+        Lesson.objects.bulk_create([
+            Lesson(title=f'Lesson {index}', description='Lesson', course=course)
+            for course in courses for index in range(10)
+        ])
+        Enrollment.objects.bulk_create([Enrollment(student=student, course=course, price=10) for course in courses])
+
+    def run_mode(self, options):
+        if options['latency']:
+            add_latency(options['latency'] / 1000)
+
+        student = User.objects.get(username=f'{PREFIX}-student')
+        teacher = User.objects.get(username=f'{PREFIX}-teacher')
+        course_ids = list(Course.objects.filter(category__title=PREFIX).values_list('pk', flat=True))
+        tokens = {
+            'student': 'Bearer ' + str(add_token_claims(AccessToken.for_user(student), student)),
+            'teacher': 'Bearer ' + str(add_token_claims(AccessToken.for_user(teacher), teacher)),
+        }
+        # Authenticated requests, which the catalog cache does not serve
+        targets = []
+        for index in range(options['requests']):
+            course = course_ids[index % len(course_ids)]
+            targets.append([
+                ('/api/courses/', 'student'),
+                (f'/api/courses/{course}/', 'student'),
+                (f'/api/lessons/?course={course}', 'student'),
+                ('/api/enrollments/', 'student'),
+                (f'/api/enrollments/?course={course}', 'teacher'),
+            ][index % 5])
+
+        started = time.perf_counter()
+        if options['mode'] == 'sync':
+            latencies = self.run_sync(targets, tokens, options['concurrency'], options['threads'])
+            label = f"sync WSGI, {options['threads']} threads"
+        else:
+            latencies = asyncio.run(self.run_async(targets, tokens, options['concurrency']))
+            label = 'async ASGI'
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stdout.write(
+            f'{label:<30} {len(latencies) / elapsed:8.1f} req/s  '
+            f'median {statistics.median(latencies):8.2f} ms  '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1]:8.2f} ms  '
+            f'({options["concurrency"]} clients, {options["latency"]} ms/query, async views {settings.ASYNC_READ_VIEWS})'
+        )
+
+    def run_sync(self, targets, tokens, clients, threads):
+        # A threaded WSGI worker: requests beyond `threads` wait for a thread
+        application = get_wsgi_application()
+        factory = RequestFactory()
+        worker_threads = threading.Semaphore(threads)
+
+        def request(target):
+            url, role = target
+            path, _, query = url.partition('?')
+            environ = factory._base_environ(PATH_INFO=path, QUERY_STRING=query, HTTP_AUTHORIZATION=tokens[role])
+            status = []
+            started = time.perf_counter()
+            with worker_threads:
+                body = b''.join(application(environ, lambda code, headers: status.append(code)))
+            assert status[0].startswith('200'), (url, status[0], body[:200])
+            return (time.perf_counter() - started) * 1000
+
+        def client(share):
+            return [request(target) for target in share]
+
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            shares = pool.map(client, [targets[index::clients] for index in range(clients)])
+            return [latency for share in shares for latency in share]
+
+    async def run_async(self, targets, tokens, clients):
+        # An ASGI server's event loop, every client's request in flight
+        application = get_asgi_application()
+
+        async def request(target):
+            url, role = target
+            path, _, query = url.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                'query_string': query.encode(), 'root_path': '',
+                'headers': [(b'host', b'testserver'), (b'authorization', tokens[role].encode())],
+                'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            }
+            disconnect = asyncio.Event()
+            messages = []
+
+            async def receive():
+                if not messages:
+                    messages.append(None)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            elapsed = (time.perf_counter() - started) * 1000
+            disconnect.set()
+            status = messages[1]['status']
+            assert status == 200, (url, status)
+            return elapsed
+
+        async def client(share):
+            return [await request(target) for target in share]
+
+        shares = await asyncio.gather(*[client(targets[index::clients]) for index in range(clients)])
+        return [latency for share in shares for latency in share]
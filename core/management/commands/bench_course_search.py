@@ -0,0 +1,93 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Category, Course
+from core.search import IContainsSearchBackend, get_search_backend
+from users.models import User
+
+SYLLABLES = (
+    'ba be bi bo bu ca ce ci co cu da de di do du fa fe fi fo fu ga ge gi go gu '
+    'la le li lo lu ma me mi mo mu na ne ni no nu pa pe pi po pu ra re ri ro ru '
+    'sa se si so su ta te ti to tu va ve vi vo vu za ze zi zo zu'
+).split()
+
+
+def make_vocabulary(rng, size):
+    """Pseudo-words, so each term matches a realistic fraction of courses"""
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(vocabulary)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare course search latency of the icontains path with the full-text '
+        'index. Courses are generated inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--queries', type=int, default=30, help='Queries timed per size and backend')
+        parser.add_argument('--vocabulary', type=int, default=20000, help='Distinct words in generated text')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = make_vocabulary(rng, options['vocabulary'])
+        # Whole words and the partial words typed into a search box
+        terms = [rng.choice(vocabulary)[:rng.randint(4, 8)] for _ in range(options['queries'])]
+        fulltext = get_search_backend()
+        if isinstance(fulltext, IContainsSearchBackend):
+            self.stderr.write('No full-text index is available for this database; both runs use icontains')
+
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.populate(size, rng, vocabulary)
+                    fulltext.rebuild()
+                    for backend in (IContainsSearchBackend(), fulltext):
+                        self.report(size, backend, terms)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def populate(self, size, rng, vocabulary):
+        category = Category.objects.create(title='Benchmark')
+        instructor = User.objects.create(username=f'bench-instructor-{time.time_ns()}', role='teacher')
+        batch = []
+        for index in range(size):
+            batch.append(Course(
+                title=' '.join(rng.choices(vocabulary, k=4)),
+                description=' '.join(rng.choices(vocabulary, k=120)),
+                banner='course_banners/download.jpeg',
+                price=0, duration=1, is_active=True,
+                category=category, instructor=instructor,
+            ))
+            if len(batch) == 5000:
+                Course.objects.bulk_create(batch)
+                batch = []
+        Course.objects.bulk_create(batch)
+
+    def report(self, size, backend, terms):
+        timings = []
+        for term in terms:
+            started = time.perf_counter()
+            # Same work as a course_list_create search page: count + first page
+            queryset = backend.search(Course.objects.all(), term)
+            queryset.count()
+            list(queryset[:10])
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f'{size:>8} courses  {backend.__class__.__name__:<26} '
+            f'median {statistics.median(timings):8.2f} ms  '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:8.2f} ms'
+        )
@@ -0,0 +1,123 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from importlib.util import find_spec
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import RequestFactory
+from users.models import User
+
+PREFIX = 'bench-register'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure POST /api/user/auth/ throughput during a registration burst, per '
+        'password hasher, with and without the bounded hashing pool, while readers '
+        'fetch the course catalog. Requests go through the full WSGI stack in-process, '
+        'with --threads worker threads; the users created are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per run')
+        parser.add_argument('--registrations', type=int, default=16, help='Clients registering back to back')
+        parser.add_argument('--readers', type=int, default=4, help='Clients reading the catalog back to back')
+        parser.add_argument('--threads', type=int, default=8, help='Threads of the WSGI worker')
+        parser.add_argument(
+            '--hashers', nargs='+', choices=['pbkdf2', 'scrypt', 'argon2'],
+            default=['pbkdf2', 'scrypt'] + (['argon2'] if find_spec('argon2') else []),
+        )
+        parser.add_argument('--mode', help='Run one hasher/pool combination (used internally)')
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            return self.run_mode(options)
+
+        try:
+            for hasher in options['hashers']:
+                for pool in ('0', '1'):
+                    # Hashers are picked when settings load, so each run
+                    # gets its own process
+                    env = {**os.environ, 'PASSWORD_HASHER': hasher, 'PASSWORD_HASH_POOL': pool}
+                    arguments = [
+                        f"--{name}={options[name]}" for name in ('duration', 'registrations', 'readers', 'threads')
+                    ]
+                    result = subprocess.run(
+                        [sys.executable, '-m', 'django', 'bench_registration', f'--mode={hasher}-{pool}', *arguments],
+                        env=env, capture_output=True, text=True,
+                    )
+                    if result.returncode:
+                        raise CommandError(result.stderr)
+                    self.stdout.write(result.stdout.rstrip())
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+    def run_mode(self, options):
+        application = get_wsgi_application()
+        factory = RequestFactory()
+        worker_threads = threading.Semaphore(options['threads'])
+        stop = threading.Event()
+        lock = threading.Lock()
+        statuses = {}
+        read_latencies = []
+
+        def request(environ):
+            response = []
+            with worker_threads:
+                b''.join(application(environ, lambda code, headers: response.append((code, dict(headers)))))
+            code, headers = response[0]
+            return int(code.split()[0]), headers
+
+        def register(client):
+            count = 0
+            while not stop.is_set():
+                count += 1
+                body = json.dumps({
+                    'username': f'{PREFIX}-{options["mode"]}-{client}-{count}',
+                    'password': 'correct horse battery staple', 'role': 'student',
+                })
+                environ = factory.post('/api/user/auth/', body, content_type='application/json').environ
+                code, headers = request(environ)
+                with lock:
+                    statuses[code] = statuses.get(code, 0) + 1
+                if code == 503:
+                    # Clients back off as told
+                    stop.wait(int(headers.get('Retry-After', 1)))
+
+        def read():
+            while not stop.is_set():
+                started = time.perf_counter()
+                code, _ = request(factory.get('/api/courses/').environ)
+                assert code == 200, code
+                with lock:
+                    read_latencies.append((time.perf_counter() - started) * 1000)
+
+        threads = [threading.Thread(target=register, args=(client,)) for client in range(options['registrations'])]
+        threads += [threading.Thread(target=read) for _ in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        # Including the requests still in flight when told to stop
+        duration = time.perf_counter() - started
+        read_latencies.sort()
+        p95 = read_latencies[max(int(len(read_latencies) * 0.95) - 1, 0)] if read_latencies else 0
+        pool = 'pool' if settings.PASSWORD_HASH_POOL else 'inline'
+        self.stdout.write(
+            f'{settings.PASSWORD_HASHER:<7} {pool:<7} '
+            f'{statuses.get(201, 0) / duration:7.1f} registrations/s  '
+            f'{statuses.get(503, 0) / duration:7.1f} turned away/s  '
+            f'catalog {len(read_latencies) / duration:7.1f} reads/s  '
+            f'median {statistics.median(read_latencies) if read_latencies else 0:8.2f} ms  p95 {p95:8.2f} ms'
+        )
+        unexpected = {code: count for code, count in statuses.items() if code not in (201, 503)}
+        if unexpected:
+            self.stdout.write(f'    unexpected statuses {unexpected}')
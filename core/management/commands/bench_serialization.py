@@ -0,0 +1,103 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from core.fastpath import ValuesRowBuilder
+from core.models import Category, Course, Enrollment
+from core.querysets import optimize_queryset
+from core.renderers import ORJSONRenderer, orjson
+from core.serializers import CourseSummarySerializer, EnrollmentSummarySerializer
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare serializing and rendering the course_list_create and enrollment_list '
+        'pages with DRF and the stdlib json module, DRF and orjson, and the .values() '
+        'fast path and orjson. Rows are generated inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000], help='Rows per page')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per page size and path')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed; the orjson runs use the stdlib renderer')
+
+        largest = max(options['rows'])
+        try:
+            with transaction.atomic():
+                self.populate(largest)
+                request = Request(APIRequestFactory().get('/api/'))
+                payloads = (
+                    ('course_list', Course.objects.order_by('-created_at', '-id'), CourseSummarySerializer),
+                    ('enrollment_list', Enrollment.objects.order_by('-created_at', '-id'), EnrollmentSummarySerializer),
+                )
+                for name, queryset, serializer_class in payloads:
+                    for rows in options['rows']:
+                        self.report(name, rows, queryset, serializer_class, request, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, size):
+        category = Category.objects.create(title='Benchmark')
+        instructor = User.objects.create(username=f'bench-instructor-{time.time_ns()}', role='teacher')
+        courses = Course.objects.bulk_create([
+            Course(
+                title=f'Benchmark course {index}', description='Benchmark course description ' * 20,
+                banner='course_banners/download.jpeg', price=10, duration=5, is_active=True,
+                category=category, instructor=instructor,
+            )
+            for index in range(size)
+        ], batch_size=5000)
+        students = User.objects.bulk_create([
+            User(username=f'bench-student-{time.time_ns()}-{index}', role='student')
+            for index in range(size)
+        ], batch_size=5000)
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, course=course, price=10)
+            for student, course in zip(students, courses)
+        ], batch_size=5000)
+
+    def report(self, name, rows, queryset, serializer_class, request, repeat):
+        context = {'request': request}
+
+        def drf(renderer):
+            def run():
+                page = optimize_queryset(queryset, serializer_class, context=context)[:rows]
+                return renderer.render(serializer_class(page, many=True, context=context).data)
+            return run
+
+        def fastpath():
+            builder = ValuesRowBuilder(serializer_class(context=context))
+            return ORJSONRenderer().render(builder.build(builder.values(queryset)[:rows]))
+
+        paths = (
+            ('DRF + json', drf(JSONRenderer())),
+            ('DRF + orjson', drf(ORJSONRenderer())),
+            ('values + orjson', fastpath),
+        )
+        baseline = None
+        for label, run in paths:
+            body = run()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+
+            median = statistics.median(timings)
+            baseline = baseline or median
+            self.stdout.write(
+                f'{name:<16} {rows:>6} rows  {label:<16} '
+                f'median {median:8.2f} ms  {baseline / median:5.1f}x  {len(body):>9} bytes'
+            )
@@ -0,0 +1,24 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = 'Delete pending upload sessions, and their part files, that have not received a chunk recently'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Idle time after which a session is stale')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(
+            status='pending', updated_at__lt=cutoff
+        ).exclude(chunks__created_at__gte=cutoff)
+
+        count = 0
+        for session in stale.iterator():
+            # The post_delete signal removes the part file
+            session.delete()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Removed {count} stale uploads'))
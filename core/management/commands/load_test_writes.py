@@ -0,0 +1,109 @@
+import statistics
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from core.models import Category, Course, Enrollment
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure write throughput with concurrent writers enrolling new students in '
+        'one course (the counter row every enrollment updates) while readers page '
+        'through enrollments. Runs against the configured database and deletes the '
+        'rows it created afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per writer count')
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        self.stdout.write(
+            f"{connection.vendor} {settings_dict['NAME']}  "
+            f"options {settings_dict.get('OPTIONS', {})}"
+        )
+
+        prefix = f'load-{time.time_ns()}'
+        category = Category.objects.create(title='Load test')
+        instructor = User.objects.create(username=f'{prefix}-instructor', role='teacher')
+        course = Course.objects.create(
+            title='Load test', description='Load test', banner='course_banners/download.jpeg',
+            price=10, duration=5, is_active=True, category=category, instructor=instructor,
+        )
+        try:
+            for writers in options['writers']:
+                self.run(course, prefix, writers, options['readers'], options['duration'])
+        finally:
+            Enrollment.objects.filter(course=course).delete()
+            course.delete()
+            category.delete()
+            User.objects.filter(username__startswith=prefix).delete()
+
+    def run(self, course, prefix, writers, readers, duration):
+        stop = threading.Event()
+        lock = threading.Lock()
+        latencies = []
+        errors = []
+        reads = [0]
+
+        def write(worker):
+            count = 0
+            while not stop.is_set():
+                count += 1
+                started = time.perf_counter()
+                try:
+                    # Read, then write, like the API's write paths: the
+                    # transaction starts out holding only a read lock
+                    with transaction.atomic():
+                        price = Course.objects.values_list('price', flat=True).get(pk=course.pk)
+                        student = User.objects.create(
+                            username=f'{prefix}-{writers}-{worker}-{count}', role='student'
+                        )
+                        Enrollment.objects.create(student=student, course=course, price=price)
+                except OperationalError as error:
+                    with lock:
+                        errors.append(str(error))
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        def read():
+            while not stop.is_set():
+                try:
+                    list(Enrollment.objects.filter(course=course).order_by('-created_at', '-id')[:20])
+                except OperationalError as error:
+                    with lock:
+                        errors.append(str(error))
+                    continue
+                with lock:
+                    reads[0] += 1
+
+        def thread_main(target, *args):
+            try:
+                target(*args)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=thread_main, args=(write, worker)) for worker in range(writers)]
+        threads += [threading.Thread(target=thread_main, args=(read,)) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)] if latencies else 0
+        self.stdout.write(
+            f'{writers:>3} writers  {len(latencies) / duration:8.1f} writes/s  '
+            f'{reads[0] / duration:8.1f} reads/s  '
+            f'median {statistics.median(latencies) if latencies else 0:7.2f} ms  p95 {p95:7.2f} ms  '
+            f'{len(errors)} errors'
+        )
+        for message in sorted(set(errors))[:3]:
+            self.stdout.write(f'    {message}')
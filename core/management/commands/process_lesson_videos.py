@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from core.models import Lesson
+from core.video import process_lesson
+
+
+class Command(BaseCommand):
+    help = 'Encode lesson videos into HLS renditions and thumbnails in this process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('lesson_ids', nargs='*', type=int)
+        parser.add_argument(
+            '--status', action='append', choices=['', 'pending', 'failed', 'ready'],
+            help='Process lessons in these states (default: pending and failed)'
+        )
+
+    def handle(self, *args, **options):
+        lessons = Lesson.objects.exclude(video='')
+        if options['lesson_ids']:
+            lessons = lessons.filter(pk__in=options['lesson_ids'])
+        else:
+            # Also picks up jobs lost when a server restarted with a queue
+            lessons = lessons.filter(processing_status__in=options['status'] or ['pending', 'failed'])
+
+        for lesson in lessons.order_by('pk').iterator():
+            self.stdout.write(f'Processing lesson {lesson.pk}: {lesson.video.name}')
+            process_lesson(lesson)
+            lesson.refresh_from_db(fields=['processing_status', 'processing_error'])
+            if lesson.processing_status == 'ready':
+                self.stdout.write(self.style.SUCCESS('  ready'))
+            else:
+                self.stdout.write(self.style.ERROR(f'  {lesson.processing_status}: {lesson.processing_error}'))
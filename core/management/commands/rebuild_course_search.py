@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Course
+from core.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the course full-text search index from the course table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(using=options['database'])
+        with transaction.atomic(using=options['database']):
+            backend.rebuild()
+
+        count = Course.objects.using(options['database']).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} courses with {backend.__class__.__name__}'
+        ))
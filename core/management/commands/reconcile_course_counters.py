@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from core.counters import COUNTER_FIELDS, recount, with_actual_counts
+from core.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Recount active enrollments, lessons, materials and questions per course and repair drifted counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        courses = with_actual_counts(Course.objects.only('pk', *COUNTER_FIELDS)).order_by('pk')
+        drifted = []
+
+        for course in courses.iterator(chunk_size=options['batch_size']):
+            changes = {
+                field: (getattr(course, field), getattr(course, f'actual_{field}'))
+                for field in COUNTER_FIELDS
+                if getattr(course, field) != getattr(course, f'actual_{field}')
+            }
+            if not changes:
+                continue
+
+            self.stdout.write(f'Course {course.pk}: ' + ', '.join(
+                f'{field} {stored} -> {actual}' for field, (stored, actual) in changes.items()
+            ))
+            drifted.append(course.pk)
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted)} courses have drifted counters')
+            return
+
+        # Recounted again as they are written, so updates made since the
+        # scan are not lost
+        for start in range(0, len(drifted), options['batch_size']):
+            recount(drifted[start:start + options['batch_size']])
+        self.stdout.write(self.style.SUCCESS(f'Repaired counters on {len(drifted)} courses'))
@@ -0,0 +1,188 @@
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, parse_etags
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Types the platform mimetypes tables get wrong or lack
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+}
+
+
+def get_delivery_settings():
+    return {
+        'OFFLOAD': None,
+        'ACCEL_REDIRECT_PREFIX': '/protected-media/',
+        'CHUNK_SIZE': 256 * 1024,
+        'MAX_AGE': 3600,
+        **getattr(settings, 'MEDIA_DELIVERY', {}),
+    }
+
+
+def file_etag(name, stat):
+    """Strong ETag: changes whenever the stored file is replaced or rewritten"""
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}-{digest}"'
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) byte positions (inclusive) requested by a
+    single-range Range header, None when the header should be ignored
+    (absent, malformed or multi-range), or 'unsatisfiable'
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """If-Range only allows a partial response when the validator still matches"""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        # Weak validators never match for ranges
+        return etag in parse_etags(value) and not value.startswith('W/')
+    return parse_http_date_safe(value) == last_modified
+
+
+class RangeFileIterator:
+    """Stream length bytes of a file from offset in fixed-size chunks"""
+
+    def __init__(self, file, offset, length, chunk_size):
+        self.file = file
+        self.offset = offset
+        self.remaining = length
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        try:
+            self.file.seek(self.offset)
+            while self.remaining > 0:
+                chunk = self.file.read(min(self.chunk_size, self.remaining))
+                if not chunk:
+                    break
+                self.remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.file.close()
+
+
+def serve_file(request, field_file):
+    """
+    Deliver a stored FileField file with validators, Range / If-Range
+    support and optional X-Accel-Redirect / X-Sendfile offloading. Access
+    must already have been checked by the caller.
+    """
+    return serve_path(request, field_file.path, field_file.name)
+
+
+def resolve_within(directory, relative):
+    """Join relative onto directory, or None if it would escape it"""
+    base = os.path.realpath(directory)
+    target = os.path.realpath(os.path.join(base, relative))
+    if not target.startswith(base + os.sep):
+        return None
+    return target
+
+
+def serve_path(request, path, name, cache_control=None):
+    """serve_file for a file under MEDIA_ROOT given its path and storage name"""
+    config = get_delivery_settings()
+    cache_control = cache_control or f"private, max-age={config['MAX_AGE']}"
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = file_etag(name, stat)
+    content_type = (
+        CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+        or mimetypes.guess_type(path)[0]
+        or 'application/octet-stream'
+    )
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = cache_control
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    offload = config['OFFLOAD']
+    if offload:
+        # The fronting proxy streams the file and answers Range itself
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = config['ACCEL_REDIRECT_PREFIX'] + quote(name)
+        else:
+            response['X-Sendfile'] = path
+        return finish(response)
+
+    byte_range = None
+    if if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+
+    file = open(path, 'rb')
+
+    if byte_range is None:
+        # FileResponse hands the file to wsgi.file_wrapper, which lets the
+        # server use sendfile()
+        response = FileResponse(file, content_type=content_type)
+        response.block_size = config['CHUNK_SIZE']
+        return finish(response)
+
+    start, end = byte_range
+    length = end - start + 1
+    if end == size - 1:
+        # Open-ended ranges (what players send when seeking) can still go
+        # through the file wrapper from the seek position
+        file.seek(start)
+        response = FileResponse(file, status=206, content_type=content_type)
+        response.block_size = config['CHUNK_SIZE']
+    else:
+        response = StreamingHttpResponse(
+            RangeFileIterator(file, start, length, config['CHUNK_SIZE']),
+            status=206,
+            content_type=content_type,
+        )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return finish(response)
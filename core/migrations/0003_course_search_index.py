@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db import migrations, OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE core_course_fts USING fts5(title, description, tokenize='unicode61')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5; search falls back to icontains
+            return
+        schema_editor.execute(
+            'INSERT INTO core_course_fts (rowid, title, description) '
+            'SELECT id, title, description FROM core_course'
+        )
+
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE core_course_search ('
+            'course_id bigint PRIMARY KEY REFERENCES core_course (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX core_course_search_document_idx ON core_course_search USING GIN (document)'
+        )
+        config = getattr(settings, 'COURSE_SEARCH_CONFIG', 'english')
+        schema_editor.execute(
+            'INSERT INTO core_course_search (course_id, document) '
+            "SELECT id, setweight(to_tsvector(%s::regconfig, title), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, description), 'B') FROM core_course",
+            [config, config]
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS core_course_fts')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS core_course_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:14
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Course = apps.get_model('core', 'Course')
+    counted = {
+        'enrollment_count': (apps.get_model('core', 'Enrollment'), 'course'),
+        'lesson_count': (apps.get_model('core', 'Lesson'), 'course'),
+        'material_count': (apps.get_model('core', 'Material'), 'course'),
+        'question_count': (apps.get_model('core', 'QuestionAnswer'), 'lesson__course'),
+    }
+    Course.objects.using(schema_editor.connection.alias).update(**{
+        field: Coalesce(Subquery(
+            model.objects
+            .filter(**{path: OuterRef('pk')}, is_active=True)
+            .order_by()
+            .values(path)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ), 0)
+        for field, (model, path) in counted.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_course_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='enrollment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='material_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='processing_error',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='processing_status',
+            field=models.CharField(blank=True, choices=[('', 'Not processed'), ('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='stream_manifest',
+            field=models.FileField(blank=True, editable=False, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:25
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_enrollments(apps, schema_editor):
+    """
+    Keep one enrollment per (student, course), preferring an active one and
+    then the oldest, and recount enrollment_count on the affected courses
+    """
+    alias = schema_editor.connection.alias
+    Enrollment = apps.get_model('core', 'Enrollment')
+    Course = apps.get_model('core', 'Course')
+
+    duplicated = (
+        Enrollment.objects.using(alias)
+        .values('student_id', 'course_id')
+        .annotate(total=Count('pk'))
+        .filter(total__gt=1)
+    )
+    course_ids = set()
+    for pair in duplicated:
+        ids = list(
+            Enrollment.objects.using(alias)
+            .filter(student_id=pair['student_id'], course_id=pair['course_id'])
+            .order_by('-is_active', 'created_at', 'pk')
+            .values_list('pk', flat=True)
+        )
+        Enrollment.objects.using(alias).filter(pk__in=ids[1:]).delete()
+        course_ids.add(pair['course_id'])
+
+    if course_ids:
+        Course.objects.using(alias).filter(pk__in=course_ids).update(enrollment_count=Coalesce(Subquery(
+            Enrollment.objects.using(alias)
+            .filter(course=OuterRef('pk'), is_active=True)
+            .order_by()
+            .values('course')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_lesson_video_processing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_enrollments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('student', 'course'), name='enrollment_student_course_unique'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_enrollment_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['instructor', 'created_at', 'id'], name='course_instructor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'created_at', 'id'], name='lesson_course_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadsession',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['updated_at'], name='upload_pending_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseFTSEntry',
+            fields=[
+                ('course', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='fts_entry', serialize=False, to='core.course')),
+                ('document', models.TextField(db_column='core_course_fts')),
+            ],
+            options={
+                'db_table': 'core_course_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseSearchDocument',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='core.course')),
+                ('document', models.TextField()),
+            ],
+            options={
+                'db_table': 'core_course_search',
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,7 +1,24 @@
-from django.db import models
+import uuid
+from django.db import models, router, transaction
 from users.models import User
 # Create your models here.
 
+
+class CourseCountedModel(models.Model):
+    """
+    Rows counted on their course (Course.*_count). Saves run in a
+    transaction, so the counter update made by the post_save receiver
+    commits or rolls back together with the row; deletes already do.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
 class Category(models.Model):
     title = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
@@ -20,29 +37,62 @@ class Course(models.Model):
     is_active = models.BooleanField()
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     instructor = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role' : 'teacher'})
+    # Active related rows, maintained by core.counters
+    enrollment_count = models.PositiveIntegerField(default=0, editable=False)
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
+    material_count = models.PositiveIntegerField(default=0, editable=False)
+    question_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Back keyset pagination on (created_at, id), globally, per category
+        # and for a teacher's own courses
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='course_created_id_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='course_category_created_idx'),
+            models.Index(fields=['instructor', 'created_at', 'id'], name='course_instructor_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
-class Lesson(models.Model):
+class Lesson(CourseCountedModel):
+    PROCESSING_CHOICES = (
+        ('', 'Not processed'),
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
     title = models.CharField(max_length=255)
     description = models.TextField()
-    video = models.FileField(upload_to='lesson_videoes')
+    # Blank until a direct or chunked upload (UploadSession) attaches one
+    video = models.FileField(upload_to='lesson_videoes', blank=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
+    # Written by core.video: HLS ladder and poster frame of the current video
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_CHOICES, blank=True, default='', editable=False)
+    processing_error = models.TextField(blank=True, default='', editable=False)
+    stream_manifest = models.FileField(blank=True, editable=False)
+    thumbnail = models.ImageField(blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # A course's lessons in curriculum order
+        indexes = [
+            models.Index(fields=['course', 'created_at', 'id'], name='lesson_course_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
-class Material(models.Model):
+class Material(CourseCountedModel):
     title = models.CharField(max_length=255)
     description = models.TextField()
     file_type= models.CharField(max_length=100)
-    file = models.FileField(upload_to='materials/')
+    file = models.FileField(upload_to='materials/', blank=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -51,7 +101,7 @@ class Material(models.Model):
     def __str__(self):
         return self.title
 
-class Enrollment(models.Model):
+class Enrollment(CourseCountedModel):
     student = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role' : 'student'})
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
@@ -63,10 +113,20 @@ class Enrollment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'created_at', 'id'], name='enrollment_course_created_idx'),
+            models.Index(fields=['student', 'created_at', 'id'], name='enrollment_student_created_idx'),
+        ]
+        # The unique index also serves the access check on (student, course)
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='enrollment_student_course_unique'),
+        ]
+
     def __str__(self):
         return f"{self.student.username} - {self.course.title}"
 
-class QuestionAnswer(models.Model):
+class QuestionAnswer(CourseCountedModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
     description = models.TextField()
@@ -74,6 +134,88 @@ class QuestionAnswer(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['lesson', 'created_at', 'id'], name='question_lesson_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} --> {self.lesson.title} --> {self.description}"
-    
\ No newline at end of file
+    
+class UploadSession(models.Model):
+    """
+    Resumable upload of a lesson video or material file. Chunks are written
+    at their offsets into a preallocated part file and recorded as
+    UploadChunk rows; completing the session moves the part file into
+    storage and attaches it to the lesson or material.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('complete', 'Complete'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, null=True, blank=True)
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Stale pending sessions for clear_stale_uploads; completed ones,
+        # the bulk of the table, are left out
+        indexes = [
+            models.Index(
+                fields=['updated_at'], condition=models.Q(status='pending'), name='upload_pending_updated_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} --> {self.filename} ({self.status})"
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    offset = models.PositiveBigIntegerField()
+    length = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'offset'], name='upload_chunk_offset_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} [{self.offset}:{self.offset + self.length}]"
+
+# The full-text index tables of migration 0003, mapped (unmanaged) so
+# searches can join them to the course table; core/search.py fills them
+
+class CourseFTSEntry(models.Model):
+    """
+    A course's row in the SQLite FTS5 table. `document` is the hidden
+    column named after the table, which MATCH and bm25() take to mean
+    every column.
+    """
+    course = models.OneToOneField(
+        Course, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='fts_entry'
+    )
+    document = models.TextField(db_column='core_course_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'core_course_fts'
+
+class CourseSearchDocument(models.Model):
+    """A course's weighted tsvector in the PostgreSQL search table"""
+    course = models.OneToOneField(
+        Course, on_delete=models.DO_NOTHING, primary_key=True, related_name='search_document'
+    )
+    document = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'core_course_search'
@@ -0,0 +1,295 @@
+import bisect
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('core.performance')
+
+DEFAULT_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Metrics of the request being handled; None outside requests. Worker
+# threads started through sync_to_async (run_query) inherit it.
+_current = contextvars.ContextVar('request_metrics', default=None)
+# Section being timed, so nested serializers are only counted once
+_section = contextvars.ContextVar('timed_section', default=None)
+
+
+def get_config():
+    return getattr(settings, 'PERFORMANCE_METRICS', {})
+
+
+class RequestMetrics:
+    """What one request spent on queries, serialization, rendering and caches"""
+
+    def __init__(self, max_queries):
+        self.started = time.perf_counter()
+        self.max_queries = max_queries
+        self.query_count = 0
+        self.query_time = 0.0
+        self.queries = []
+        self.timings = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Gathered run_query calls add to it from several threads
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, seconds):
+        with self._lock:
+            self.query_count += 1
+            self.query_time += seconds
+            if len(self.queries) < self.max_queries:
+                self.queries.append((sql, seconds))
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def add_cache(self, hit):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def server_timing(self, total):
+        """Server-Timing header value, durations in milliseconds"""
+        parts = [
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.query_count} queries"',
+        ]
+        parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in sorted(self.timings.items())]
+        if self.cache_hits or self.cache_misses:
+            parts.append(f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"')
+        return ', '.join(parts)
+
+
+@contextmanager
+def measure(name):
+    """Add the time spent in the block to the current request's `name` timing"""
+    metrics = _current.get()
+    if metrics is None or _section.get() is not None:
+        yield
+        return
+    token = _section.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - started)
+        _section.reset(token)
+
+
+def record_cache(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_cache(hit)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def instrument(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    instrument(connection)
+
+
+# New connections of any thread, including run_query's workers
+connection_created.connect(instrument_connection, dispatch_uid='performance-instrument')
+
+# ==================== AGGREGATES ====================
+
+class RouteStats:
+    __slots__ = (
+        'count', 'errors', 'total_ms', 'max_ms', 'histogram', 'queries', 'query_ms',
+        'timings', 'bytes', 'cache_hits', 'cache_misses',
+    )
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        # One count per bucket bound, and one past the last
+        self.histogram = [0] * (len(buckets) + 1)
+        self.queries = 0
+        self.query_ms = 0.0
+        self.timings = {}
+        self.bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class MetricsRegistry:
+    """Per-route aggregates of this process, keyed by URL name"""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def buckets(self):
+        return get_config().get('BUCKETS', DEFAULT_BUCKETS)
+
+    def record(self, route, status_code, milliseconds, size, metrics):
+        buckets = self.buckets
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats(buckets)
+            stats.count += 1
+            if status_code >= 500:
+                stats.errors += 1
+            stats.total_ms += milliseconds
+            stats.max_ms = max(stats.max_ms, milliseconds)
+            stats.histogram[bisect.bisect_left(buckets, milliseconds)] += 1
+            stats.queries += metrics.query_count
+            stats.query_ms += metrics.query_time * 1000
+            for name, seconds in metrics.timings.items():
+                stats.timings[name] = stats.timings.get(name, 0.0) + seconds * 1000
+            stats.bytes += size or 0
+            stats.cache_hits += metrics.cache_hits
+            stats.cache_misses += metrics.cache_misses
+
+    def snapshot(self):
+        buckets = self.buckets
+        labels = [f'le_{bound}' for bound in buckets] + ['le_inf']
+        with self._lock:
+            routes = {}
+            for route, stats in sorted(self._routes.items()):
+                # Cumulative, like Prometheus histograms
+                cumulative, running = {}, 0
+                for label, count in zip(labels, stats.histogram):
+                    running += count
+                    cumulative[label] = running
+                routes[route] = {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'mean_ms': round(stats.total_ms / stats.count, 2),
+                    'max_ms': round(stats.max_ms, 2),
+                    'histogram_ms': cumulative,
+                    'queries_per_request': round(stats.queries / stats.count, 2),
+                    'query_ms_per_request': round(stats.query_ms / stats.count, 2),
+                    'timings_ms_per_request': {
+                        name: round(total / stats.count, 2) for name, total in sorted(stats.timings.items())
+                    },
+                    'bytes_per_request': round(stats.bytes / stats.count),
+                    'cache_hits': stats.cache_hits,
+                    'cache_misses': stats.cache_misses,
+                }
+        return routes
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+registry = MetricsRegistry()
+
+# ==================== MIDDLEWARE ====================
+
+class PerformanceMiddleware:
+    """
+    Measures every request: wall time, queries (count, time and the SQL),
+    serialization and rendering time, response size and cache hits and
+    misses. Sends them as a Server-Timing header, adds them to the per-route
+    aggregates served by the metrics endpoint, and logs a sample of requests
+    slower than SLOW_REQUEST_MS with their queries. The header only goes to
+    admins unless SERVER_TIMING or DEBUG is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not get_config().get('ENABLED', True):
+            return self.get_response(request)
+        metrics = self.start()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not get_config().get('ENABLED', True):
+            return await self.get_response(request)
+        metrics = self.start()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def start(self):
+        # Connections opened before this thread's first request
+        for connection in connections.all(initialized_only=True):
+            instrument(connection)
+        return RequestMetrics(get_config().get('MAX_QUERIES', 100))
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.started
+        milliseconds = total * 1000
+        if response.streaming:
+            size = int(response.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+
+        match = request.resolver_match
+        route = (match.view_name if match else None) or 'unresolved'
+        registry.record(route, response.status_code, milliseconds, size, metrics)
+
+        config = get_config()
+        if self.show_timing(request, config):
+            response['Server-Timing'] = metrics.server_timing(total)
+        if milliseconds >= config.get('SLOW_REQUEST_MS', 500) and random.random() < config.get('SLOW_SAMPLE_RATE', 1.0):
+            self.log_slow(request, route, response, milliseconds, size, metrics)
+        return response
+
+    def show_timing(self, request, config):
+        if config.get('SERVER_TIMING', False) or settings.DEBUG:
+            return True
+        # DRF sets the authenticated user on the Django request too
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_authenticated and user.role == 'admin')
+
+    def log_slow(self, request, route, response, milliseconds, size, metrics):
+        lines = [
+            f'{query_seconds * 1000:8.2f} ms  {sql}' for sql, query_seconds in metrics.queries
+        ]
+        if metrics.query_count > len(metrics.queries):
+            lines.append(f'... {metrics.query_count - len(metrics.queries)} more')
+        logger.warning(
+            'Slow request %s %s (%s): %d in %.1f ms, %d bytes, %d queries in %.1f ms, %s\n%s',
+            request.method, request.get_full_path(), route, response.status_code, milliseconds, size,
+            metrics.query_count, metrics.query_time * 1000,
+            ', '.join(f'{name} {seconds * 1000:.1f} ms' for name, seconds in sorted(metrics.timings.items())) or '-',
+            '\n'.join(lines),
+        )
@@ -0,0 +1,46 @@
+from rest_framework import serializers
+
+
+def get_related_paths(serializer, prefix=''):
+    """
+    Walk the declared fields of a serializer and return the
+    (select_related, prefetch_related) lookups its nested serializers need
+    """
+    select_related = []
+    prefetch_related = []
+
+    for field in serializer.fields.values():
+        if field.source == '*' or not isinstance(field, serializers.BaseSerializer):
+            continue
+
+        path = prefix + '__'.join(field.source_attrs)
+
+        if isinstance(field, serializers.ListSerializer):
+            # To-many relations can't be joined, so the relation and
+            # everything nested below it is prefetched
+            prefetch_related.append(path)
+            nested_select, nested_prefetch = get_related_paths(field.child, prefix=path + '__')
+            prefetch_related.extend(nested_select + nested_prefetch)
+        else:
+            select_related.append(path)
+            nested_select, nested_prefetch = get_related_paths(field, prefix=path + '__')
+            select_related.extend(nested_select)
+            prefetch_related.extend(nested_prefetch)
+
+    return select_related, prefetch_related
+
+
+def optimize_queryset(queryset, serializer_class, context=None):
+    """
+    Apply the select_related/prefetch_related chain required by the nested
+    fields of serializer_class, so serializing the queryset costs a fixed
+    number of queries regardless of the row count
+    """
+    serializer = serializer_class(context=context or {})
+    select_related, prefetch_related = get_related_paths(serializer)
+
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
@@ -0,0 +1,67 @@
+import math
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+from .performance import measure
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed. Types orjson
+    does not know (Decimal, lazy strings, ...) and datetimes, which DRF
+    renders with millisecond precision and a Z suffix, go through DRF's
+    encoder; indented output for the browsable API, settings orjson cannot
+    honour (UNICODE_JSON or COMPACT_JSON off) and missing orjson fall back
+    to the stdlib renderer. orjson writes NaN and infinity as null, so data
+    holding them is rendered by the stdlib renderer too, which raises under
+    STRICT_JSON as DRF does.
+    """
+    encoder = encoders.JSONEncoder()
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with measure('render'):
+            if orjson is None or data is None or self.ensure_ascii or not self.compact:
+                return super().render(data, accepted_media_type, renderer_context)
+            if self.get_indent(accepted_media_type, renderer_context or {}):
+                return super().render(data, accepted_media_type, renderer_context)
+            if has_non_finite(data):
+                return super().render(data, accepted_media_type, renderer_context)
+            ret = orjson.dumps(data, default=self.encoder.default, option=self.options)
+            # Escaped like JSONRenderer, so the output is a JavaScript subset
+            if b'\xe2\x80' in ret:
+                ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+            return ret
+
+
+def has_non_finite(value):
+    """Whether NaN or infinity is anywhere in the lists and dicts of value"""
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return isinstance(value, float) and not math.isfinite(value)
+    for item in value:
+        if isinstance(item, float):
+            if not math.isfinite(item):
+                return True
+        elif isinstance(item, (dict, list, tuple)) and has_non_finite(item):
+            return True
+    return False
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser decoding with orjson when it is installed"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % exc)
@@ -0,0 +1,182 @@
+import contextvars
+import hashlib
+import random
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin'
+# Sent on responses to writes, for clients without cookies to echo back
+PIN_HEADER = 'DB-Pin'
+
+# Routing state of the request being handled; None outside requests
+# (management commands, shells, workers), which always use the primary
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def make_pin():
+    return signing.TimestampSigner(salt='core.replicas.pin').sign('1')
+
+
+def valid_pin(value):
+    """Whether value is a pin handed out in the last REPLICA_PIN_SECONDS"""
+    try:
+        signing.TimestampSigner(salt='core.replicas.pin').unsign(value, max_age=get_pin_seconds())
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class ReplicaRouter:
+    """
+    Sends reads of replica-eligible requests to the replica that request
+    was given, and everything else to the primary: writes, reads once the
+    request has written or while a transaction is open on the primary, and
+    any query outside a request
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets safe API requests read from a replica, one per request so paged
+    reads are consistent. A request that writes pins its client to the
+    primary for REPLICA_PIN_SECONDS, so it reads its own writes while the
+    replicas catch up. The pin is a signed timestamp sent as a cookie and
+    a DB-Pin response header, which clients without cookies echo back as
+    a DB-Pin request header; it is also stored in the
+    REPLICA_PIN_CACHE_ALIAS cache under the client's Authorization header
+    or session cookie, which only pins clients across workers when that
+    cache is shared.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        replicas = get_replicas()
+        if not replicas:
+            return self.get_response(request)
+
+        pinned = not self.eligible(request) or self.is_pinned(request)
+        state = RoutingState(None if pinned else random.choice(replicas))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        replicas = get_replicas()
+        if not replicas:
+            return await self.get_response(request)
+
+        pinned = not self.eligible(request) or await sync_to_async(self.is_pinned, thread_sensitive=False)(request)
+        state = RoutingState(None if pinned else random.choice(replicas))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            await sync_to_async(self.pin, thread_sensitive=False)(request, response)
+        return response
+
+    def eligible(self, request):
+        prefixes = getattr(settings, 'REPLICA_PATH_PREFIXES', ['/api/'])
+        return request.method in self.safe_methods and request.path.startswith(tuple(prefixes))
+
+    def pin_key(self, request):
+        credential = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not credential:
+            return None
+        return 'db-pin:' + hashlib.sha256(credential.encode('utf-8')).hexdigest()
+
+    def is_pinned(self, request):
+        for value in (request.headers.get(PIN_HEADER), request.COOKIES.get(PIN_COOKIE)):
+            if value and valid_pin(value):
+                return True
+        key = self.pin_key(request)
+        return key is not None and get_cache().get(key) is not None
+
+    def pin(self, request, response):
+        seconds = get_pin_seconds()
+        key = self.pin_key(request)
+        if key is not None:
+            get_cache().set(key, 1, seconds)
+        pin = make_pin()
+        response[PIN_HEADER] = pin
+        response.set_cookie(PIN_COOKIE, pin, max_age=seconds, httponly=True, samesite='Lax')
+
+
+def check_pin_cache(app_configs, **kwargs):
+    """Warn when replicas are configured but pins stay in one process"""
+    from django.core.checks import Warning
+
+    if not get_replicas() or 'LocMemCache' not in type(get_cache()).__name__:
+        return []
+    return [Warning(
+        'Read replicas are configured but REPLICA_PIN_CACHE_ALIAS is a per-process cache.',
+        hint='Point it at a shared cache (CACHE_URL); until then only clients that send '
+             'back the db_pin cookie or DB-Pin header read their own writes.',
+        id='core.W001',
+    )]
@@ -0,0 +1,220 @@
+import re
+from django.conf import settings
+from django.db import connections
+from django.db.models import FloatField, Lookup, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from .models import Course, CourseFTSEntry, CourseSearchDocument
+
+COURSE_TABLE = Course._meta.db_table
+
+
+def get_search_config():
+    """PostgreSQL text search configuration of the tsvector documents"""
+    return getattr(settings, 'COURSE_SEARCH_CONFIG', 'english')
+
+
+def tokenize(query):
+    """Split user input into plain word tokens, dropping any query syntax"""
+    return re.findall(r'\w+', query, re.UNICODE)
+
+
+class BaseSearchBackend:
+    """
+    Course search backend. `search` narrows and orders a Course queryset by
+    relevance; the index methods keep the backend's index in sync with the
+    course table.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_course(self, course):
+        pass
+
+    def remove_course(self, course_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class IContainsSearchBackend(BaseSearchBackend):
+    """Unindexed substring matching, used where no full-text index exists"""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query)
+        ).order_by('-created_at', '-id')
+
+
+class FTS5Match(Lookup):
+    """document__fts5_match=query: FTS5 MATCH on the table's hidden column"""
+    lookup_name = 'fts5_match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class TsQueryMatch(Lookup):
+    """document__tsquery_match=tsquery: tsvector @@ to_tsquery(config, tsquery)"""
+    lookup_name = 'tsquery_match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} @@ to_tsquery(%s::regconfig, {rhs})', [*lhs_params, get_search_config(), *rhs_params]
+
+
+CourseFTSEntry._meta.get_field('document').register_lookup(FTS5Match)
+CourseSearchDocument._meta.get_field('document').register_lookup(TsQueryMatch)
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 virtual table holding a copy of each course's title and
+    description under the course id as rowid, ranked with bm25 and the
+    title weighted above the description
+    """
+    table = 'core_course_fts'
+    title_weight = 10.0
+    description_weight = 1.0
+
+    def build_match(self, query):
+        # Every token is quoted (so FTS5 operators in user input are inert)
+        # and prefix-matched, which keeps search-as-you-type working
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, queryset, query):
+        match = self.build_match(query)
+        if not match:
+            return queryset.none()
+
+        # Join the index so MATCH runs once per query; bm25() is lower for
+        # better matches
+        rank = RawSQL(
+            f'bm25({self.table}, %s, %s)', [self.title_weight, self.description_weight], output_field=FloatField()
+        )
+        return (
+            queryset.filter(fts_entry__document__fts5_match=match)
+            .annotate(search_rank=rank)
+            .order_by('search_rank', '-id')
+        )
+
+    def index_course(self, course):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [course.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)',
+                [course.pk, course.title, course.description]
+            )
+
+    def remove_course(self, course_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [course_id])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, description) '
+                f'SELECT id, title, description FROM {COURSE_TABLE}'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL companion table of weighted tsvector documents with a GIN
+    index, ranked with ts_rank
+    """
+    table = 'core_course_search'
+    # Title and description as %s parameters, after the configuration
+    document_sql = (
+        "setweight(to_tsvector(%s::regconfig, {title}), 'A') || "
+        "setweight(to_tsvector(%s::regconfig, {description}), 'B')"
+    )
+
+    def build_tsquery(self, query):
+        return ' & '.join(f'{token}:*' for token in tokenize(query))
+
+    def search(self, queryset, query):
+        tsquery = self.build_tsquery(query)
+        if not tsquery:
+            return queryset.none()
+
+        rank = RawSQL(
+            f'ts_rank({self.table}.document, to_tsquery(%s::regconfig, %s))',
+            [get_search_config(), tsquery], output_field=FloatField(),
+        )
+        return (
+            queryset.filter(search_document__document__tsquery_match=tsquery)
+            .annotate(search_rank=rank)
+            .order_by('-search_rank', '-id')
+        )
+
+    def index_course(self, course):
+        config = get_search_config()
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.table} (course_id, document) '
+                f"VALUES (%s, {self.document_sql.format(title='%s', description='%s')}) "
+                f'ON CONFLICT (course_id) DO UPDATE SET document = EXCLUDED.document',
+                [course.pk, config, course.title, config, course.description]
+            )
+
+    def remove_course(self, course_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE course_id = %s', [course_id])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+            config = get_search_config()
+            cursor.execute(
+                f'INSERT INTO {self.table} (course_id, document) '
+                f"SELECT id, {self.document_sql.format(title='title', description='description')} FROM {COURSE_TABLE}",
+                [config, config]
+            )
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTS5SearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backends = {}
+
+
+def _index_exists(backend):
+    with backend.connection.cursor() as cursor:
+        return backend.table in backend.connection.introspection.table_names(cursor)
+
+
+def get_search_backend(using='default'):
+    """
+    Return the backend named by COURSE_SEARCH_BACKEND, or pick one for the
+    database vendor, falling back to icontains when its index is missing
+    (e.g. SQLite built without FTS5)
+    """
+    if using not in _backends:
+        backend_path = getattr(settings, 'COURSE_SEARCH_BACKEND', None)
+        if backend_path:
+            backend = import_string(backend_path)(using=using)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connections[using].vendor)
+            backend = backend_class(using=using) if backend_class else None
+            if backend is None or not _index_exists(backend):
+                backend = IContainsSearchBackend(using=using)
+        _backends[using] = backend
+    return _backends[using]
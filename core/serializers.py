@@ -1,46 +1,195 @@
+import os
+from django.core.exceptions import SuspiciousFileOperation
+from django.urls import reverse
+from django.utils.text import get_valid_filename
 from rest_framework import serializers
-from .models import Category, Course, Lesson, Material, Enrollment, QuestionAnswer
+from .models import Category, Course, Lesson, Material, Enrollment, QuestionAnswer, UploadSession
+from .uploads import get_upload_settings
+from .images import get_banner_settings, source_version
+from .fastpath import from_values
+from .performance import measure
 from users.models import User
 
 
-class UserSerializer(serializers.ModelSerializer):
+def parse_field_list(value):
+    if not value:
+        return set()
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets for serializers built with a request in their context.
+    ?fields=id,title keeps only the named fields, and nested serializers
+    (the *_details fields) are left out unless named in ?expand=, since the
+    foreign key field already carries the related id. Dotted names expand
+    inside an expanded serializer (?expand=lesson_details.course_details)
+    and ?expand=* expands every nested serializer one level down.
+    Serializers without a request in their context render in full.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        params = getattr(request, 'query_params', request.GET)
+        self.restrict_fields(
+            parse_field_list(self.context.get('fields', params.get('fields'))),
+            parse_field_list(self.context.get('expand', params.get('expand'))),
+        )
+
+    def restrict_fields(self, fields, expand):
+        expanded = {name.split('.', 1)[0] for name in expand}
+        for name, field in list(self.fields.items()):
+            if isinstance(field, serializers.BaseSerializer):
+                if '*' not in expanded and name not in expanded:
+                    self.fields.pop(name)
+                elif isinstance(field, DynamicFieldsMixin):
+                    prefix = name + '.'
+                    field.restrict_fields(set(), {path[len(prefix):] for path in expand if path.startswith(prefix)})
+            elif fields and name not in fields:
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        with measure('serialize'):
+            return super().to_representation(instance)
+
+
+class ProtectedFileField(serializers.FileField):
+    """
+    A file only served through an access-checked endpoint: renders the URL
+    of view_name for the object instead of the storage URL under MEDIA_URL
+    """
+
+    def __init__(self, view_name, **kwargs):
+        self.view_name = view_name
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return self.values_url(value.instance.pk, value.name)
+
+    def values_url(self, pk, name):
+        if not name:
+            return None
+        url = reverse(self.view_name, args=[pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'role']
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category_details = CategorySerializer(source='category', read_only=True)
     instructor_details = UserSerializer(source='instructor', read_only=True)
+    banner_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
         fields = [
-            'id', 'title', 'description', 'banner', 'price', 'duration', 'is_active',
+            'id', 'title', 'description', 'banner', 'banner_variants', 'price', 'duration', 'is_active',
             'category', 'category_details',
             'instructor', 'instructor_details',
+            'enrollment_count', 'lesson_count', 'material_count', 'question_count',
             'created_at', 'updated_at'
         ]
 
+    def get_banner_variants(self, obj):
+        return self.values_banner_variants(obj.pk, obj.banner.name)
+
+    @from_values('id', 'banner')
+    def values_banner_variants(self, pk, banner):
+        # {format: {width: url}}, resized and recompressed on first request
+        if not banner:
+            return None
+        config = get_banner_settings()
+        request = self.context.get('request')
+        version = source_version(banner)
+        # The variant URLs differ only in their trailing <width>.<fmt>, so
+        # reverse once per course rather than once per variant
+        base = reverse('course_banner', args=[pk, 0, 'x'])[:-len('0.x')]
+        if request:
+            base = request.build_absolute_uri(base)
+        return {
+            fmt: {str(width): f'{base}{width}.{fmt}?v={version}' for width in config['WIDTHS']}
+            for fmt in config['FORMATS']
+        }
+
+
+class CourseSummarySerializer(CourseSerializer):
+    """Course card for list views"""
+
+    class Meta(CourseSerializer.Meta):
+        fields = [
+            'id', 'title', 'banner', 'banner_variants', 'price', 'duration', 'is_active',
+            'category', 'category_details',
+            'instructor', 'instructor_details',
+            'enrollment_count', 'lesson_count', 'created_at'
+        ]
+
+
+class CourseOverviewSerializer(CourseSerializer):
+    """Course page for viewers without access: the catalog card and description"""
+
+    class Meta(CourseSerializer.Meta):
+        fields = [
+            'id', 'title', 'description', 'banner', 'banner_variants', 'price', 'duration', 'is_active',
+            'category', 'category_details',
+            'instructor', 'instructor_details',
+            'enrollment_count', 'lesson_count', 'created_at'
+        ]
+
 
-class LessonSerializer(serializers.ModelSerializer):
+class LessonSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     course_details = CourseSerializer(source='course', read_only=True)
+    video = ProtectedFileField('lesson_video', required=False)
+    thumbnail = ProtectedFileField('lesson_thumbnail', read_only=True)
+    stream_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Lesson
         fields = [
             'id', 'title', 'description', 'video', 'is_active',
+            'processing_status', 'processing_error', 'stream_url', 'thumbnail',
             'course', 'course_details', 'created_at', 'updated_at'
         ]
 
-class MaterialSerializer(serializers.ModelSerializer):
+    def get_stream_url(self, obj):
+        return self.values_stream_url(obj.pk, obj.processing_status, obj.stream_manifest.name)
+
+    @from_values('id', 'processing_status', 'stream_manifest')
+    def values_stream_url(self, pk, processing_status, stream_manifest):
+        # HLS master playlist, served with the same access checks as the video
+        if processing_status != 'ready' or not stream_manifest:
+            return None
+        url = reverse('lesson_stream', args=[pk, 'master.m3u8'])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+class LessonSummarySerializer(LessonSerializer):
+    """Curriculum row for list views"""
+
+    class Meta(LessonSerializer.Meta):
+        fields = [
+            'id', 'title', 'is_active', 'processing_status', 'stream_url', 'thumbnail',
+            'course', 'course_details', 'created_at'
+        ]
+
+class MaterialSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     course_details = CourseSerializer(source='course', read_only=True)
+    file = ProtectedFileField('material_file', required=False)
 
     class Meta:
         model = Material
@@ -49,7 +198,11 @@ class MaterialSerializer(serializers.ModelSerializer):
             'course', 'course_details', 'created_at', 'updated_at'
         ]
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class MaterialSummarySerializer(MaterialSerializer):
+    class Meta(MaterialSerializer.Meta):
+        fields = ['id', 'title', 'file_type', 'file', 'is_active', 'course', 'course_details', 'created_at']
+
+class EnrollmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     student_details = UserSerializer(source='student', read_only=True)
     course_details = CourseSerializer(source='course', read_only=True)
 
@@ -62,7 +215,14 @@ class EnrollmentSerializer(serializers.ModelSerializer):
             'total_mark', 'is_certificate_ready', 'created_at', 'updated_at'
         ]
 
-class QuestionAnswerSerializer(serializers.ModelSerializer):
+class EnrollmentSummarySerializer(EnrollmentSerializer):
+    class Meta(EnrollmentSerializer.Meta):
+        fields = [
+            'id', 'student', 'student_details', 'course', 'course_details',
+            'is_active', 'progress', 'is_completed', 'created_at'
+        ]
+
+class QuestionAnswerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_details = UserSerializer(source='user', read_only=True)
     lesson_details = LessonSerializer(source='lesson', read_only=True)
 
@@ -72,4 +232,40 @@ class QuestionAnswerSerializer(serializers.ModelSerializer):
             'id', 'user', 'user_details',
             'lesson', 'lesson_details',
             'description', 'is_active', 'created_at', 'updated_at'
-        ]
\ No newline at end of file
+        ]
+        # Set from the asking student
+        read_only_fields = ['user']
+
+class QuestionAnswerSummarySerializer(QuestionAnswerSerializer):
+    class Meta(QuestionAnswerSerializer.Meta):
+        fields = ['id', 'user', 'user_details', 'lesson', 'lesson_details', 'description', 'created_at']
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    lesson = serializers.PrimaryKeyRelatedField(
+        queryset=Lesson.objects.select_related('course'), required=False, allow_null=True
+    )
+    material = serializers.PrimaryKeyRelatedField(
+        queryset=Material.objects.select_related('course'), required=False, allow_null=True
+    )
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'lesson', 'material', 'filename', 'size', 'status', 'created_at', 'updated_at']
+        read_only_fields = ['status']
+
+    def validate_filename(self, value):
+        try:
+            return get_valid_filename(os.path.basename(value.replace('\\', '/')))
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError('Invalid filename')
+
+    def validate_size(self, value):
+        max_size = get_upload_settings()['MAX_SIZE']
+        if value <= 0 or value > max_size:
+            raise serializers.ValidationError(f'Size must be between 1 and {max_size} bytes')
+        return value
+
+    def validate(self, data):
+        if bool(data.get('lesson')) == bool(data.get('material')):
+            raise serializers.ValidationError('Provide exactly one of lesson or material')
+        return data
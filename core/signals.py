@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from .access import invalidate_course, invalidate_enrollment
+from .catalog_cache import bump_generation
+from .search import get_search_backend
+from .counters import COUNTERS, load_state, release_counters, remember_state, update_counters
+from .uploads import part_path, remove_part_file
+from .video import remember_video, video_changed
+from .models import Category, Course, Enrollment, Lesson, UploadSession
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    student_id, course_id = instance.student_id, instance.course_id
+    invalidate_enrollment(student_id, course_id)
+    # Invalidate again once committed, so a concurrent request cannot
+    # re-cache the pre-commit state
+    transaction.on_commit(lambda: invalidate_enrollment(student_id, course_id))
+
+
+@receiver(post_delete, sender=UploadSession)
+def upload_deleted(sender, instance, **kwargs):
+    # Sessions cascade-deleted with their lesson, material or user included;
+    # a rolled back delete keeps its part file. The path is taken now, as
+    # delete() clears instance.pk afterwards.
+    path = part_path(instance)
+    transaction.on_commit(lambda: remove_part_file(path))
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    course_id = instance.pk
+    invalidate_course(course_id)
+    transaction.on_commit(lambda: invalidate_course(course_id))
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    get_search_backend().index_course(instance)
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    get_search_backend().remove_course(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Course)
+def catalog_changed(sender, instance, **kwargs):
+    bump_generation()
+    transaction.on_commit(bump_generation)
+
+
+# Course counters (enrollment_count, lesson_count, ...) follow every
+# counted model's saves and deletes
+for model in COUNTERS:
+    post_init.connect(remember_state, sender=model, dispatch_uid=f'counters-init-{model.__name__}')
+    pre_save.connect(load_state, sender=model, dispatch_uid=f'counters-load-{model.__name__}')
+    post_save.connect(update_counters, sender=model, dispatch_uid=f'counters-save-{model.__name__}')
+    post_delete.connect(release_counters, sender=model, dispatch_uid=f'counters-delete-{model.__name__}')
+
+# New or replaced lesson videos are queued for HLS / thumbnail processing
+post_init.connect(remember_video, sender=Lesson, dispatch_uid='video-init')
+post_save.connect(video_changed, sender=Lesson, dispatch_uid='video-save')
@@ -1,3 +1,1842 @@
-from django.test import TestCase
+import base64
+import hashlib
+import importlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+import requests
+from django.conf import settings
+from PIL import Image as PILImage
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.urls import clear_url_caches, resolve, reverse
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework.test import APIClient, APIRequestFactory
+from users.authentication import add_token_claims
+from users.models import User
+from django.utils import timezone
+from .fastpath import ValuesRowBuilder
+from .renderers import ORJSONRenderer
+from .serializers import EnrollmentSerializer, parse_field_list
+from .counters import recount
+from . import images, transcode, video
+from .replicas import PIN_COOKIE, PIN_HEADER, ReplicaRouter, ReplicaRoutingMiddleware, _state, check_pin_cache
+from . import async_views
+from .catalog_cache import COUNTERS_KEY, bump_counters, get_cache as get_catalog_cache
+from .access import DjangoAccessCache, LRUAccessCache, get_course_access
+from .utils.api_client import ApiClient, ResponseCache
+from .throttling import AuthRateThrottle, LoadSheddingMiddleware, LocalBucketStore, PriorityGate, _bucket_state
+from .models import Category, Course, Lesson, Material, Enrollment, QuestionAnswer, UploadSession
 
 # Create your tests here.
+
+
+class QueryCountTestCase(TestCase):
+    """
+    List endpoints must issue a constant number of queries no matter how
+    many rows they serialize
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create(username='admin', role='admin')
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.category = Category.objects.create(title='Programming')
+        self.course = self.create_course()
+        self.lesson = Lesson.objects.create(
+            title='Intro', description='Intro', video='lesson_videoes/download.jpeg', course=self.course
+        )
+        self.student_count = 0
+
+    def create_course(self):
+        return Course.objects.create(
+            title='Python', description='Python course', banner='course_banners/download.jpeg',
+            price=10, duration=5, is_active=True, category=self.category, instructor=self.teacher
+        )
+
+    def create_enrollment(self):
+        self.student_count += 1
+        student = User.objects.create(username=f'student{self.student_count}', role='student')
+        return Enrollment.objects.create(student=student, course=self.create_course(), price=10)
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url, create_row, params=None, expand='*'):
+        """
+        Checks the plain response (the values fast path for most lists), the
+        one with nested serializers expanded, and a sparse fieldset
+        """
+        variants = [{}, {'expand': expand}, {'fields': 'id', 'expand': expand}, {'fields': 'id,created_at'}]
+        for variant in variants:
+            with self.subTest(**variant):
+                variant = {**(params or {}), **variant}
+                create_row()
+                baseline = self.count_queries(url, variant)
+                for _ in range(5):
+                    create_row()
+                self.assertEqual(self.count_queries(url, variant), baseline)
+
+    def test_course_list(self):
+        self.assertConstantQueries('/api/courses/', self.create_course)
+
+    def test_category_list(self):
+        self.assertConstantQueries(
+            '/api/categories/', lambda: Category.objects.create(title='Design')
+        )
+
+    def test_enrollment_list(self):
+        self.client.force_authenticate(self.admin)
+        self.assertConstantQueries('/api/enrollments/', self.create_enrollment)
+        # Two levels of nesting
+        self.assertConstantQueries(
+            '/api/enrollments/', self.create_enrollment,
+            expand='student_details,course_details.category_details,course_details.instructor_details',
+        )
+
+    def test_expanded_rows_are_nested(self):
+        self.client.force_authenticate(self.admin)
+        self.create_enrollment()
+        row = self.client.get('/api/enrollments/', {'expand': 'course_details.category_details'}).json()['results'][0]
+        self.assertEqual(row['course_details']['category_details']['title'], 'Programming')
+        self.assertNotIn('instructor_details', row['course_details'])
+        self.assertNotIn('student_details', row)
+        row = self.client.get('/api/enrollments/', {'fields': 'id,course'}).json()['results'][0]
+        self.assertEqual(set(row), {'id', 'course'})
+
+    def test_question_list(self):
+        self.client.force_authenticate(self.admin)
+        self.assertConstantQueries(
+            '/api/questions/',
+            lambda: QuestionAnswer.objects.create(user=self.admin, lesson=self.lesson, description='Why?'),
+            params={'lesson': self.lesson.pk},
+        )
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Plans are checked with EXPLAIN QUERY PLAN')
+class IndexUsageTestCase(TestCase):
+    """
+    The queries behind each list view and access check must be served by
+    an index, including their ORDER BY, so no table scan or sort shows up
+    as the tables grow
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create(username='admin', role='admin')
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.student = User.objects.create(username='student', role='student')
+        self.category = Category.objects.create(title='Programming')
+        self.course = Course.objects.create(
+            title='Python', description='Python course', banner='course_banners/download.jpeg',
+            price=10, duration=5, is_active=True, category=self.category, instructor=self.teacher
+        )
+        self.lesson = Lesson.objects.create(title='Intro', description='Intro', course=self.course)
+        Enrollment.objects.create(student=self.student, course=self.course, price=10)
+        QuestionAnswer.objects.create(user=self.student, lesson=self.lesson, description='Why?')
+
+    def query_plans(self, url, params=None):
+        """EXPLAIN QUERY PLAN of every SELECT the request runs"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        plans = []
+        for query in ctx.captured_queries:
+            if query['sql'].startswith('SELECT'):
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.append('\n'.join(row[3] for row in cursor.fetchall()))
+        return plans
+
+    def assertPlansUse(self, plans, index):
+        self.assertTrue(any(index in plan for plan in plans), '\n\n'.join(plans))
+        for plan in plans:
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def assertViewUses(self, url, index, params=None):
+        self.assertPlansUse(self.query_plans(url, params), index)
+
+    def test_course_list(self):
+        self.assertViewUses('/api/courses/', 'course_created_id_idx')
+
+    def test_course_list_by_category(self):
+        self.assertViewUses('/api/courses/', 'course_category_created_idx', {'category': self.category.pk})
+
+    def test_teacher_course_list(self):
+        self.client.force_authenticate(self.teacher)
+        self.assertViewUses('/api/courses/', 'course_instructor_created_idx')
+
+    def test_lesson_list(self):
+        self.client.force_authenticate(self.admin)
+        self.assertViewUses('/api/lessons/', 'lesson_course_created_idx', {'course': self.course.pk})
+
+    def test_question_list(self):
+        self.client.force_authenticate(self.admin)
+        self.assertViewUses('/api/questions/', 'question_lesson_created_idx', {'lesson': self.lesson.pk})
+
+    def test_enrollment_list_by_course(self):
+        self.client.force_authenticate(self.admin)
+        self.assertViewUses('/api/enrollments/', 'enrollment_course_created_idx', {'course': self.course.pk})
+
+    def test_enrollment_list_by_student(self):
+        self.client.force_authenticate(self.admin)
+        self.assertViewUses('/api/enrollments/', 'enrollment_student_created_idx', {'student': self.student.pk})
+
+    def test_enrollment_access_check(self):
+        # The query get_course_access runs on a cache miss
+        queryset = Enrollment.objects.filter(student_id=self.student.pk, course_id=self.course.pk, is_active=True)
+        self.assertPlansUse([queryset.explain()], '(student_id=? AND course_id=?)')
+
+    def test_stale_uploads(self):
+        # clear_stale_uploads
+        queryset = UploadSession.objects.filter(status='pending', updated_at__lt=timezone.now() - timedelta(hours=24))
+        self.assertPlansUse([queryset.explain()], 'upload_pending_updated_idx')
+
+
+class ProtectedMediaTestCase(TestCase):
+    """
+    Lesson videos are only reachable through the access-checked endpoint
+    the serializers link to, never under MEDIA_URL
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        for name, content in (('lesson_videoes/intro.mp4', b'0123456789'), ('course_banners/python.jpeg', b'jpeg')):
+            os.makedirs(os.path.join(self.media_root.name, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.media_root.name, name), 'wb') as f:
+                f.write(content)
+        self.media_settings = override_settings(MEDIA_ROOT=Path(self.media_root.name), DEBUG=True)
+        self.media_settings.enable()
+        self.addCleanup(self.media_settings.disable)
+        # The media routes are only mounted with DEBUG, when the URLconf loads
+        self.reload_urls()
+        self.addCleanup(self.reload_urls)
+
+        self.client = APIClient()
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.student = User.objects.create(username='student', role='student')
+        self.course = Course.objects.create(
+            title='Python', description='Python course', banner='course_banners/python.jpeg',
+            price=10, duration=5, is_active=True, category=Category.objects.create(title='Programming'),
+            instructor=self.teacher,
+        )
+        self.lesson = Lesson.objects.create(
+            title='Intro', description='Intro', video='lesson_videoes/intro.mp4', course=self.course
+        )
+
+    def reload_urls(self):
+        import lms_backend.urls
+        importlib.reload(lms_backend.urls)
+        clear_url_caches()
+
+    def test_video_not_under_media_url(self):
+        self.assertEqual(self.client.get('/media/lesson_videoes/intro.mp4').status_code, 404)
+        with self.assertLogs('django.security', 'ERROR'):
+            response = self.client.get('/media/course_banners/../lesson_videoes/intro.mp4')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/media/course_banners/python.jpeg').status_code, 200)
+
+    def test_serializer_links_checked_endpoint(self):
+        Enrollment.objects.create(student=self.student, course=self.course, price=10)
+        self.client.force_authenticate(self.student)
+        response = self.client.get(f'/api/lessons/{self.lesson.pk}/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['video'].endswith(reverse('lesson_video', args=[self.lesson.pk])))
+        # The curriculum is built from values() rows by the fast path
+        Lesson.objects.filter(pk=self.lesson.pk).update(thumbnail='lesson_thumbnails/intro.jpeg')
+        listed = self.client.get('/api/lessons/', {'course': self.course.pk}).json()
+        listed = listed['results'] if isinstance(listed, dict) else listed
+        self.assertTrue(listed[0]['thumbnail'].endswith(reverse('lesson_thumbnail', args=[self.lesson.pk])))
+
+        video = self.client.get(response.json()['video'])
+        self.assertEqual(video.status_code, 200)
+        self.assertEqual(b''.join(video.streaming_content), b'0123456789')
+        video = self.client.get(response.json()['video'], HTTP_RANGE='bytes=2-4')
+        self.assertEqual(video.status_code, 206)
+        self.assertEqual(b''.join(video.streaming_content), b'234')
+
+    def test_video_requires_enrollment(self):
+        self.client.force_authenticate(self.student)
+        response = self.client.get(reverse('lesson_video', args=[self.lesson.pk]))
+        self.assertEqual(response.status_code, 403)
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher = User.objects.create(username='teacher', role='teacher')
+        category = Category.objects.create(title='Programming')
+        self.courses = [
+            Course.objects.create(
+                title=f'Course {index}', description='Course', price=10, duration=5,
+                is_active=True, category=category, instructor=teacher,
+            )
+            for index in range(5)
+        ]
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return [course['id'] for course in response.json()['results']]
+
+    def test_cursor_round_trip(self):
+        newest_first = [course.pk for course in reversed(self.courses)]
+        first = self.client.get('/api/courses/', {'page_size': 2})
+        self.assertEqual(self.ids(first), newest_first[:2])
+        self.assertIsNone(first.json()['previous'])
+
+        second = self.client.get(first.json()['next'])
+        self.assertEqual(self.ids(second), newest_first[2:4])
+        third = self.client.get(second.json()['next'])
+        self.assertEqual(self.ids(third), newest_first[4:])
+        self.assertIsNone(third.json()['next'])
+
+        self.assertEqual(self.ids(self.client.get(third.json()['previous'])), newest_first[2:4])
+
+    def test_forged_cursor(self):
+        for cursor in ('eyJwIjpbIngiLCJ5Il19', 'eyJwIjpbbnVsbCwxXX0', 'eyJwIjpbe30sW11dfQ', 'not-base64!'):
+            response = self.client.get('/api/courses/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.json()['detail'], 'Invalid cursor')
+
+
+
+class CourseSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher = User.objects.create(username='teacher', role='teacher')
+        category = Category.objects.create(title='Programming')
+        self.courses = {
+            title: Course.objects.create(
+                title=title, description=description, price=10, duration=5,
+                is_active=True, category=category, instructor=teacher,
+            )
+            for title, description in [
+                ('Python basics', 'Variables and loops'),
+                ('Web development', 'Django, written in Python'),
+                ('Cooking', 'Pasta and sauces'),
+            ]
+        }
+
+    def test_title_matches_rank_first(self):
+        response = self.client.get('/api/courses/', {'search': 'pyth'})
+        self.assertEqual(response.status_code, 200, response.content)
+        titles = [course['title'] for course in response.json()['results']]
+        self.assertEqual(titles, ['Python basics', 'Web development'])
+
+    def test_index_follows_changes(self):
+        course = self.courses['Cooking']
+        course.title = 'Python for cooks'
+        course.save()
+        response = self.client.get('/api/courses/', {'search': 'cooks'})
+        self.assertEqual([item['id'] for item in response.json()['results']], [course.pk])
+
+class ThrottlingTestCase(TestCase):
+    def test_ip_key_ignores_forwarded_for(self):
+        factory = APIRequestFactory()
+        throttle = AuthRateThrottle()
+        direct = factory.post('/api/user/auth/', REMOTE_ADDR='203.0.113.7')
+        spoofed = factory.post('/api/user/auth/', REMOTE_ADDR='203.0.113.7', HTTP_X_FORWARDED_FOR='198.51.100.1')
+        self.assertEqual(throttle.get_key(spoofed), throttle.get_key(direct))
+        self.assertEqual(throttle.get_key(direct), 'auth:ip:203.0.113.7')
+
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            self.assertEqual(throttle.get_key(spoofed), 'auth:ip:198.51.100.1')
+
+    def test_bucket_arithmetic(self):
+        # A new bucket starts full
+        self.assertEqual(_bucket_state(None, None, 100, 1, 3, 1), (2, 0))
+        # Half a second refills half a token, half a second short of one
+        self.assertEqual(_bucket_state(0, 100, 100.5, 1, 3, 1), (0.5, 0.5))
+        # Refills stop at the capacity
+        self.assertEqual(_bucket_state(1, 100, 1000, 1, 3, 1), (2, 0))
+
+        store = LocalBucketStore()
+        with mock.patch('core.throttling.time.time', return_value=0):
+            self.assertEqual([store.consume('key', 1, 2) for _ in range(3)], [0, 0, 1])
+        with mock.patch('core.throttling.time.time', return_value=0.5):
+            self.assertEqual(store.consume('key', 1, 2), 0.5)
+        with mock.patch('core.throttling.time.time', return_value=10):
+            self.assertEqual([store.consume('key', 1, 2) for _ in range(3)], [0, 0, 1])
+        self.assertEqual(store.consume('other', 1, 2), 0)
+
+    def test_gate_lets_waiters_in_by_priority(self):
+        gate = PriorityGate(limit=1, max_waiting=8)
+        self.assertTrue(gate.acquire(1, timeout=0))
+        admitted = []
+
+        def wait(priority):
+            self.assertTrue(gate.acquire(priority, timeout=5))
+            admitted.append(priority)
+            gate.release()
+
+        threads = []
+        for count, priority in enumerate((2, 1, 0, 1), 1):
+            threads.append(threading.Thread(target=wait, args=(priority,)))
+            threads[-1].start()
+            while len(gate._waiters) < count:
+                threading.Event().wait(0.001)
+        gate.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, [0, 1, 1, 2])
+        self.assertEqual(gate.active, 0)
+
+    def test_gate_gives_up(self):
+        gate = PriorityGate(limit=1, max_waiting=1)
+        self.assertTrue(gate.acquire(1, timeout=0))
+        self.assertFalse(gate.acquire(0, timeout=0.01))
+        self.assertEqual(gate._waiters, [])
+
+        gate.max_waiting = 0
+        self.assertFalse(gate.acquire(0, timeout=5))
+        gate.release()
+        self.assertTrue(gate.acquire(1, timeout=0))
+
+    def test_uploads_have_their_own_gate(self):
+        config = {'WRITE_CONCURRENCY': 1, 'TIMEOUT': 0, 'GATES': {'/api/uploads/': 1}}
+        with override_settings(LOAD_SHEDDING=config):
+            middleware = LoadSheddingMiddleware(lambda request: HttpResponse())
+        factory = APIRequestFactory()
+        # A write holds the only write slot
+        self.assertTrue(middleware.gate.acquire(1, timeout=0))
+
+        self.assertEqual(middleware(factory.put('/api/uploads/5c3d/', b'chunk', content_type='application/octet-stream')).status_code, 200)
+        self.assertEqual(middleware(factory.get('/api/courses/')).status_code, 200)
+        response = middleware(factory.post('/api/enrollments/enroll/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+
+
+class ConditionalListTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create(username='admin', role='admin')
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=Category.objects.create(title='Programming'), instructor=self.teacher,
+        )
+        # Authenticated, so responses do not come from the catalog cache
+        self.client.force_authenticate(self.admin)
+
+    def test_not_modified_after_one_query(self):
+        response = self.client.get('/api/courses/')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        # The aggregate only
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Other viewers and other filters get other ETags
+        self.client.force_authenticate(self.teacher)
+        self.assertEqual(self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/api/courses/', {'page_size': 5}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_give_new_etag(self):
+        etag = self.client.get('/api/courses/')['ETag']
+        # Counter updates do not save the course
+        student = User.objects.create(username='student', role='student')
+        Enrollment.objects.create(student=student, course=self.course, price=10)
+        response = self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['enrollment_count'], 1)
+
+        etag = response['ETag']
+        self.course.title = 'Python 3'
+        self.course.save()
+        self.assertEqual(self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get('/api/categories/')['ETag']
+        self.assertEqual(self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Category.objects.create(title='Design')
+        self.assertEqual(self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_without_signals_give_new_etag(self):
+        etag = self.client.get('/api/courses/')['ETag']
+        Course.objects.filter(pk=self.course.pk).update(title='Python 3', updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cached_list_follows_counters(self):
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get('/api/courses/').json()['results'][0]['enrollment_count'], 0)
+        with self.assertNumQueries(0):
+            anonymous.get('/api/courses/')
+        student = User.objects.create(username='student', role='student')
+        Enrollment.objects.create(student=student, course=self.course, price=10)
+        self.assertEqual(anonymous.get('/api/courses/').json()['results'][0]['enrollment_count'], 1)
+
+
+class CatalogCacheTestCase(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.addCleanup(get_catalog_cache().clear)
+        self.client = APIClient()
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.category = Category.objects.create(title='Programming')
+        self.course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=self.category, instructor=self.teacher,
+        )
+
+    def test_anonymous_lists_are_cached_per_params(self):
+        self.client.get('/api/courses/')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get('/api/courses/').json()['results']), 1)
+        self.client.get('/api/categories/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/')
+        self.assertGreater(self.count_queries('/api/courses/', {'category': self.category.pk}), 0)
+        self.assertGreater(self.count_queries('/api/courses/', {'search': 'Py'}), 0)
+        self.assertGreater(self.count_queries('/api/courses/', {'search': 'Py'}), 0)
+
+        self.client.force_authenticate(self.teacher)
+        self.assertGreater(self.count_queries('/api/courses/'), 0)
+
+    def test_cached_list_answers_not_modified(self):
+        etag = self.client.get('/api/courses/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_saves_replace_every_list(self):
+        self.client.get('/api/courses/')
+        self.client.get('/api/categories/')
+        self.category.title = 'Software'
+        self.category.save()
+        self.assertEqual(self.client.get('/api/categories/').json()[0]['title'], 'Software')
+        self.course.title = 'Python 3'
+        self.course.save()
+        self.assertEqual(self.client.get('/api/courses/').json()['results'][0]['title'], 'Python 3')
+
+    def test_counters_replace_course_lists_only(self):
+        self.client.get('/api/courses/')
+        self.client.get('/api/categories/')
+        bump_counters()
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/')
+        self.assertGreater(self.count_queries('/api/courses/'), 0)
+
+    def test_evicted_counters_version_does_not_reuse_entries(self):
+        self.client.get('/api/courses/')
+        version = get_catalog_cache().get(COUNTERS_KEY)
+        get_catalog_cache().delete(COUNTERS_KEY)
+        self.assertGreater(self.count_queries('/api/courses/'), 0)
+        self.assertGreater(get_catalog_cache().get(COUNTERS_KEY), version)
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+
+class QuestionTestCase(TestCase):
+    def test_student_asks_question(self):
+        teacher = User.objects.create(username='teacher', role='teacher')
+        student = User.objects.create(username='student', role='student')
+        course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=Category.objects.create(title='Programming'), instructor=teacher,
+        )
+        lesson = Lesson.objects.create(title='Intro', description='Intro', course=course)
+        client = APIClient()
+        client.force_authenticate(student)
+
+        payload = {'lesson': lesson.pk, 'description': 'Why?'}
+        self.assertEqual(client.post('/api/questions/', payload, format='json').status_code, 403)
+
+        Enrollment.objects.create(student=student, course=course, price=10)
+        response = client.post('/api/questions/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['user'], student.pk)
+        self.assertEqual(QuestionAnswer.objects.get().user, student)
+
+
+class CourseAccessTestCase(TestCase):
+    """
+    Cached access decisions follow enrollment, instructor and role changes
+    right away, with either cache backend
+    """
+
+    def setUp(self):
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.other_teacher = User.objects.create(username='other', role='teacher')
+        self.student = User.objects.create(username='student', role='student')
+        self.course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=Category.objects.create(title='Programming'), instructor=self.teacher,
+        )
+        self.factory = APIRequestFactory()
+
+    def access(self, user, course=None):
+        # A new request each time, so only the shared cache is reused
+        request = self.factory.get('/')
+        request.user = user
+        return get_course_access(request, course or Course.objects.get(pk=self.course.pk))
+
+    def for_each_backend(self, test):
+        for backend in (LRUAccessCache(), DjangoAccessCache(key_prefix='test-course-access')):
+            with self.subTest(backend=type(backend).__name__), mock.patch('core.access._backend', backend):
+                backend.clear()
+                test()
+
+    def test_enrollment(self):
+        def test():
+            self.assertFalse(self.access(self.student).allowed)
+            enrollment = Enrollment.objects.create(student=self.student, course=self.course, price=10)
+            self.assertTrue(self.access(self.student).is_enrolled)
+            # Served from the cache now
+            with self.assertNumQueries(0):
+                self.assertTrue(self.access(self.student, self.course).allowed)
+
+            enrollment.is_active = False
+            enrollment.save()
+            self.assertFalse(self.access(self.student).allowed)
+            enrollment.is_active = True
+            enrollment.save()
+            self.assertTrue(self.access(self.student).allowed)
+            enrollment.delete()
+            self.assertFalse(self.access(self.student).allowed)
+        self.for_each_backend(test)
+
+    def test_instructor_change(self):
+        def test():
+            self.assertTrue(self.access(self.teacher).is_owner)
+            self.assertFalse(self.access(self.other_teacher).is_owner)
+
+            course = Course.objects.get(pk=self.course.pk)
+            course.instructor = self.other_teacher
+            course.save()
+            self.assertFalse(self.access(self.teacher).is_owner)
+            self.assertTrue(self.access(self.other_teacher).is_owner)
+
+            course.instructor = self.teacher
+            course.save()
+        self.for_each_backend(test)
+
+    def test_role_change(self):
+        def test():
+            user = User.objects.get(pk=self.student.pk)
+            Enrollment.objects.create(student=user, course=self.course, price=10)
+            self.assertTrue(self.access(user).is_enrolled)
+
+            user.role = 'admin'
+            access = self.access(user)
+            self.assertTrue(access.is_admin)
+            self.assertFalse(access.is_enrolled)
+
+            user.role = 'teacher'
+            self.assertFalse(self.access(user).allowed)
+            user.role = 'student'
+            self.assertTrue(self.access(user).is_enrolled)
+            Enrollment.objects.filter(student=user).delete()
+        self.for_each_backend(test)
+
+    def test_writes_stay_in_own_courses(self):
+        other_course = Course.objects.create(
+            title='Java', description='Java course', price=10, duration=5, is_active=True,
+            category=self.course.category, instructor=self.other_teacher,
+        )
+        lesson = Lesson.objects.create(title='Intro', description='Intro', course=self.course)
+        material = Material.objects.create(title='Slides', description='Slides', file_type='pdf', course=self.course)
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+
+        # Own lesson, someone else's course in the payload
+        response = client.post('/api/materials/', {
+            'lesson': lesson.pk, 'course': other_course.pk, 'title': 'Notes', 'description': 'Notes', 'file_type': 'pdf',
+        })
+        self.assertEqual(response.status_code, 403, response.content)
+        self.assertFalse(Material.objects.filter(course=other_course).exists())
+
+        response = client.put(f'/api/materials/{material.pk}/', {
+            'course': other_course.pk, 'title': 'Slides', 'description': 'Slides', 'file_type': 'pdf',
+        })
+        self.assertEqual(response.status_code, 403, response.content)
+        response = client.put(f'/api/lessons/{lesson.pk}/', {'course': other_course.pk, 'title': 'Intro', 'description': 'Intro'})
+        self.assertEqual(response.status_code, 403, response.content)
+        self.assertEqual(Lesson.objects.get(pk=lesson.pk).course_id, self.course.pk)
+        self.assertEqual(Material.objects.get(pk=material.pk).course_id, self.course.pk)
+
+        response = client.post('/api/materials/', {
+            'lesson': lesson.pk, 'course': self.course.pk, 'title': 'Notes', 'description': 'Notes', 'file_type': 'pdf',
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+
+
+class CourseDetailTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.student = User.objects.create(username='student', role='student')
+        self.course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=Category.objects.create(title='Programming'), instructor=self.teacher,
+        )
+        self.url = f'/api/courses/{self.course.pk}/'
+
+    def test_limited_view(self):
+        for user in (None, self.student):
+            self.client.force_authenticate(user)
+            data = self.client.get(self.url).json()
+            self.assertEqual(data['description'], 'Python course')
+            self.assertEqual(data['category'], self.course.category_id)
+            # Nested details only when expanded, as for members
+            self.assertNotIn('instructor_details', data)
+            self.assertNotIn('material_count', data)
+            expanded = self.client.get(self.url, {'expand': 'instructor_details'}).json()
+            self.assertEqual(expanded['instructor_details']['username'], 'teacher')
+
+    def test_members_view(self):
+        Enrollment.objects.create(student=self.student, course=self.course, price=10)
+        self.client.force_authenticate(self.student)
+        data = self.client.get(self.url).json()
+        self.assertIn('material_count', data)
+        self.assertNotIn('instructor_details', data)
+
+
+
+class DynamicFieldsTestCase(TestCase):
+    def fields(self, query='', **context):
+        request = Request(APIRequestFactory().get('/' + query))
+        serializer = EnrollmentSerializer(context={'request': request, **context})
+        return {
+            name: set(field.fields) if isinstance(field, serializers.BaseSerializer) else None
+            for name, field in serializer.fields.items()
+        }
+
+    def test_parse_field_list(self):
+        self.assertEqual(parse_field_list(None), set())
+        self.assertEqual(parse_field_list(''), set())
+        self.assertEqual(parse_field_list(' id, title ,,course_details.id '), {'id', 'title', 'course_details.id'})
+
+    def test_nested_only_when_expanded(self):
+        fields = self.fields()
+        self.assertIn('course', fields)
+        self.assertNotIn('course_details', fields)
+        self.assertNotIn('student_details', fields)
+
+        fields = self.fields('?expand=course_details')
+        self.assertNotIn('student_details', fields)
+        # One level only, unless named
+        self.assertNotIn('category_details', fields['course_details'])
+        fields = self.fields('?expand=course_details.category_details')
+        self.assertIn('category_details', fields['course_details'])
+        self.assertNotIn('instructor_details', fields['course_details'])
+
+        fields = self.fields('?expand=*')
+        self.assertIn('student_details', fields)
+        self.assertNotIn('category_details', fields['course_details'])
+
+    def test_sparse_fieldsets(self):
+        self.assertEqual(set(self.fields('?fields=id,course')), {'id', 'course'})
+        # Expanded serializers are kept alongside the named fields, whole
+        fields = self.fields('?fields=id&expand=course_details')
+        self.assertEqual(set(fields), {'id', 'course_details'})
+        self.assertIn('title', fields['course_details'])
+        # Unknown names are ignored
+        self.assertEqual(set(self.fields('?fields=id,nope')), {'id'})
+
+    def test_context_overrides_query(self):
+        self.assertEqual(set(self.fields('?fields=id,course', fields='id')), {'id'})
+        self.assertIn('course_details', self.fields('?expand=', expand='course_details'))
+
+    def test_full_without_request(self):
+        fields = EnrollmentSerializer().fields
+        self.assertIn('course_details', fields)
+        self.assertIn('category_details', fields['course_details'].fields)
+
+class EnrollTestCase(TestCase):
+    def setUp(self):
+        # Buckets of this process only, full for every test
+        patcher = mock.patch('core.throttling._store', LocalBucketStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.student = User.objects.create(username='student', role='student')
+        self.course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=Category.objects.create(title='Programming'),
+            instructor=User.objects.create(username='teacher', role='teacher'),
+        )
+        self.client.force_authenticate(self.student)
+
+    def enroll(self, key=None, course=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            '/api/enrollments/enroll/', {'course': course or self.course.pk}, format='json', **headers
+        )
+
+    def enrollment_count(self):
+        return Course.objects.get(pk=self.course.pk).enrollment_count
+
+    def test_duplicate_enroll(self):
+        first = self.enroll()
+        self.assertEqual(first.status_code, 201, first.content)
+        second = self.enroll()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(Enrollment.objects.count(), 1)
+        self.assertEqual(self.enrollment_count(), 1)
+
+    def test_idempotency_key_replay(self):
+        first = self.enroll(key='enroll-1')
+        replayed = self.enroll(key='enroll-1')
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.json(), first.json())
+        self.assertEqual(self.enroll(key='enroll-1', course=self.course.pk + 1).status_code, 422)
+        self.assertEqual(Enrollment.objects.count(), 1)
+
+    def test_reenroll_after_deactivation(self):
+        enrollment_id = self.enroll().json()['id']
+        enrollment = Enrollment.objects.get(pk=enrollment_id)
+        enrollment.is_active = False
+        enrollment.save()
+        self.assertEqual(self.enrollment_count(), 0)
+
+        self.course.price = 15
+        self.course.save()
+        response = self.enroll()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['is_active'])
+        enrollment.refresh_from_db()
+        self.assertTrue(enrollment.is_active)
+        self.assertEqual(enrollment.price, 15)
+        self.assertEqual(self.enrollment_count(), 1)
+        # Access follows at once
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/').json().get('material_count'), 0)
+
+
+class ChunkedUploadTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_root = Path(self.media_root.name)
+        media_settings = override_settings(
+            MEDIA_ROOT=media_root, CHUNKED_UPLOADS={**settings.CHUNKED_UPLOADS, 'TEMP_DIR': media_root / 'uploads'}
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        patcher = mock.patch('core.throttling._store', LocalBucketStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = APIClient()
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=Category.objects.create(title='Programming'), instructor=self.teacher,
+        )
+        self.lesson = Lesson.objects.create(title='Intro', description='Intro', course=course)
+        self.client.force_authenticate(self.teacher)
+        self.content = bytes(range(256)) * 40
+
+    def start(self):
+        response = self.client.post(
+            '/api/uploads/', {'lesson': self.lesson.pk, 'filename': 'intro.mp4', 'size': len(self.content)},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def put(self, session_id, offset, length, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        chunk = self.content[offset:offset + length]
+        if checksum is not None:
+            headers['HTTP_UPLOAD_CHECKSUM'] = 'sha256 ' + base64.b64encode(checksum(chunk)).decode('ascii')
+        return self.client.put(
+            f'/api/uploads/{session_id}/', chunk, content_type='application/octet-stream', **headers
+        )
+
+    def part_path(self, session_id):
+        return os.path.join(self.media_root.name, 'uploads', f'{session_id}.part')
+
+    def test_out_of_order_chunks_and_finalize(self):
+        session_id = self.start()
+        for offset in (8192, 0, 4096):
+            response = self.put(session_id, offset, 4096, checksum=lambda chunk: hashlib.sha256(chunk).digest())
+            self.assertEqual(response.status_code, 200, response.content)
+
+        status = self.client.get(f'/api/uploads/{session_id}/').json()
+        self.assertEqual(status['received'], [[0, 10240]])
+        self.assertEqual(status['offset'], 10240)
+
+        response = self.client.post(f'/api/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.lesson.refresh_from_db()
+        with open(self.lesson.video.path, 'rb') as video:
+            self.assertEqual(video.read(), self.content)
+        self.assertFalse(os.path.exists(self.part_path(session_id)))
+        self.assertEqual(self.client.post(f'/api/uploads/{session_id}/complete/').status_code, 409)
+
+    def test_incomplete_upload(self):
+        session_id = self.start()
+        self.put(session_id, 0, 4096)
+        self.put(session_id, 8192, 2048)
+        response = self.client.post(f'/api/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], [[0, 4096], [8192, 10240]])
+
+    def test_checksum_mismatch(self):
+        session_id = self.start()
+        response = self.put(session_id, 0, 4096, checksum=lambda chunk: hashlib.sha256(b'other').digest())
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(self.client.get(f'/api/uploads/{session_id}/').json()['received'], [])
+        # The retried chunk is accepted
+        self.assertEqual(self.put(session_id, 0, 4096).status_code, 200)
+
+    def test_part_file_removed_with_session(self):
+        aborted = self.start()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/uploads/{aborted}/').status_code, 204)
+        self.assertFalse(os.path.exists(self.part_path(aborted)))
+
+        # Deleting the lesson cascades to its sessions
+        session_id = self.start()
+        self.put(session_id, 0, 4096)
+        self.assertTrue(os.path.exists(self.part_path(session_id)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson.delete()
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(self.part_path(session_id)))
+
+
+class CourseCountersTestCase(TestCase):
+    """Course counters stay exact through saves, deletes and bulk inserts"""
+
+    def setUp(self):
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.student = User.objects.create(username='student', role='student')
+        category = Category.objects.create(title='Programming')
+        self.course, self.other_course = [
+            Course.objects.create(
+                title=title, description=title, price=10, duration=5, is_active=True,
+                category=category, instructor=self.teacher,
+            )
+            for title in ('Python', 'Django')
+        ]
+
+    def assertCounts(self, course, enrollments, lessons, materials, questions):
+        course = Course.objects.get(pk=course.pk)
+        self.assertEqual(
+            (course.enrollment_count, course.lesson_count, course.material_count, course.question_count),
+            (enrollments, lessons, materials, questions),
+        )
+
+    def test_create_update_delete(self):
+        enrollment = Enrollment.objects.create(student=self.student, course=self.course, price=10)
+        lesson = Lesson.objects.create(title='Intro', description='Intro', course=self.course)
+        material = Material.objects.create(title='Slides', description='Slides', file_type='pdf', course=self.course)
+        question = QuestionAnswer.objects.create(user=self.student, lesson=lesson, description='Why?')
+        self.assertCounts(self.course, 1, 1, 1, 1)
+
+        enrollment.is_active = False
+        enrollment.save()
+        material.course = self.other_course
+        material.save()
+        self.assertCounts(self.course, 0, 1, 0, 1)
+        self.assertCounts(self.other_course, 0, 0, 1, 0)
+
+        # Loaded without is_active, so the stored state is read back
+        enrollment = Enrollment.objects.only('id').get(pk=enrollment.pk)
+        enrollment.is_active = True
+        enrollment.save()
+        question.delete()
+        self.assertCounts(self.course, 1, 1, 0, 0)
+
+    def test_cascade_delete(self):
+        lesson = Lesson.objects.create(title='Intro', description='Intro', course=self.course)
+        Lesson.objects.create(title='Next', description='Next', course=self.course)
+        for description in ('Why?', 'How?'):
+            QuestionAnswer.objects.create(user=self.student, lesson=lesson, description=description)
+        self.assertCounts(self.course, 0, 2, 0, 2)
+
+        lesson.delete()
+        self.assertCounts(self.course, 0, 1, 0, 0)
+
+    def test_bulk_create(self):
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        with mock.patch('core.throttling._store', LocalBucketStore()):
+            response = client.post('/api/lessons/bulk/', [
+                {'title': f'Lesson {index}', 'description': 'Lesson', 'course': course.pk}
+                for index, course in enumerate([self.course, self.course, self.other_course])
+            ], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertCounts(self.course, 0, 2, 0, 0)
+        self.assertCounts(self.other_course, 0, 1, 0, 0)
+
+    def test_reconcile_command(self):
+        Lesson.objects.create(title='Intro', description='Intro', course=self.course)
+        Enrollment.objects.create(student=self.student, course=self.course, price=10)
+        Course.objects.filter(pk=self.course.pk).update(lesson_count=7, enrollment_count=0)
+
+        call_command('reconcile_course_counters', dry_run=True, stdout=io.StringIO())
+        self.assertCounts(self.course, 0, 7, 0, 0)
+        output = io.StringIO()
+        call_command('reconcile_course_counters', stdout=output)
+        self.assertIn('Repaired counters on 1 courses', output.getvalue())
+        self.assertCounts(self.course, 1, 1, 0, 0)
+        self.assertCounts(self.other_course, 0, 0, 0, 0)
+
+    def test_reconcile_keeps_updates_made_since_the_scan(self):
+        Course.objects.filter(pk=self.course.pk).update(lesson_count=7)
+        from core.management.commands import reconcile_course_counters
+
+        def enroll_then_recount(course_ids):
+            # An enrollment lands between the scan and the repair
+            Enrollment.objects.create(student=self.student, course=self.course, price=10)
+            recount(course_ids)
+
+        with mock.patch.object(reconcile_course_counters, 'recount', side_effect=enroll_then_recount):
+            call_command('reconcile_course_counters', stdout=io.StringIO())
+        self.assertCounts(self.course, 1, 0, 0, 0)
+
+    def test_questions_follow_moved_lessons(self):
+        lesson = Lesson.objects.create(title='Intro', description='Intro', course=self.course)
+        for description in ('Why?', 'How?'):
+            QuestionAnswer.objects.create(user=self.student, lesson=lesson, description=description)
+        QuestionAnswer.objects.create(user=self.student, lesson=lesson, description='Old', is_active=False)
+
+        lesson.course = self.other_course
+        lesson.save()
+        self.assertCounts(self.course, 0, 0, 0, 0)
+        self.assertCounts(self.other_course, 0, 1, 0, 2)
+
+        # Inactive lessons keep their questions counted
+        lesson = Lesson.objects.only('id', 'course').get(pk=lesson.pk)
+        lesson.course = self.course
+        lesson.is_active = False
+        lesson.save()
+        self.assertCounts(self.course, 0, 0, 0, 2)
+        self.assertCounts(self.other_course, 0, 0, 0, 0)
+
+
+
+class BulkCreateTestCase(TestCase):
+    def setUp(self):
+        for target, value in (('core.throttling._store', LocalBucketStore()), ('core.access._backend', LRUAccessCache())):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.admin = User.objects.create(username='admin', role='admin')
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        other_teacher = User.objects.create(username='other', role='teacher')
+        self.students = [User.objects.create(username=f'student{index}', role='student') for index in range(3)]
+        category = Category.objects.create(title='Programming')
+        self.course, self.other_course = [
+            Course.objects.create(
+                title=title, description=title, price=price, duration=5, is_active=True,
+                category=category, instructor=instructor,
+            )
+            for title, price, instructor in (('Python', 10, self.teacher), ('Java', 20, other_teacher))
+        ]
+
+    def post(self, url, items, user, **params):
+        self.client.force_authenticate(user)
+        query = f'?{"&".join(f"{key}={value}" for key, value in params.items())}' if params else ''
+        return self.client.post(url + query, items, format='json')
+
+    def test_mixed_batch(self):
+        response = self.post('/api/lessons/bulk/', [
+            {'title': 'Intro', 'description': 'Intro', 'course': self.course.pk},
+            {'description': 'No title', 'course': self.course.pk},
+            {'title': 'Unknown course', 'description': 'Lesson', 'course': 999},
+            {'title': 'Not mine', 'description': 'Lesson', 'course': self.other_course.pk},
+            {'title': 'Next', 'description': 'Next', 'course': str(self.course.pk)},
+        ], self.teacher)
+        self.assertEqual(response.status_code, 207, response.content)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (2, 3))
+        self.assertEqual([result['status'] for result in data['results']], [201, 400, 400, 403, 201])
+        self.assertIn('title', data['results'][1]['errors'])
+        self.assertIn('course', data['results'][2]['errors'])
+        self.assertEqual(
+            sorted(Lesson.objects.filter(course=self.course).values_list('pk', flat=True)),
+            [data['results'][0]['id'], data['results'][4]['id']],
+        )
+        self.assertFalse(Lesson.objects.filter(course=self.other_course).exists())
+        self.assertEqual(Course.objects.get(pk=self.course.pk).lesson_count, 2)
+        self.assertEqual(Course.objects.get(pk=self.other_course.pk).lesson_count, 0)
+
+    def test_atomic_and_all_or_nothing_statuses(self):
+        items = [
+            {'title': 'Slides', 'description': 'Slides', 'file_type': 'pdf', 'course': self.course.pk},
+            {'title': 'Not mine', 'description': 'Notes', 'file_type': 'pdf', 'course': self.other_course.pk},
+        ]
+        response = self.post('/api/materials/bulk/', items, self.teacher, atomic='true')
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual([result['status'] for result in response.json()['results']], [424, 403])
+        self.assertFalse(Material.objects.exists())
+
+        response = self.post('/api/materials/bulk/', items[:1] * 2, self.teacher)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Course.objects.get(pk=self.course.pk).material_count, 2)
+
+        response = self.post('/api/materials/bulk/', items[1:], self.teacher)
+        self.assertEqual(response.status_code, 400, response.content)
+
+    def test_request_checks(self):
+        item = {'title': 'Intro', 'description': 'Intro', 'course': self.course.pk}
+        self.assertEqual(self.post('/api/lessons/bulk/', [item], self.students[0]).status_code, 403)
+        self.assertEqual(self.post('/api/enrollments/bulk/', [], self.teacher).status_code, 403)
+        self.assertEqual(self.post('/api/lessons/bulk/', [], self.teacher).status_code, 400)
+        self.assertEqual(self.post('/api/lessons/bulk/', {'items': [item]}, self.teacher).status_code, 201)
+        with override_settings(BULK_MAX_ITEMS=2):
+            self.assertEqual(self.post('/api/lessons/bulk/', [item] * 3, self.teacher).status_code, 400)
+        self.assertEqual(Lesson.objects.count(), 1)
+
+    def test_enrollments(self):
+        first, second, third = self.students
+        Enrollment.objects.create(student=first, course=self.course, price=10)
+        # Cached access decision from before the bulk insert
+        request = APIRequestFactory().get('/')
+        request.user = second
+        self.assertFalse(get_course_access(request, self.course).allowed)
+
+        response = self.post('/api/enrollments/bulk/', [
+            {'student': first.pk, 'course': self.course.pk},
+            {'student': second.pk, 'course': self.course.pk},
+            {'student': second.pk, 'course': self.course.pk},
+            {'student': third.pk, 'course': self.other_course.pk, 'price': 5},
+            {'student': self.teacher.pk, 'course': self.course.pk},
+        ], self.admin)
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual([result['status'] for result in response.json()['results']], [409, 201, 409, 201, 400])
+        self.assertEqual(Enrollment.objects.get(student=second).price, 10)
+        self.assertEqual(Enrollment.objects.get(student=third).price, 5)
+        self.assertEqual(Course.objects.get(pk=self.course.pk).enrollment_count, 2)
+        self.assertEqual(Course.objects.get(pk=self.other_course.pk).enrollment_count, 1)
+
+        request = APIRequestFactory().get('/')
+        request.user = second
+        self.assertTrue(get_course_access(request, Course.objects.get(pk=self.course.pk)).is_enrolled)
+
+def api_response(status=200, data=None, etag=None):
+    response = mock.Mock(status_code=status, headers={'ETag': etag} if etag else {})
+    response.content = json.dumps(data).encode() if data is not None else b''
+    response.json.return_value = data
+    response.raise_for_status.return_value = None
+    return response
+
+
+class ApiClientTestCase(TestCase):
+    def setUp(self):
+        # Lessons expire at once, so they are always revalidated
+        self.cache = ResponseCache(max_entries=3, default_ttl=300, ttls={'courses/lessons/': 0})
+        self.session = mock.Mock()
+        settings_override = override_settings(API_ENABLE_CACHE=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patcher in (
+            mock.patch('core.utils.api_client._response_cache', self.cache),
+            mock.patch('core.utils.api_client.get_session', return_value=self.session),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sent_headers(self, call=-1):
+        return self.session.request.call_args_list[call].kwargs['headers']
+
+    def test_fresh_response_is_served_from_cache(self):
+        self.session.request.return_value = api_response(data={'id': 1, 'tags': []}, etag='"v1"')
+        client = ApiClient()
+        first = client.get_course(1)
+        first['tags'].append('changed')
+        self.assertEqual(client.get_course(1), {'id': 1, 'tags': []})
+        self.assertEqual(self.session.request.call_count, 1)
+
+    def test_cache_is_keyed_by_token_and_params(self):
+        self.session.request.return_value = api_response(data=[])
+        ApiClient().get_courses(category=1)
+        ApiClient().get_courses(category=2)
+        client = ApiClient()
+        client.headers['Authorization'] = 'Bearer other'
+        client.get_courses(category=1)
+        self.assertEqual(self.session.request.call_count, 3)
+
+    def test_expired_response_is_revalidated(self):
+        self.session.request.return_value = api_response(data=[{'id': 1}], etag='"v1"')
+        client = ApiClient()
+        client.get_lessons(course=1)
+        self.assertNotIn('If-None-Match', self.sent_headers())
+
+        self.session.request.return_value = api_response(status=304)
+        self.assertEqual(client.get_lessons(course=1), [{'id': 1}])
+        self.assertEqual(self.sent_headers()['If-None-Match'], '"v1"')
+        # The client's own headers are left alone
+        self.assertNotIn('If-None-Match', client.headers)
+
+        self.session.request.return_value = api_response(data=[{'id': 2}], etag='"v2"')
+        self.assertEqual(client.get_lessons(course=1), [{'id': 2}])
+        self.session.request.return_value = api_response(status=304)
+        client.get_lessons(course=1)
+        self.assertEqual(self.sent_headers()['If-None-Match'], '"v2"')
+
+    def test_not_modified_refreshes_the_entry(self):
+        self.session.request.return_value = api_response(data={'id': 1}, etag='"v1"')
+        client = ApiClient()
+        client.get_course(1)
+        key = (None, 'courses/courses/1/', ())
+        self.cache.get(key).expires_at = time.monotonic() - 1
+
+        self.session.request.return_value = api_response(status=304)
+        self.assertEqual(client.get_course(1), {'id': 1})
+        self.assertTrue(self.cache.get(key).is_fresh)
+        client.get_course(1)
+        self.assertEqual(self.session.request.call_count, 2)
+
+    def test_expired_response_without_etag_is_downloaded(self):
+        self.session.request.return_value = api_response(data=[{'id': 1}])
+        client = ApiClient()
+        client.get_lessons()
+        client.get_lessons()
+        self.assertEqual(self.session.request.call_count, 2)
+        self.assertNotIn('If-None-Match', self.sent_headers())
+
+    def test_writes_drop_the_resource_and_its_dependents(self):
+        self.session.request.return_value = api_response(data={'id': 1})
+        client = ApiClient()
+        client.get_course(1)
+        client.get_materials(course=1)
+        client.get_categories()
+        client.update_course(1, {'title': 'Python'})
+        self.assertIsNone(self.cache.get((None, 'courses/courses/1/', ())))
+        self.assertIsNone(self.cache.get((None, 'courses/materials/', (('course', 1),))))
+        self.assertIsNotNone(self.cache.get((None, 'courses/categories/', ())))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.session.request.return_value = api_response(data={})
+        client = ApiClient()
+        for course in (1, 2, 3):
+            client.get_course(course)
+        client.get_course(1)
+        client.get_course(4)
+        self.assertIsNone(self.cache.get((None, 'courses/courses/2/', ())))
+        self.assertIsNotNone(self.cache.get((None, 'courses/courses/1/', ())))
+
+    def test_errors_are_not_cached(self):
+        error = api_response(status=500)
+        error.raise_for_status.side_effect = requests.HTTPError('500')
+        self.session.request.return_value = error
+        client = ApiClient()
+        with self.assertRaises(requests.HTTPError):
+            client.get_course(1)
+        self.assertIsNone(self.cache.get((None, 'courses/courses/1/', ())))
+
+    def test_nested_batches_do_not_deadlock(self):
+        def make_request(client, method, endpoint, data=None, params=None):
+            if endpoint.startswith('/courses/lessons/'):
+                return [{'id': 1}, {'id': 2}]
+            return {'endpoint': endpoint, 'params': params}
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        with mock.patch('core.utils.api_client._executor', executor), \
+                mock.patch.object(ApiClient, '_make_request', make_request):
+            # More bundles than pool threads, each fanning out again
+            future = ThreadPoolExecutor(max_workers=1).submit(
+                ApiClient().batch, [('get_course_bundle', (course,)) for course in range(4)]
+            )
+            bundles = future.result(timeout=10)
+        self.assertEqual(len(bundles), 4)
+        self.assertEqual(bundles[3]['course']['endpoint'], '/courses/courses/3/')
+        self.assertEqual(sorted(bundles[3]['questions']), [1, 2])
+
+
+class ServerTimingTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create(username='admin', role='admin')
+        self.student = User.objects.create(username='student', role='student')
+
+    def test_only_admins_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/categories/'))
+        self.client.force_authenticate(self.student)
+        self.assertNotIn('Server-Timing', self.client.get('/api/categories/'))
+        self.client.force_authenticate(self.admin)
+        self.assertIn('db;dur=', self.client.get('/api/categories/')['Server-Timing'])
+
+    def test_everyone_when_enabled(self):
+        with override_settings(PERFORMANCE_METRICS={**settings.PERFORMANCE_METRICS, 'SERVER_TIMING': True}):
+            self.assertIn('Server-Timing', self.client.get('/api/categories/'))
+
+
+class RendererTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create(username='admin', role='admin')
+        teacher = User.objects.create(username='teacher', role='teacher')
+        student = User.objects.create(username='student', role='student')
+        course = Course.objects.create(
+            title='Line\u2028and paragraph\u2029separators', description='Caf\u00e9 \u2014 \U0001f600', price=10.25,
+            duration=1.5, is_active=True, category=Category.objects.create(title='Programming'), instructor=teacher,
+        )
+        Enrollment.objects.create(student=student, course=course, price=10.25)
+        # Authenticated, so responses do not come from the catalog cache
+        self.client.force_authenticate(self.admin)
+
+    def test_matches_json_renderer(self):
+        data = {'title': 'a\u2028b\u2029c', 'price': 10.25, 'when': timezone.now(), 'missing': None}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertIn(b'\\u2028', ORJSONRenderer().render(data))
+
+    def test_non_finite_floats(self):
+        data = {'results': [{'price': float('nan')}]}
+        # STRICT_JSON
+        with self.assertRaises(ValueError):
+            ORJSONRenderer().render(data)
+
+        class LaxRenderer(ORJSONRenderer):
+            strict = False
+        self.assertEqual(LaxRenderer().render(data), b'{"results":[{"price":NaN}]}')
+
+    def test_fast_path_matches_serializers(self):
+        for url, params in [
+            ('/api/courses/', {}),
+            ('/api/courses/', {'expand': '*'}),
+            ('/api/enrollments/', {}),
+        ]:
+            with mock.patch.object(ValuesRowBuilder, 'build', autospec=True, side_effect=ValuesRowBuilder.build) as build:
+                fast = self.client.get(url, params)
+            with override_settings(API_FAST_SERIALIZATION=False):
+                slow = self.client.get(url, params)
+            self.assertEqual(fast.status_code, 200, fast.content)
+            self.assertEqual(fast.content, slow.content, (url, params))
+            if not params:
+                self.assertEqual(build.call_count, 1, url)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTestCase(TestCase):
+    """The middleware only picks the alias; views here stand in for queries"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.router = ReplicaRouter()
+        self.routes = []
+
+        def view(request):
+            state = _state.get()
+            # Outside the test's transaction, as in a request
+            with mock.patch.object(connection, 'in_atomic_block', False):
+                self.routes.append(self.router.db_for_read(Course))
+                if request.method == 'POST':
+                    self.router.db_for_write(Course)
+                    self.routes.append(self.router.db_for_read(Course))
+            self.assertIsNotNone(state)
+            return HttpResponse()
+
+        self.middleware = ReplicaRoutingMiddleware(view)
+        cache = LocMemCache('replica-pins', {})
+        patcher = mock.patch('core.replicas.get_cache', return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_routing(self):
+        self.middleware(self.factory.get('/api/courses/'))
+        self.assertIn(self.routes[-1], ['replica1', 'replica2'])
+        # Not an API path, or reads after a write
+        self.middleware(self.factory.get('/admin/'))
+        self.assertEqual(self.routes[-1], 'default')
+        self.middleware(self.factory.post('/api/enrollments/enroll/'))
+        self.assertEqual(self.routes[-2:], ['default', 'default'])
+        # Outside requests
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+
+    def test_writes_pin_the_client(self):
+        response = self.middleware(self.factory.post('/api/enrollments/enroll/', HTTP_AUTHORIZATION='Bearer a'))
+        pin = response[PIN_HEADER]
+        self.assertEqual(response.cookies[PIN_COOKIE].value, pin)
+
+        # By header, cookie, or the cache entry of the credential
+        self.middleware(self.factory.get('/api/courses/', HTTP_DB_PIN=pin))
+        self.assertEqual(self.routes[-1], 'default')
+        request = self.factory.get('/api/courses/')
+        request.COOKIES[PIN_COOKIE] = pin
+        self.middleware(request)
+        self.assertEqual(self.routes[-1], 'default')
+        self.middleware(self.factory.get('/api/courses/', HTTP_AUTHORIZATION='Bearer a'))
+        self.assertEqual(self.routes[-1], 'default')
+
+        # Other clients and forged pins still read from replicas
+        self.middleware(self.factory.get('/api/courses/', HTTP_AUTHORIZATION='Bearer b'))
+        self.assertNotEqual(self.routes[-1], 'default')
+        self.middleware(self.factory.get('/api/courses/', HTTP_DB_PIN='1'))
+        self.assertNotEqual(self.routes[-1], 'default')
+
+    def test_pins_expire(self):
+        pin = self.middleware(self.factory.post('/api/enrollments/enroll/'))[PIN_HEADER]
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 6):
+            self.middleware(self.factory.get('/api/courses/', HTTP_DB_PIN=pin))
+        self.assertNotEqual(self.routes[-1], 'default')
+
+    def test_pin_cache_check(self):
+        self.assertEqual([warning.id for warning in check_pin_cache(None)], ['core.W001'])
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(check_pin_cache(None), [])
+
+
+class AsyncReadViewsTestCase(TransactionTestCase):
+    """
+    The async read views answer like the sync ones. Transactional, since
+    run_query reads through other connections than the test's.
+    """
+
+    def setUp(self):
+        patcher = mock.patch('core.throttling._store', LocalBucketStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.teacher = User.objects.create(username='teacher', role='teacher')
+        self.other_teacher = User.objects.create(username='other', role='teacher')
+        self.student = User.objects.create(username='student', role='student')
+        self.outsider = User.objects.create(username='outsider', role='student')
+        category = Category.objects.create(title='Programming')
+        self.course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=category, instructor=self.teacher,
+        )
+        self.other_course = Course.objects.create(
+            title='Java', description='Java course', price=10, duration=5, is_active=True,
+            category=category, instructor=self.other_teacher,
+        )
+        Lesson.objects.create(title='Intro', description='Intro', course=self.course)
+        Enrollment.objects.create(student=self.student, course=self.course, price=10)
+
+    def authorization(self, user):
+        if user is None:
+            return {}
+        return {'Authorization': f'Bearer {add_token_claims(AccessToken.for_user(user), user)}'}
+
+    def use_async_views(self, enabled):
+        with override_settings(ASYNC_READ_VIEWS=enabled):
+            import core.urls
+            import lms_backend.urls
+            importlib.reload(core.urls)
+            importlib.reload(lms_backend.urls)
+            clear_url_caches()
+
+    def test_parity_with_sync_views(self):
+        cases = [
+            (None, '/api/courses/', {}),
+            (self.teacher, '/api/courses/', {'expand': '*'}),
+            (None, f'/api/courses/{self.course.pk}/', {}),
+            (self.student, f'/api/courses/{self.course.pk}/', {}),
+            (None, '/api/courses/999/', {}),
+            (self.student, '/api/lessons/', {'course': self.course.pk}),
+            (self.outsider, '/api/lessons/', {'course': self.course.pk}),
+            (self.teacher, '/api/lessons/', {'course': self.course.pk}),
+            (self.student, '/api/lessons/', {'course': 999}),
+            (self.student, '/api/lessons/', {}),
+            (self.student, '/api/enrollments/', {}),
+            (self.teacher, '/api/enrollments/', {'course': self.course.pk}),
+            (self.teacher, '/api/enrollments/', {'course': self.other_course.pk}),
+            (self.teacher, '/api/enrollments/', {'course': 999}),
+            (None, '/api/enrollments/', {}),
+        ]
+        expected = {
+            ('/api/courses/999/', 404), ('/api/lessons/', 403), ('/api/lessons/', 404), ('/api/lessons/', 400),
+            ('/api/enrollments/', 403), ('/api/enrollments/', 404), ('/api/enrollments/', 401),
+        }
+
+        def requests(client):
+            responses = []
+            for user, url, params in cases:
+                # Anonymous lists would come from the catalog cache
+                get_catalog_cache().clear()
+                response = client.get(url, params, headers=self.authorization(user))
+                responses.append((response.status_code, json.loads(response.content)))
+            return responses
+
+        sync_responses = requests(APIClient())
+        self.use_async_views(True)
+        self.addCleanup(self.use_async_views, False)
+        self.assertIs(resolve('/api/courses/').func, async_views.course_list_create)
+        async_responses = requests(SyncAsyncClient(AsyncClient()))
+
+        statuses = set()
+        for (user, url, params), sync_response, async_response in zip(cases, sync_responses, async_responses):
+            self.assertEqual(async_response, sync_response, (user, url, params))
+            statuses.add((url, sync_response[0]))
+        self.assertTrue(expected <= statuses, expected - statuses)
+
+
+class SyncAsyncClient:
+    """Calls an AsyncClient from sync test code"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, *args, **kwargs):
+        return async_to_sync(self.client.get)(*args, **kwargs)
+
+
+class BannerVariantTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_settings = override_settings(
+            MEDIA_ROOT=Path(self.media_root.name),
+            BANNER_VARIANTS={**settings.BANNER_VARIANTS, 'CACHE_DIR': Path(self.media_root.name, 'banner_cache')},
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.client = APIClient()
+        self.course = Course.objects.create(
+            title='Python', description='Python course', banner=self.write_banner('python.jpeg'),
+            price=10, duration=5, is_active=True, category=Category.objects.create(title='Programming'),
+            instructor=User.objects.create(username='teacher', role='teacher'),
+        )
+
+    def write_banner(self, name, size=(800, 400), color='red'):
+        os.makedirs(os.path.join(self.media_root.name, 'course_banners'), exist_ok=True)
+        PILImage.new('RGB', size, color).save(os.path.join(self.media_root.name, 'course_banners', name), 'JPEG')
+        return f'course_banners/{name}'
+
+    def get_variant(self, width, fmt):
+        with mock.patch('core.images.render_variant', wraps=images.render_variant) as render:
+            response = self.client.get(f'/api/courses/{self.course.pk}/banner/{width}.{fmt}')
+        return response, render.call_count
+
+    def decode(self, response):
+        return PILImage.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_cache_miss_then_hit(self):
+        response, renders = self.get_variant(320, 'webp')
+        self.assertEqual((response.status_code, renders), (200, 1))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.decode(response).size, (320, 160))
+        response, renders = self.get_variant(320, 'webp')
+        self.assertEqual((response.status_code, renders), (200, 0))
+        # Never upscaled
+        self.assertEqual(self.decode(self.get_variant(1280, 'webp')[0]).size, (800, 400))
+
+    def test_formats(self):
+        for fmt, pillow_format in (('webp', 'WEBP'), ('avif', 'AVIF')):
+            response, _ = self.get_variant(640, fmt)
+            self.assertEqual(response['Content-Type'], f'image/{fmt}')
+            self.assertEqual(self.decode(response).format, pillow_format)
+        variants = self.client.get(f'/api/courses/{self.course.pk}/').json()['banner_variants']
+        self.assertEqual(set(variants), {'avif', 'webp'})
+        self.assertEqual(set(variants['webp']), {'320', '640', '960', '1280'})
+        # Only the configured widths and formats
+        self.assertEqual(self.get_variant(500, 'webp')[0].status_code, 404)
+        self.assertEqual(self.get_variant(640, 'png')[0].status_code, 404)
+
+    def test_new_banner_gives_new_variants(self):
+        url = self.client.get(f'/api/courses/{self.course.pk}/').json()['banner_variants']['webp']['320']
+        self.get_variant(320, 'webp')
+
+        self.course.banner = self.write_banner('django.jpeg', size=(640, 640), color='blue')
+        self.course.save()
+        self.assertNotEqual(self.client.get(f'/api/courses/{self.course.pk}/').json()['banner_variants']['webp']['320'], url)
+        response, renders = self.get_variant(320, 'webp')
+        self.assertEqual((renders, self.decode(response).size), (1, (320, 320)))
+
+        # Replaced under the same name
+        self.write_banner('django.jpeg', size=(640, 320))
+        os.utime(self.course.banner.path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+        response, renders = self.get_variant(320, 'webp')
+        self.assertEqual((renders, self.decode(response).size), (1, (320, 160)))
+
+    def test_unreadable_banner(self):
+        with open(self.course.banner.path, 'wb') as f:
+            f.write(b'not an image')
+        response, _ = self.get_variant(320, 'webp')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['detail'], 'Banner is not a readable image')
+
+
+VIDEO_OPTIONS = {
+    **video.get_video_settings(),
+    'FFMPEG': 'ffmpeg',
+    'FFPROBE': 'ffprobe',
+    'RENDITIONS': [(1080, '5000k', '192k'), (720, '2800k', '128k'), (360, '800k', '96k')],
+    'SEGMENT_SECONDS': 6,
+    'THUMBNAIL_WIDTH': 640,
+}
+
+
+def probe_output(height=720, duration='42.5', audio=True):
+    streams = [{'codec_type': 'video', 'height': height}]
+    if audio:
+        streams.append({'codec_type': 'audio'})
+    return json.dumps({'streams': streams, 'format': {'duration': duration}}).encode()
+
+
+def fake_ffmpeg(probe=None, fail=None):
+    """subprocess.run stand-in answering ffprobe with `probe` and failing the commands `fail` matches"""
+    def run(command, **kwargs):
+        if command[0] == 'ffprobe':
+            return subprocess.CompletedProcess(command, 0, probe or probe_output(), b'')
+        if fail and fail(command):
+            raise subprocess.CalledProcessError(1, command, b'', b'frame=1\nInvalid data found\n')
+        return subprocess.CompletedProcess(command, 0, b'', b'')
+    return run
+
+
+class TranscodeTestCase(TestCase):
+    def test_probe_reads_height_duration_and_audio(self):
+        with mock.patch('core.transcode.subprocess.run', side_effect=fake_ffmpeg()) as run:
+            self.assertEqual(transcode.probe('in.mp4', VIDEO_OPTIONS), (720, 42.5, True))
+        self.assertEqual(run.call_args.args[0][0], 'ffprobe')
+        self.assertEqual(run.call_args.args[0][-1], 'in.mp4')
+
+        with mock.patch('core.transcode.subprocess.run', side_effect=fake_ffmpeg(probe_output(audio=False, duration=''))):
+            self.assertEqual(transcode.probe('in.mp4', VIDEO_OPTIONS), (720, 0, False))
+
+    def test_probe_rejects_unreadable_files(self):
+        outputs = (
+            subprocess.CalledProcessError(1, ['ffprobe'], b'', b'moov atom not found'),
+            subprocess.TimeoutExpired(['ffprobe'], 60),
+            subprocess.CompletedProcess(['ffprobe'], 0, b'not json', b''),
+            subprocess.CompletedProcess(['ffprobe'], 0, json.dumps({'streams': [{'codec_type': 'audio'}]}).encode(), b''),
+        )
+        for output in outputs:
+            with self.subTest(output=output), \
+                    mock.patch('core.transcode.subprocess.run', side_effect=[output]), \
+                    self.assertRaises(transcode.TranscodeError):
+                transcode.probe('in.mp4', VIDEO_OPTIONS)
+
+    def test_renditions_never_upscale(self):
+        renditions = VIDEO_OPTIONS['RENDITIONS']
+        self.assertEqual([rung[0] for rung in transcode.select_renditions(renditions, 720)], [720, 360])
+        self.assertEqual([rung[0] for rung in transcode.select_renditions(renditions, 2160)], [1080, 720, 360])
+        # Tiny sources still get the smallest rung
+        self.assertEqual(transcode.select_renditions(renditions, 240), [(360, '800k', '96k')])
+
+    def test_hls_command_encodes_every_rung_in_one_pass(self):
+        renditions = [(720, '2800k', '128k'), (360, '800k', '96k')]
+        command = transcode.hls_command('in.mp4', '/out', renditions, True, VIDEO_OPTIONS)
+        self.assertEqual(command[:6], ['ffmpeg', '-y', '-v', 'error', '-i', 'in.mp4'])
+        self.assertEqual(command.count('-i'), 1)
+        self.assertEqual(
+            command[command.index('-filter_complex') + 1],
+            '[0:v]split=2[s0][s1];[s0]scale=-2:720[v0];[s1]scale=-2:360[v1]',
+        )
+        self.assertEqual(command[command.index('-b:v:1') + 1], '800k')
+        self.assertEqual(command[command.index('-b:a:0') + 1], '128k')
+        self.assertEqual(command.count('a:0'), 2)
+        self.assertEqual(command[command.index('-force_key_frames') + 1], 'expr:gte(t,n_forced*6)')
+        self.assertEqual(command[command.index('-hls_time') + 1], '6')
+        self.assertEqual(command[command.index('-var_stream_map') + 1], 'v:0,a:0,name:720p v:1,a:1,name:360p')
+        self.assertEqual(command[-1], os.path.join('/out', '%v', 'index.m3u8'))
+
+        command = transcode.hls_command('in.mp4', '/out', renditions, False, VIDEO_OPTIONS)
+        self.assertNotIn('a:0', command)
+        self.assertNotIn('-c:a:0', command)
+        self.assertEqual(command[command.index('-var_stream_map') + 1], 'v:0,name:720p v:1,name:360p')
+
+    def test_thumbnail_is_taken_a_little_into_the_video(self):
+        command = transcode.thumbnail_command('in.mp4', '/out/poster.jpg', 42.5, VIDEO_OPTIONS)
+        self.assertEqual(command[command.index('-ss') + 1], '4.25')
+        self.assertEqual(command[command.index('-vf') + 1], 'scale=640:-2')
+        self.assertEqual(command[-1], '/out/poster.jpg')
+        command = transcode.thumbnail_command('in.mp4', '/out/poster.jpg', 3600, VIDEO_OPTIONS)
+        self.assertEqual(command[command.index('-ss') + 1], '10.00')
+
+    def test_failures_carry_the_end_of_stderr(self):
+        with mock.patch('core.transcode.subprocess.run', side_effect=fake_ffmpeg(fail=lambda command: True)), \
+                self.assertRaisesMessage(transcode.TranscodeError, 'frame=1\nInvalid data found'):
+            transcode.run(['ffmpeg', '-i', 'in.mp4'], 10)
+
+        error = subprocess.CalledProcessError(3, ['ffmpeg'], b'', b'')
+        with mock.patch('core.transcode.subprocess.run', side_effect=error), \
+                self.assertRaisesMessage(transcode.TranscodeError, 'ffmpeg exited with 3'):
+            transcode.run(['ffmpeg'], 10)
+
+        with mock.patch('core.transcode.subprocess.run', side_effect=subprocess.TimeoutExpired(['ffmpeg'], 10)), \
+                self.assertRaisesMessage(transcode.TranscodeError, 'ffmpeg timed out after 10 seconds'):
+            transcode.run(['ffmpeg'], 10)
+
+    def test_process_video_runs_ladder_then_poster(self):
+        with tempfile.TemporaryDirectory() as root:
+            output_dir = os.path.join(root, 'stream')
+            with mock.patch('core.transcode.subprocess.run', side_effect=fake_ffmpeg()) as run:
+                result = transcode.process_video('in.mp4', output_dir, VIDEO_OPTIONS)
+            self.assertTrue(os.path.isdir(output_dir))
+
+        self.assertEqual(result, {
+            'manifest': 'master.m3u8', 'thumbnail': 'poster.jpg', 'renditions': [720, 360], 'duration': 42.5,
+        })
+        commands = [call.args[0] for call in run.call_args_list]
+        self.assertEqual([command[0] for command in commands], ['ffprobe', 'ffmpeg', 'ffmpeg'])
+        self.assertIn('-var_stream_map', commands[1])
+        self.assertEqual(run.call_args_list[1].kwargs['timeout'], VIDEO_OPTIONS['TIMEOUT'])
+        self.assertEqual(commands[2][-1], os.path.join(output_dir, 'poster.jpg'))
+
+    def test_failed_processing_removes_its_output(self):
+        with tempfile.TemporaryDirectory() as root:
+            output_dir = os.path.join(root, 'stream')
+            run = fake_ffmpeg(fail=lambda command: '-frames:v' in command)
+            with mock.patch('core.transcode.subprocess.run', side_effect=run), \
+                    self.assertRaises(transcode.TranscodeError):
+                transcode.process_video('in.mp4', output_dir, VIDEO_OPTIONS)
+            self.assertFalse(os.path.exists(output_dir))
+
+
+class VideoProcessingTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=Path(self.media_root.name))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        # Database connections belong to the test case's transaction
+        for patcher in (
+            mock.patch('core.video.close_old_connections'),
+            mock.patch('core.video._executor', None),
+            mock.patch('core.video.shutil.which', return_value='/usr/bin/ffmpeg'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=Category.objects.create(title='Programming'),
+            instructor=User.objects.create(username='teacher', role='teacher'),
+        )
+        self.lesson = Lesson.objects.create(
+            title='Intro', description='Intro', video='lesson_videoes/intro.mp4', course=course
+        )
+
+    def test_pool_spawns_its_workers(self):
+        with override_settings(VIDEO_PROCESSING={**settings.VIDEO_PROCESSING, 'WORKERS': 3}), \
+                mock.patch('core.video.ProcessPoolExecutor') as pool:
+            executor = video.get_executor()
+            self.assertIs(video.get_executor(), executor)
+        pool.assert_called_once()
+        self.assertEqual(pool.call_args.kwargs['max_workers'], 3)
+        self.assertEqual(pool.call_args.kwargs['mp_context'].get_start_method(), 'spawn')
+
+    def test_saving_a_video_queues_it_after_commit(self):
+        self.assertEqual(self.lesson.processing_status, 'pending')
+        with mock.patch('core.video.enqueue_lesson') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.lesson.title = 'Introduction'
+                self.lesson.save()
+            enqueue.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.lesson.video = 'lesson_videoes/intro-v2.mp4'
+                self.lesson.save(update_fields=['title'])
+            enqueue.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.lesson.save()
+        enqueue.assert_called_once_with(self.lesson.pk)
+
+    def submit(self):
+        executor = mock.Mock()
+        future = Future()
+        executor.submit.return_value = future
+        with mock.patch('core.video.get_executor', return_value=executor):
+            self.assertIs(video.enqueue_lesson(self.lesson.pk), future)
+        func, source, output_dir, options = executor.submit.call_args.args
+        self.assertIs(func, transcode.process_video)
+        self.assertEqual(source, self.lesson.video.path)
+        return future, output_dir
+
+    def test_result_is_recorded_on_the_lesson(self):
+        future, output_dir = self.submit()
+        relative_dir = os.path.relpath(output_dir, self.media_root.name)
+        self.assertTrue(relative_dir.startswith(os.path.join('lesson_streams', str(self.lesson.pk))))
+        future.set_result({'manifest': 'master.m3u8', 'thumbnail': 'poster.jpg'})
+
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.processing_status, 'ready')
+        self.assertEqual(self.lesson.stream_manifest.name, os.path.join(relative_dir, 'master.m3u8'))
+        self.assertEqual(self.lesson.thumbnail.name, os.path.join(relative_dir, 'poster.jpg'))
+
+    def test_new_ladder_replaces_the_old_one(self):
+        old_dir = os.path.join(self.media_root.name, 'lesson_streams', 'old')
+        os.makedirs(old_dir)
+        Lesson.objects.filter(pk=self.lesson.pk).update(stream_manifest='lesson_streams/old/master.m3u8')
+        future, output_dir = self.submit()
+        os.makedirs(output_dir)
+        future.set_result({'manifest': 'master.m3u8', 'thumbnail': 'poster.jpg'})
+        self.assertFalse(os.path.exists(old_dir))
+        self.assertTrue(os.path.exists(output_dir))
+
+    def test_result_for_a_replaced_video_is_dropped(self):
+        future, output_dir = self.submit()
+        os.makedirs(output_dir)
+        Lesson.objects.filter(pk=self.lesson.pk).update(video='lesson_videoes/intro-v2.mp4')
+        future.set_result({'manifest': 'master.m3u8', 'thumbnail': 'poster.jpg'})
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.stream_manifest.name, '')
+        self.assertFalse(os.path.exists(output_dir))
+
+    def test_failure_is_recorded_on_the_lesson(self):
+        future, _ = self.submit()
+        with self.assertLogs('core.video', 'WARNING'):
+            future.set_exception(transcode.TranscodeError('Invalid data found'))
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.processing_status, 'failed')
+        self.assertEqual(self.lesson.processing_error, 'Invalid data found')
+
+    def test_missing_ffmpeg_fails_without_queueing(self):
+        with mock.patch('core.video.shutil.which', return_value=None), \
+                mock.patch('core.video.get_executor') as get_executor, \
+                self.assertLogs('core.video', 'WARNING'):
+            self.assertIsNone(video.enqueue_lesson(self.lesson.pk))
+        get_executor.assert_not_called()
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.processing_status, 'failed')
+        self.assertEqual(self.lesson.processing_error, 'ffmpeg is not installed')
+
+    def test_broken_pool_is_replaced(self):
+        broken, working = mock.Mock(), mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool('A child process terminated abruptly')
+        working.submit.return_value = Future()
+        with mock.patch('core.video.ProcessPoolExecutor', side_effect=[broken, working]):
+            future = video.enqueue_lesson(self.lesson.pk)
+        self.assertIs(future, working.submit.return_value)
+        self.assertIs(video._executor, working)
+
+        # A worker dying mid-job also drops the pool
+        with self.assertLogs('core.video', 'WARNING'):
+            future.set_exception(BrokenProcessPool('A child process terminated abruptly'))
+        self.assertIsNone(video._executor)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.processing_status, 'failed')
+
+    def test_process_lesson_runs_in_this_process(self):
+        with mock.patch('core.transcode.subprocess.run', side_effect=fake_ffmpeg()):
+            video.process_lesson(self.lesson)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.processing_status, 'ready')
+        self.assertTrue(self.lesson.stream_manifest.name.endswith('master.m3u8'))
+
+        with mock.patch('core.transcode.subprocess.run', side_effect=fake_ffmpeg(fail=lambda command: True)), \
+                self.assertLogs('core.video', 'WARNING'):
+            video.process_lesson(self.lesson)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.processing_status, 'failed')
+        self.assertIn('Invalid data found', self.lesson.processing_error)
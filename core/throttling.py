@@ -0,0 +1,329 @@
+import hashlib
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+def _bucket_state(tokens, updated, now, rate, capacity, cost):
+    """Refill a bucket up to `now` and take `cost` from it: (tokens, wait)"""
+    if updated is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0
+    return tokens, (cost - tokens) / rate
+
+
+# ==================== BUCKET STORES ====================
+
+class LocalBucketStore:
+    """
+    Buckets in a dict of the current process. Every worker process gets
+    its own allowance, so use SharedMemoryBucketStore with several workers.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, capacity, cost=1):
+        """Take `cost` tokens; return 0, or the seconds until they are there"""
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (None, None))
+            tokens, wait = _bucket_state(tokens, updated, now, rate, capacity, cost)
+            if key not in self._buckets and len(self._buckets) >= self.max_entries:
+                # Forgetting a bucket only ever refills it
+                self._buckets.pop(next(iter(self._buckets)))
+            self._buckets[key] = (tokens, now)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SharedMemoryBucketStore:
+    """
+    Buckets in a memory-mapped file (on /dev/shm when it exists) that every
+    worker process on the host maps, so a client's allowance is shared
+    between them. The file is a fixed set-associative table: a key hashes
+    to a set of `ways` slots, locked across processes with an fcntl byte
+    range lock. When a set is full its least recently used bucket is
+    reused, which can only make a client's bucket full again.
+    """
+    slot = struct.Struct('<Qdd')  # key hash, tokens, last update
+
+    def __init__(self, path=None, sets=16384, ways=4):
+        if path is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            project = hashlib.sha1(str(settings.BASE_DIR).encode('utf-8')).hexdigest()[:12]
+            path = os.path.join(directory, f'lms-throttle-{project}')
+        self.path = path
+        self.sets = sets
+        self.ways = ways
+        self.set_size = self.slot.size * ways
+        self._lock = threading.Lock()
+        self._map = None
+        self._pid = None
+
+    def _open(self):
+        # Mapped lazily and again after a fork, so the fcntl locks belong
+        # to the process using them
+        if self._map is None or self._pid != os.getpid():
+            size = self.sets * self.set_size
+            self._file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b')
+            if os.fstat(self._file.fileno()).st_size < size:
+                os.ftruncate(self._file.fileno(), size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+            self._pid = os.getpid()
+        return self._map
+
+    def consume(self, key, rate, capacity, cost=1):
+        import fcntl
+
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        offset = (digest % self.sets) * self.set_size
+        now = time.time()
+        # fcntl locks are held per process, so threads take turns first
+        with self._lock:
+            table = self._open()
+            fcntl.lockf(self._file, fcntl.LOCK_EX, self.set_size, offset)
+            try:
+                slots = [self.slot.unpack_from(table, offset + way * self.slot.size) for way in range(self.ways)]
+                for way, (owner, tokens, updated) in enumerate(slots):
+                    if owner == digest:
+                        break
+                else:
+                    # Empty slots have never been updated, so are reused first
+                    way = min(range(self.ways), key=lambda index: slots[index][2])
+                    tokens, updated = None, None
+                tokens, wait = _bucket_state(tokens, updated, now, rate, capacity, cost)
+                self.slot.pack_into(table, offset + way * self.slot.size, digest, tokens, now)
+            finally:
+                fcntl.lockf(self._file, fcntl.LOCK_UN, self.set_size, offset)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            table = self._open()
+            table[:] = bytes(len(table))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """Return the shared bucket store configured by THROTTLE_STORE"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'THROTTLE_STORE', {})
+                store_class = import_string(config.get('BACKEND', 'core.throttling.LocalBucketStore'))
+                _store = store_class(**config.get('OPTIONS', {}))
+    return _store
+
+# ==================== THROTTLES ====================
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per user (per client IP when anonymous) for one scope.
+    Rates use DEFAULT_THROTTLE_RATES' 'number/period' format: the bucket
+    holds `number` requests, its burst, and refills at number/period.
+    """
+    scope = None
+    # Methods the bucket applies to; None for all of them
+    methods = None
+    durations = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+    def __init__(self):
+        self._wait = None
+
+    def parse_rate(self):
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if rate is None:
+            return None
+        number, period = rate.split('/')
+        return int(number), self.durations[period[0]]
+
+    def get_key(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'{self.scope}:user:{user.pk}'
+        return f'{self.scope}:ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        if self.methods is not None and request.method not in self.methods:
+            return True
+        rate = self.parse_rate()
+        if rate is None:
+            return True
+        number, period = rate
+        self._wait = get_bucket_store().consume(self.get_key(request), number / period, number)
+        return self._wait == 0
+
+    def wait(self):
+        return self._wait
+
+
+class WriteRateThrottle(TokenBucketThrottle):
+    """Every unsafe request, per user or IP"""
+    scope = 'write'
+    methods = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class AuthRateThrottle(TokenBucketThrottle):
+    """Logins, registrations and password resets, always per IP"""
+    scope = 'auth'
+    methods = ('POST',)
+
+    def get_key(self, request):
+        return f'{self.scope}:ip:{self.get_ident(request)}'
+
+
+class EnrollRateThrottle(TokenBucketThrottle):
+    """Enrollments, per student"""
+    scope = 'enroll'
+    methods = ('POST',)
+
+# ==================== LOAD SHEDDING ====================
+
+class PriorityGate:
+    """
+    Lets at most `limit` callers in at once. Waiters are let in by
+    priority (lower first), then in arrival order; past `max_waiting`
+    waiters, or after `timeout` seconds, acquire() gives up.
+    """
+
+    def __init__(self, limit, max_waiting):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.active = 0
+        self._waiters = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority, timeout):
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+            if len(self._waiters) >= self.max_waiting:
+                return False
+            entry = [priority, next(self._order), threading.Event()]
+            heapq.heappush(self._waiters, entry)
+
+        if entry[2].wait(timeout):
+            return True
+        with self._lock:
+            if entry[2].is_set():
+                # Let in just as the wait timed out
+                return True
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # The slot passes straight to the first waiter
+                heapq.heappop(self._waiters)[2].set()
+            else:
+                self.active -= 1
+
+
+class LoadSheddingMiddleware:
+    """
+    Admits unsafe requests through a per-process PriorityGate of
+    LOAD_SHEDDING['WRITE_CONCURRENCY'], so writes can only take that many
+    worker threads and the single database writer is not fought over;
+    reads are never held. Waiting writes are let in by the priority of
+    their path prefix (enrollments before registrations), and answered
+    with a 503 and Retry-After when the queue is full or they waited
+    TIMEOUT seconds. Path prefixes in GATES are admitted through a gate of
+    their own instead.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = getattr(settings, 'LOAD_SHEDDING', {})
+        self.enabled = config.get('ENABLED', True)
+        max_waiting = config.get('MAX_WAITING', 32)
+        self.gate = PriorityGate(config.get('WRITE_CONCURRENCY', 4), max_waiting)
+        # Longest prefix first
+        self.gates = sorted(
+            ((prefix, PriorityGate(limit, max_waiting)) for prefix, limit in config.get('GATES', {}).items()),
+            key=lambda item: -len(item[0]),
+        )
+        self.timeout = config.get('TIMEOUT', 5)
+        self.retry_after = config.get('RETRY_AFTER', 2)
+        self.default_priority = config.get('DEFAULT_PRIORITY', 1)
+        # Longest prefix first
+        self.priorities = sorted(config.get('PRIORITIES', {}).items(), key=lambda item: -len(item[0]))
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        priority = self.get_priority(request)
+        if priority is None:
+            return self.get_response(request)
+        gate = self.get_gate(request)
+        if not gate.acquire(priority, self.timeout):
+            return self.shed()
+        try:
+            return self.get_response(request)
+        finally:
+            gate.release()
+
+    async def __acall__(self, request):
+        priority = self.get_priority(request)
+        if priority is None:
+            return await self.get_response(request)
+        gate = self.get_gate(request)
+        if not await sync_to_async(gate.acquire, thread_sensitive=False)(priority, self.timeout):
+            return self.shed()
+        try:
+            return await self.get_response(request)
+        finally:
+            gate.release()
+
+    def get_priority(self, request):
+        """The request's priority, or None when it is not gated"""
+        if not self.enabled or request.method in self.safe_methods:
+            return None
+        for prefix, priority in self.priorities:
+            if request.path.startswith(prefix):
+                return priority
+        return self.default_priority
+
+    def get_gate(self, request):
+        for prefix, gate in self.gates:
+            if request.path.startswith(prefix):
+                return gate
+        return self.gate
+
+    def shed(self):
+        response = JsonResponse({'detail': 'The server is busy, try again shortly.'}, status=503)
+        response['Retry-After'] = str(self.retry_after)
+        return response
@@ -0,0 +1,126 @@
+"""
+ffmpeg jobs run in the video worker processes. This module must not import
+Django: workers are spawned, not forked, and only call these functions with
+plain arguments; core.video applies the results to the database.
+"""
+import json
+import os
+import shutil
+import subprocess
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def run(command, timeout):
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+    except subprocess.CalledProcessError as error:
+        stderr = error.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise TranscodeError('\n'.join(stderr[-5:]) or f'{command[0]} exited with {error.returncode}')
+    except subprocess.TimeoutExpired:
+        raise TranscodeError(f'{command[0]} timed out after {timeout} seconds')
+
+
+def probe(source, options):
+    """Return (height, duration in seconds, has_audio) of the source video"""
+    command = [
+        options['FFPROBE'], '-v', 'error', '-print_format', 'json',
+        '-show_entries', 'stream=codec_type,height:format=duration', source,
+    ]
+    try:
+        output = subprocess.run(command, check=True, capture_output=True, timeout=60).stdout
+        info = json.loads(output)
+    except (subprocess.SubprocessError, ValueError):
+        raise TranscodeError('Could not read the video file')
+
+    streams = info.get('streams', [])
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+    if video is None:
+        raise TranscodeError('The file has no video stream')
+    duration = float(info.get('format', {}).get('duration') or 0)
+    has_audio = any(stream.get('codec_type') == 'audio' for stream in streams)
+    return int(video['height']), duration, has_audio
+
+
+def select_renditions(renditions, source_height):
+    """Keep the rungs that do not upscale, or the smallest one for tiny sources"""
+    selected = [rung for rung in renditions if rung[0] <= source_height]
+    return selected or [min(renditions)]
+
+
+def hls_command(source, output_dir, renditions, has_audio, options):
+    """
+    One ffmpeg pass decoding the source once and encoding every rung, with
+    key frames forced on segment boundaries so players can switch rungs
+    between any two segments
+    """
+    count = len(renditions)
+    segment = options['SEGMENT_SECONDS']
+    splits = ''.join(f'[s{index}]' for index in range(count))
+    scales = ';'.join(
+        f'[s{index}]scale=-2:{height}[v{index}]'
+        for index, (height, _, _) in enumerate(renditions)
+    )
+    command = [
+        options['FFMPEG'], '-y', '-v', 'error', '-i', source,
+        '-filter_complex', f'[0:v]split={count}{splits};{scales}',
+    ]
+    stream_map = []
+    for index, (height, video_bitrate, audio_bitrate) in enumerate(renditions):
+        command += [
+            '-map', f'[v{index}]',
+            f'-c:v:{index}', 'libx264', f'-b:v:{index}', video_bitrate,
+            f'-maxrate:v:{index}', video_bitrate, f'-bufsize:v:{index}', video_bitrate,
+        ]
+        if has_audio:
+            command += ['-map', 'a:0', f'-c:a:{index}', 'aac', f'-b:a:{index}', audio_bitrate]
+            stream_map.append(f'v:{index},a:{index},name:{height}p')
+        else:
+            stream_map.append(f'v:{index},name:{height}p')
+
+    command += [
+        '-preset', options['PRESET'], '-sc_threshold', '0',
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment})',
+        '-f', 'hls', '-hls_time', str(segment), '-hls_playlist_type', 'vod',
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%05d.ts'),
+        '-master_pl_name', 'master.m3u8',
+        '-var_stream_map', ' '.join(stream_map),
+        os.path.join(output_dir, '%v', 'index.m3u8'),
+    ]
+    return command
+
+
+def thumbnail_command(source, output_path, duration, options):
+    # A frame a little into the video avoids black intro frames
+    position = min(duration * 0.1, 10.0)
+    return [
+        options['FFMPEG'], '-y', '-v', 'error', '-ss', f'{position:.2f}', '-i', source,
+        '-frames:v', '1', '-vf', f"scale={options['THUMBNAIL_WIDTH']}:-2", '-q:v', '3', output_path,
+    ]
+
+
+def process_video(source, output_dir, options):
+    """
+    Write the HLS ladder (output_dir/master.m3u8) and a poster frame
+    (output_dir/poster.jpg). Output goes to a fresh directory that is
+    removed on failure. Returns a summary of what was produced.
+    """
+    os.makedirs(output_dir)
+    try:
+        height, duration, has_audio = probe(source, options)
+        renditions = select_renditions([tuple(rung) for rung in options['RENDITIONS']], height)
+        run(hls_command(source, output_dir, renditions, has_audio, options), options['TIMEOUT'])
+        run(thumbnail_command(source, os.path.join(output_dir, 'poster.jpg'), duration, options), 120)
+    except BaseException:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+
+    return {
+        'manifest': 'master.m3u8',
+        'thumbnail': 'poster.jpg',
+        'renditions': [height for height, _, _ in renditions],
+        'duration': duration,
+    }
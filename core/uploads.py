@@ -0,0 +1,165 @@
+import base64
+import binascii
+import hashlib
+import os
+from django.conf import settings
+from .models import Lesson, Material
+
+# Session field -> (model, file field) the finished upload is attached to
+UPLOAD_TARGETS = {
+    'lesson': (Lesson, 'video'),
+    'material': (Material, 'file'),
+}
+
+
+class UploadError(Exception):
+    """A chunk or completion request that cannot be applied to the session"""
+
+    def __init__(self, detail, status=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+
+
+def get_upload_settings():
+    return {
+        # Must be on the same filesystem as MEDIA_ROOT so completion is a rename
+        'TEMP_DIR': os.path.join(settings.MEDIA_ROOT, 'uploads'),
+        'MAX_SIZE': 20 * 1024 ** 3,
+        'MAX_CHUNK_SIZE': 64 * 1024 ** 2,
+        'BUFFER_SIZE': 1024 ** 2,
+        **getattr(settings, 'CHUNKED_UPLOADS', {}),
+    }
+
+
+def part_path(session):
+    return os.path.join(get_upload_settings()['TEMP_DIR'], f'{session.pk}.part')
+
+
+def get_target(session):
+    """Return (instance, field name) the session uploads into"""
+    for name, (model, field) in UPLOAD_TARGETS.items():
+        instance = getattr(session, name)
+        if instance is not None:
+            return instance, field
+    raise UploadError('Upload session has no target')
+
+
+# ==================== PART FILES ====================
+
+def create_part_file(session):
+    """Preallocate the (sparse) part file so chunks can land at any offset"""
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as part:
+        part.truncate(session.size)
+
+
+def remove_part_file(path):
+    """Remove a part file (given its part_path) if it is still there"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def parse_checksum(header):
+    """Parse a tus-style `Upload-Checksum: sha256 <base64 digest>` header"""
+    if not header:
+        return None
+    try:
+        algorithm, encoded = header.split(' ', 1)
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except (ValueError, binascii.Error):
+        raise UploadError('Malformed Upload-Checksum header')
+    if algorithm.lower() != 'sha256':
+        raise UploadError('Unsupported checksum algorithm')
+    return digest
+
+
+def write_chunk(session, offset, length, stream, expected_digest=None):
+    """
+    Copy `length` bytes from the request stream into the part file at
+    `offset`, hashing on the way. Chunks cover disjoint byte ranges, so
+    several can be written concurrently; a retried chunk overwrites its
+    own range. Returns the hex sha256 of the chunk.
+    """
+    buffer_size = get_upload_settings()['BUFFER_SIZE']
+    digest = hashlib.sha256()
+    position = offset
+    remaining = length
+
+    fd = os.open(part_path(session), os.O_WRONLY)
+    try:
+        while remaining:
+            data = stream.read(min(buffer_size, remaining))
+            if not data:
+                break
+            digest.update(data)
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, position)
+                view = view[written:]
+                position += written
+            remaining -= len(data)
+    finally:
+        os.close(fd)
+
+    if remaining:
+        raise UploadError('Chunk body is shorter than Content-Length')
+    if expected_digest is not None and digest.digest() != expected_digest:
+        # The range is rewritten when the client retries the chunk
+        raise UploadError('Checksum mismatch', status=460)
+    return digest.hexdigest()
+
+
+def received_ranges(session):
+    """Merge the recorded chunks into sorted, non-overlapping [start, end) ranges"""
+    ranges = []
+    for offset, length in session.chunks.order_by('offset').values_list('offset', 'length'):
+        end = offset + length
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([offset, end])
+    return ranges
+
+
+def contiguous_offset(ranges):
+    """Bytes received without a gap from the start of the file"""
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+
+# ==================== COMPLETION ====================
+
+def finalize_upload(session):
+    """
+    Move the assembled part file into storage and attach it to the target
+    lesson or material. The caller holds a row lock on the session.
+    """
+    ranges = received_ranges(session)
+    if ranges != [[0, session.size]]:
+        raise UploadError('Upload is incomplete', status=409)
+
+    instance, field_name = get_target(session)
+    field = instance._meta.get_field(field_name)
+    name = field.storage.get_available_name(field.generate_filename(instance, session.filename))
+    destination = field.storage.path(name)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # Same filesystem: an atomic rename, no copy of multi-GB files
+    os.replace(part_path(session), destination)
+
+    # Put the part file back if the database writes fail, so the client
+    # can retry the completion
+    try:
+        setattr(instance, field_name, name)
+        instance.save(update_fields=[field_name, 'updated_at'])
+        session.status = 'complete'
+        session.save(update_fields=['status', 'updated_at'])
+        session.chunks.all().delete()
+    except Exception:
+        os.replace(destination, part_path(session))
+        raise
+    return instance
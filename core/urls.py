@@ -1,27 +1,47 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Async implementations of the hottest reads, for ASGI deployments
+reads = async_views if getattr(settings, 'ASYNC_READ_VIEWS', False) else views
 
 urlpatterns = [
     # Category endpoints
     path('categories/', views.category_list_create, name='category_list_create'),
     
     # Course endpoints
-    path('courses/', views.course_list_create, name='course_list_create'),
-    path('courses/<int:pk>/', views.course_detail, name='course_detail'),
+    path('courses/', reads.course_list_create, name='course_list_create'),
+    path('courses/<int:pk>/', reads.course_detail, name='course_detail'),
+    path('courses/<int:pk>/banner/<int:width>.<str:fmt>', views.course_banner, name='course_banner'),
     
     # Lesson endpoints
-    path('lessons/', views.lesson_list_create, name='lesson_list_create'),
+    path('lessons/', reads.lesson_list_create, name='lesson_list_create'),
+    path('lessons/bulk/', views.lesson_bulk_create, name='lesson_bulk_create'),
     path('lessons/<int:pk>/', views.lesson_detail, name='lesson_detail'),
+    path('lessons/<int:pk>/video/', views.lesson_video, name='lesson_video'),
+    path('lessons/<int:pk>/thumbnail/', views.lesson_thumbnail, name='lesson_thumbnail'),
+    path('lessons/<int:pk>/stream/<path:path>', views.lesson_stream, name='lesson_stream'),
     
     # Material endpoints
     path('materials/', views.material_list_create, name='material_list_create'),
+    path('materials/bulk/', views.material_bulk_create, name='material_bulk_create'),
     path('materials/<int:pk>/', views.material_detail, name='material_detail'),
+    path('materials/<int:pk>/file/', views.material_file, name='material_file'),
     
     # Enrollment endpoints
-    path('enrollments/', views.enrollment_list, name='enrollment_list'),
+    path('enrollments/', reads.enrollment_list, name='enrollment_list'),
     path('enrollments/enroll/', views.enroll_course, name='enroll_course'),
+    path('enrollments/bulk/', views.enrollment_bulk_create, name='enrollment_bulk_create'),
     
+    # Chunked upload endpoints
+    path('uploads/', views.upload_create, name='upload_create'),
+    path('uploads/<uuid:pk>/', views.upload_detail, name='upload_detail'),
+    path('uploads/<uuid:pk>/complete/', views.upload_complete, name='upload_complete'),
+
     # Question & Answer endpoints
     path('questions/', views.question_list_create, name='question_list_create'),
     path('questions/<int:pk>/', views.question_detail, name='question_detail'),
+
+    # Request metrics of the serving process
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
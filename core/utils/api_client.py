@@ -1,7 +1,176 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 
+logger = logging.getLogger(__name__)
+
+# Methods that are safe to retry automatically
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+# Cached GET responses of a resource that embed data from another resource,
+# so writes to the first must also drop the second
+DEPENDENT_RESOURCES = {
+    'courses/categories/': ['courses/courses/'],
+    'courses/courses/': ['courses/lessons/', 'courses/materials/', 'courses/enrollments/', 'courses/questions/'],
+    'courses/lessons/': ['courses/questions/'],
+}
+
+_session = None
+_executor = None
+_response_cache = None
+_lock = threading.Lock()
+# Set on the pool's threads while they run a batched call
+_batch_worker = threading.local()
+
+
+def get_session():
+    """
+    Return the process-wide Session. Its connection pool keeps TCP/TLS
+    connections alive between calls, and it retries idempotent requests
+    with exponential backoff.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                retry = Retry(
+                    total=getattr(settings, 'API_MAX_RETRIES', 3),
+                    backoff_factor=getattr(settings, 'API_RETRY_BACKOFF', 0.3),
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=IDEMPOTENT_METHODS,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=getattr(settings, 'API_POOL_CONNECTIONS', 10),
+                    pool_maxsize=getattr(settings, 'API_POOL_MAXSIZE', 20),
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_executor():
+    """Return the shared thread pool used for batched calls"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'API_BATCH_WORKERS', 10),
+                    thread_name_prefix='api-client',
+                )
+    return _executor
+
+
+def _run_batched(func, *args, **kwargs):
+    _batch_worker.active = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _batch_worker.active = False
+
+
+class CachedResponse:
+    __slots__ = ('data', 'etag', 'resource', 'expires_at')
+
+    def __init__(self, data, etag, resource, ttl):
+        self.data = data
+        self.etag = etag
+        self.resource = resource
+        self.expires_at = time.monotonic() + ttl
+
+    @property
+    def is_fresh(self):
+        return time.monotonic() < self.expires_at
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU of GET responses. Expired entries that carry an ETag
+    are kept, so they can be revalidated with If-None-Match instead of
+    downloaded again.
+    """
+
+    def __init__(self, max_entries=500, default_ttl=300, ttls=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        # Longest prefix first, so specific endpoints override their parents
+        self.ttls = sorted((ttls or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_ttl(self, endpoint):
+        for prefix, ttl in self.ttls:
+            if endpoint.startswith(prefix):
+                return ttl
+        return self.default_ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, data, etag, endpoint):
+        entry = CachedResponse(data, etag, get_resource(endpoint), self.get_ttl(endpoint))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, key, endpoint):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires_at = time.monotonic() + self.get_ttl(endpoint)
+
+    def invalidate(self, endpoint):
+        resource = get_resource(endpoint)
+        resources = {resource, *DEPENDENT_RESOURCES.get(resource, [])}
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.resource in resources]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_resource(endpoint):
+    """Collection an endpoint belongs to, e.g. 'courses/courses/5/' -> 'courses/courses/'"""
+    parts = [part for part in endpoint.split('/') if part]
+    return '/'.join(parts[:2]) + '/'
+
+
+def get_response_cache():
+    """Return the process-wide response cache, or None when API_ENABLE_CACHE is off"""
+    global _response_cache
+    if not getattr(settings, 'API_ENABLE_CACHE', False):
+        return None
+    if _response_cache is None:
+        with _lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    max_entries=getattr(settings, 'API_CACHE_MAX_ENTRIES', 500),
+                    default_ttl=getattr(settings, 'API_CACHE_TIMEOUT', 300),
+                    ttls=getattr(settings, 'API_CACHE_TTLS', None),
+                )
+    return _response_cache
+
+
 class ApiClient:
     """
     Utility class for making API requests to the LMS backend
@@ -29,27 +198,107 @@ class ApiClient:
     
     def _make_request(self, method, endpoint, data=None, params=None):
         """Make HTTP request to the API endpoint"""
-        url = f"{self.base_url}/{endpoint.lstrip('/')}"
-        
+        endpoint = endpoint.lstrip('/')
+        url = f"{self.base_url}/{endpoint}"
+        method = method.upper()
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+
+        cache = get_response_cache()
+        headers = self.headers
+        cached = None
+
+        if method == 'GET' and cache is not None:
+            # Responses depend on who asks, so the token is part of the key
+            cache_key = (self.headers.get('Authorization'), endpoint, tuple(sorted((params or {}).items())))
+            cached = cache.get(cache_key)
+            if cached is not None:
+                if cached.is_fresh:
+                    return copy.deepcopy(cached.data)
+                if cached.etag:
+                    headers = {**self.headers, 'If-None-Match': cached.etag}
+
         try:
-            if method.lower() == 'get':
-                response = requests.get(url, headers=self.headers, params=params)
-            elif method.lower() == 'post':
-                response = requests.post(url, headers=self.headers, json=data)
-            elif method.lower() == 'put':
-                response = requests.put(url, headers=self.headers, json=data)
-            elif method.lower() == 'delete':
-                response = requests.delete(url, headers=self.headers)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
+            response = get_session().request(
+                method,
+                url,
+                headers=headers,
+                params=params if method == 'GET' else None,
+                json=data if method in ('POST', 'PUT') else None,
+                timeout=settings.API_REQUEST_TIMEOUT,
+            )
+
+            if response.status_code == 304 and cached is not None:
+                cache.refresh(cache_key, endpoint)
+                return copy.deepcopy(cached.data)
+
             response.raise_for_status()  # Raise exception for 4XX/5XX responses
-            return response.json() if response.content else None
+            result = response.json() if response.content else None
+
+            if cache is not None:
+                if method == 'GET':
+                    cache.set(cache_key, copy.deepcopy(result), response.headers.get('ETag'), endpoint)
+                else:
+                    cache.invalidate(endpoint)
+            return result
             
         except requests.exceptions.RequestException as e:
-            # Log error and re-raise or handle as needed
-            print(f"API request error: {e}")
+            logger.warning('API request %s %s failed: %s', method, url, e)
             raise
+
+    # Batched calls
+    def batch(self, calls):
+        """
+        Run several client calls concurrently on the shared thread pool and
+        return their results in order. Each call is a (method_name, args)
+        or (method_name, args, kwargs) tuple, e.g. ('get_course', (1,)).
+        The first exception raised by any call is re-raised.
+
+        A batch started from a call that is itself batched (a batched
+        get_course_bundle) runs its calls one after another: pool threads
+        waiting on work queued behind them would deadlock the pool once
+        every thread did so, and the outer batch already runs concurrently.
+        """
+        calls = [(getattr(self, call[0]), call[1], call[2] if len(call) > 2 else {}) for call in calls]
+        if getattr(_batch_worker, 'active', False):
+            return [func(*args, **kwargs) for func, args, kwargs in calls]
+        futures = [get_executor().submit(_run_batched, func, *args, **kwargs) for func, args, kwargs in calls]
+        return [future.result() for future in futures]
+
+    def get_courses_by_ids(self, courses):
+        """Get several courses concurrently"""
+        return self.batch([('get_course', (course,)) for course in courses])
+
+    def get_course_bundle(self, course):
+        """
+        Get a course with its lessons and materials concurrently, then the
+        questions of every lesson concurrently
+        """
+        course_data, lessons, materials = self.batch([
+            ('get_course', (course,)),
+            ('get_lessons', (), {'course': course}),
+            ('get_materials', (), {'course': course}),
+        ])
+        lesson_list = self._results(lessons)
+        questions = self.batch([
+            ('get_questions', (), {'lesson': lesson['id']}) for lesson in lesson_list
+        ])
+        return {
+            'course': course_data,
+            'lessons': lessons,
+            'materials': materials,
+            'questions': {
+                lesson['id']: lesson_questions
+                for lesson, lesson_questions in zip(lesson_list, questions)
+            },
+        }
+
+    @staticmethod
+    def _results(data):
+        """Unwrap the rows of a paginated response"""
+        if isinstance(data, dict) and 'results' in data:
+            return data['results']
+        return data or []
     
     # Category endpoints
     def get_categories(self, is_active=None):
@@ -0,0 +1,184 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import Lesson
+from .transcode import process_video
+
+logger = logging.getLogger(__name__)
+
+
+def get_video_settings():
+    return {
+        'ENABLED': True,
+        'FFMPEG': 'ffmpeg',
+        'FFPROBE': 'ffprobe',
+        'WORKERS': 2,
+        'OUTPUT_DIR': 'lesson_streams',
+        # (height, video bitrate, audio bitrate), highest first
+        'RENDITIONS': [
+            (1080, '5000k', '192k'),
+            (720, '2800k', '128k'),
+            (480, '1400k', '128k'),
+            (360, '800k', '96k'),
+        ],
+        'SEGMENT_SECONDS': 6,
+        'PRESET': 'veryfast',
+        'THUMBNAIL_WIDTH': 640,
+        'TIMEOUT': 4 * 60 * 60,
+        **getattr(settings, 'VIDEO_PROCESSING', {}),
+    }
+
+
+# ==================== WORKER POOL ====================
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Process pool shared by the process. Workers are spawned rather than
+    forked, since forking a threaded server can deadlock the child.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=get_video_settings()['WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+# ==================== PROCESSING ====================
+
+def set_status(lesson_id, video_name, **fields):
+    """
+    Update the processing fields without running Lesson signals, and only
+    while the lesson still has the video the result belongs to
+    """
+    return Lesson.objects.filter(pk=lesson_id, video=video_name).update(updated_at=timezone.now(), **fields)
+
+
+def output_directory(lesson):
+    options = get_video_settings()
+    relative = os.path.join(options['OUTPUT_DIR'], str(lesson.pk), uuid.uuid4().hex[:12])
+    return relative, os.path.join(settings.MEDIA_ROOT, relative)
+
+
+def apply_result(lesson_id, video_name, relative_dir, previous_dir, result=None, error=None):
+    if error is not None:
+        logger.warning('Processing lesson %s video failed: %s', lesson_id, error)
+        set_status(lesson_id, video_name, processing_status='failed', processing_error=str(error)[:2000])
+        return
+
+    updated = set_status(
+        lesson_id, video_name,
+        processing_status='ready',
+        processing_error='',
+        stream_manifest=os.path.join(relative_dir, result['manifest']),
+        thumbnail=os.path.join(relative_dir, result['thumbnail']),
+    )
+    # Drop the ladder this one replaces, or this one if the video changed
+    # while it was being encoded
+    stale = previous_dir if updated else relative_dir
+    if stale:
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, stale), ignore_errors=True)
+
+
+def process_lesson(lesson):
+    """Encode the lesson's video in this process (used by the management command)"""
+    options = get_video_settings()
+    video_name = lesson.video.name
+    previous_dir = os.path.dirname(lesson.stream_manifest.name) if lesson.stream_manifest else None
+    relative_dir, output_dir = output_directory(lesson)
+
+    if not shutil.which(options['FFMPEG']):
+        apply_result(lesson.pk, video_name, None, None, error=f"{options['FFMPEG']} is not installed")
+        return
+    set_status(lesson.pk, video_name, processing_status='pending', processing_error='')
+    try:
+        result = process_video(lesson.video.path, output_dir, options)
+    except Exception as error:
+        apply_result(lesson.pk, video_name, relative_dir, previous_dir, error=error)
+    else:
+        apply_result(lesson.pk, video_name, relative_dir, previous_dir, result=result)
+
+
+def enqueue_lesson(lesson_id):
+    """Submit a lesson's current video to the worker pool"""
+    options = get_video_settings()
+    lesson = Lesson.objects.filter(pk=lesson_id).only('pk', 'video', 'stream_manifest').first()
+    if lesson is None or not lesson.video:
+        return None
+
+    video_name = lesson.video.name
+    if not shutil.which(options['FFMPEG']):
+        apply_result(lesson_id, video_name, None, None, error=f"{options['FFMPEG']} is not installed")
+        return None
+
+    previous_dir = os.path.dirname(lesson.stream_manifest.name) if lesson.stream_manifest else None
+    relative_dir, output_dir = output_directory(lesson)
+
+    def done(future):
+        # Runs on the pool's result thread in this process
+        close_old_connections()
+        try:
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                _reset_executor()
+            apply_result(
+                lesson_id, video_name, relative_dir, previous_dir,
+                result=None if error else future.result(), error=error
+            )
+        except Exception:
+            logger.exception('Could not record processing result for lesson %s', lesson_id)
+        finally:
+            close_old_connections()
+
+    try:
+        future = get_executor().submit(process_video, lesson.video.path, output_dir, options)
+    except BrokenProcessPool:
+        _reset_executor()
+        future = get_executor().submit(process_video, lesson.video.path, output_dir, options)
+    future.add_done_callback(done)
+    return future
+
+
+# ==================== SIGNAL RECEIVERS ====================
+
+def remember_video(sender, instance, **kwargs):
+    video = instance.__dict__.get('video')
+    instance._processed_video = getattr(video, 'name', video) or ''
+
+
+def video_changed(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Deferred or excluded from update_fields: the video was not written
+    if raw or 'video' not in instance.__dict__ or (update_fields and 'video' not in update_fields):
+        return
+    video_name = instance.video.name or ''
+    if video_name == instance._processed_video and not created:
+        return
+    instance._processed_video = video_name
+    if not video_name or not get_video_settings()['ENABLED']:
+        return
+
+    set_status(instance.pk, video_name, processing_status='pending', processing_error='')
+    instance.processing_status, instance.processing_error = 'pending', ''
+    lesson_id = instance.pk
+    transaction.on_commit(lambda: enqueue_lesson(lesson_id))
@@ -1,25 +1,67 @@
+import os
+from django.conf import settings
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q
-from .models import Category, Course, Lesson, Material, Enrollment, QuestionAnswer
+from django.db import IntegrityError, transaction
+from .models import Category, Course, Lesson, Material, Enrollment, QuestionAnswer, UploadSession, UploadChunk
 from .serializers import (
     CategorySerializer, CourseSerializer, LessonSerializer, MaterialSerializer,
-    EnrollmentSerializer, QuestionAnswerSerializer
+    EnrollmentSerializer, QuestionAnswerSerializer, UploadSessionSerializer,
+    CourseSummarySerializer, CourseOverviewSerializer, LessonSummarySerializer, MaterialSummarySerializer,
+    EnrollmentSummarySerializer, QuestionAnswerSummarySerializer
+)
+from .querysets import optimize_queryset
+from .fastpath import get_row_builder
+from .pagination import KeysetPagination
+from .access import get_course_access, invalidate_enrollment
+from .search import get_search_backend
+from .conditional import queryset_validators, instance_validators
+from .counters import COUNTER_FIELDS
+from .catalog_cache import catalog_cache_key, get_cached_response, cache_response
+from .media import serve_file, serve_path, resolve_within
+from .images import UnreadableImage, derivative_cache, get_banner_settings
+from .bulk import collect_ids, get_bulk_items, bulk_create_response
+from .idempotency import idempotency_key, replay, remember
+from .throttling import EnrollRateThrottle, WriteRateThrottle
+from .performance import registry
+from users.models import User
+from .uploads import (
+    UploadError, get_upload_settings, get_target, create_part_file,
+    parse_checksum, write_chunk, received_ranges, contiguous_offset, finalize_upload
 )
 from drf_yasg.utils import swagger_auto_schema
 
+def list_serializer_class(request, summary_class, full_class):
+    """Summary rows for list views, unless ?fields= picks from the full serializer"""
+    return full_class if request.query_params.get('fields') else summary_class
+
 # ==================== CATEGORIES ====================
 
 @swagger_auto_schema(method='post', request_body=CategorySerializer)
 @api_view(['GET', 'POST'])
 def category_list_create(request):
     if request.method == 'GET':
-        categories = Category.objects.all()
-        serializer = CategorySerializer(categories, many=True)
-        return Response(serializer.data)
+        cache_key = catalog_cache_key(request, 'category_list')
+        if cache_key:
+            cached = get_cached_response(request, cache_key)
+            if cached is not None:
+                return cached
+
+        categories = optimize_queryset(Category.objects.all(), CategorySerializer, context={'request': request})
+
+        validators = queryset_validators(request, categories)
+        not_modified = validators.not_modified(request)
+        if not_modified:
+            return not_modified
+
+        serializer = CategorySerializer(categories, many=True, context={'request': request})
+        response = validators.apply(Response(serializer.data))
+        if cache_key:
+            cache_response(cache_key, response, validators)
+        return response
 
     elif request.method == 'POST':
         if not request.user.is_authenticated or request.user.role != 'admin':
@@ -33,37 +75,72 @@ def category_list_create(request):
 
 # ==================== COURSES ====================
 
+def course_list_query(request):
+    """Filtered course queryset of a list request, its serializer and row builder"""
+    category = request.query_params.get('category')
+    search = request.query_params.get('search')
+    serializer_class = list_serializer_class(request, CourseSummarySerializer, CourseSerializer)
+    queryset = Course.objects.all()
+
+    if category:
+        queryset = queryset.filter(category__id=category)
+
+    if search:
+        queryset = get_search_backend().search(queryset, search)
+
+    if request.user.is_authenticated and request.user.role == 'teacher':
+        queryset = queryset.filter(instructor=request.user)
+
+    # Rank-ordered search results keep the model path
+    builder = None if search else get_row_builder(serializer_class, {'request': request})
+    if builder is None:
+        queryset = optimize_queryset(queryset, serializer_class, context={'request': request})
+    return queryset, serializer_class, builder
+
+def course_list_page(request, queryset, serializer_class, builder):
+    # Page numbers are kept for existing clients and for search results,
+    # which are ordered by rank rather than (created_at, id); everything
+    # else gets keyset pagination, which avoids OFFSET scans and COUNT(*)
+    if request.query_params.get('search'):
+        paginator = PageNumberPagination()
+        paginator.page_size = 10
+    elif request.query_params.get('page'):
+        paginator = PageNumberPagination()
+        paginator.page_size = 10
+        queryset = queryset.order_by('-created_at', '-id')
+    else:
+        paginator = KeysetPagination()
+
+    if builder is not None:
+        data = builder.build(paginator.paginate_queryset(builder.values(queryset, 'created_at', 'id'), request))
+    else:
+        paginated_queryset = paginator.paginate_queryset(queryset, request)
+        data = serializer_class(paginated_queryset, many=True, context={'request': request}).data
+    return paginator.get_paginated_response(data)
+
 @swagger_auto_schema(method='post', request_body=CourseSerializer)
 @api_view(['GET', 'POST'])
 def course_list_create(request):
     if request.method == 'GET':
-        category = request.query_params.get('category')
         search = request.query_params.get('search')
-        queryset = Course.objects.all()
 
-        if category:
-            queryset = queryset.filter(category__id=category)
+        # Search results are too varied to be worth sharing
+        cache_key = None if search else catalog_cache_key(request, 'course_list', counters=True)
+        if cache_key:
+            cached = get_cached_response(request, cache_key)
+            if cached is not None:
+                return cached
 
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search)
-            )
+        queryset, serializer_class, builder = course_list_query(request)
+        validators = queryset_validators(request, queryset, 'category', totals=COUNTER_FIELDS)
+        not_modified = validators.not_modified(request)
+        if not_modified:
+            return not_modified
 
-        if request.user.is_authenticated and request.user.role == 'teacher':
-            queryset = queryset.filter(teacher=request.user)
-
-        paginator = PageNumberPagination()
-        paginator.page_size = 10
-        paginated_queryset = paginator.paginate_queryset(queryset, request)
-
-        serializer = CourseSerializer(
-            paginated_queryset,
-            many=True,
-            context={'request': request}
-        )
-
-        return paginator.get_paginated_response(serializer.data)
+        response = validators.apply(course_list_page(request, queryset, serializer_class, builder))
+        if cache_key:
+            cache_response(cache_key, response, validators)
+        return response
 
     elif request.method == 'POST':
         if not request.user.is_authenticated or request.user.role != 'teacher':
@@ -76,31 +153,30 @@ def course_list_create(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def course_detail_response(request, course, allowed):
+    counters = tuple(getattr(course, field) for field in COUNTER_FIELDS)
+    validators = instance_validators(request, course, 'category', variant=(allowed, counters))
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+
+    serializer_class = CourseSerializer if allowed else CourseOverviewSerializer
+    serializer = serializer_class(course, context={'request': request})
+    return validators.apply(Response(serializer.data))
+
 @swagger_auto_schema(method='put', request_body=CourseSerializer)
 @api_view(['GET', 'PUT', 'DELETE'])
 def course_detail(request, pk):
     try:
-        course = Course.objects.get(pk=pk)
+        course = Course.objects.select_related('category', 'instructor').get(pk=pk)
     except Course.DoesNotExist:
         return Response({'detail': 'Course not found'}, status=404)
 
     if request.method == 'GET':
-        is_owner = request.user.is_authenticated and request.user == course.teacher
-        is_admin = request.user.is_authenticated and request.user.role == 'admin'
-        is_enrolled = Enrollment.objects.filter(
-            student=request.user,
-            course=course,
-            status='active'
-        ).exists() if request.user.is_authenticated and request.user.role == 'student' else False
-
-        if not (is_owner or is_admin or is_enrolled):
-            serializer = CourseSerializer(course, context={'limited': True})
-        else:
-            serializer = CourseSerializer(course, context={'request': request})
-        return Response(serializer.data)
+        return course_detail_response(request, course, get_course_access(request, course).allowed)
 
     elif request.method == 'PUT':
-        if not request.user.is_authenticated or request.user.role != 'teacher' or request.user != course.teacher:
+        if not get_course_access(request, course).is_owner:
             return Response({'detail': 'Only the course owner can update this course.'}, status=403)
 
         serializer = CourseSerializer(course, data=request.data)
@@ -110,14 +186,44 @@ def course_detail(request, pk):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'DELETE':
-        if not request.user.is_authenticated or request.user.role != 'teacher' or request.user != course.teacher:
+        if not get_course_access(request, course).is_owner:
             return Response({'detail': 'Only the course owner can delete this course.'}, status=403)
 
         course.delete()
         return Response({'detail': 'Course deleted'}, status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['GET'])
+def course_banner(request, pk, width, fmt):
+    config = get_banner_settings()
+    if width not in config['WIDTHS'] or fmt not in config['FORMATS']:
+        return Response({'detail': 'Unknown banner variant'}, status=404)
+
+    course = Course.objects.filter(pk=pk).only('pk', 'banner').first()
+    if course is None or not course.banner:
+        return Response({'detail': 'Course not found'}, status=404)
+
+    try:
+        path = derivative_cache.get(course.banner.path, course.banner.name, width, fmt)
+    except FileNotFoundError:
+        return Response({'detail': 'Banner not found'}, status=404)
+    except UnreadableImage:
+        return Response({'detail': 'Banner is not a readable image'}, status=404)
+
+    # Variant URLs carry a version of the source banner, so they never change
+    return serve_path(
+        request, path, os.path.relpath(path, settings.MEDIA_ROOT),
+        cache_control=f"public, max-age={config['MAX_AGE']}, immutable"
+    )
+
 # ==================== LESSONS ====================
 
+def course_lessons(request, course_id):
+    serializer_class = list_serializer_class(request, LessonSummarySerializer, LessonSerializer)
+    lessons = optimize_queryset(
+        Lesson.objects.filter(course_id=course_id), serializer_class, context={'request': request}
+    ).order_by('created_at', 'id')
+    return serializer_class(lessons, many=True, context={'request': request}).data
+
 @swagger_auto_schema(method='post', request_body=LessonSerializer)
 @api_view(['GET', 'POST'])
 def lesson_list_create(request):
@@ -131,20 +237,10 @@ def lesson_list_create(request):
         except Course.DoesNotExist:
             return Response({'detail': 'Course not found'}, status=404)
 
-        is_teacher = request.user.is_authenticated and request.user.role == 'teacher' and request.user == course.teacher
-        is_admin = request.user.is_authenticated and request.user.role == 'admin'
-        is_enrolled = Enrollment.objects.filter(
-            student=request.user,
-            course=course,
-            status='active'
-        ).exists() if request.user.is_authenticated and request.user.role == 'student' else False
-
-        if not (is_teacher or is_admin or is_enrolled):
+        if not get_course_access(request, course).allowed:
             return Response({'detail': 'You do not have permission to view these lessons'}, status=403)
 
-        lessons = Lesson.objects.filter(course=course).order_by('order')
-        serializer = LessonSerializer(lessons, many=True)
-        return Response(serializer.data)
+        return Response(course_lessons(request, course.pk))
 
     elif request.method == 'POST':
         if not request.user.is_authenticated or request.user.role != 'teacher':
@@ -156,7 +252,7 @@ def lesson_list_create(request):
         except Course.DoesNotExist:
             return Response({'detail': 'Course not found'}, status=404)
 
-        if request.user != course.teacher:
+        if not get_course_access(request, course).is_owner:
             return Response({'detail': 'You can only add lessons to your own courses'}, status=403)
 
         serializer = LessonSerializer(data=request.data)
@@ -165,46 +261,116 @@ def lesson_list_create(request):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def owner_check(request, detail):
+    """Bulk item check: the item's course must belong to request.user"""
+    def check(attrs):
+        if not get_course_access(request, attrs['course']).is_owner:
+            return 403, detail
+        return None
+    return check
+
+@swagger_auto_schema(method='post', request_body=LessonSerializer(many=True))
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def lesson_bulk_create(request):
+    if request.user.role != 'teacher':
+        return Response({'detail': 'Only teachers can create lessons'}, status=403)
+
+    items, error = get_bulk_items(request)
+    if error:
+        return error
+
+    courses = Course.objects.select_related('category', 'instructor').in_bulk(collect_ids(items, 'course'))
+    return bulk_create_response(
+        request, items, LessonSerializer, {'course': courses},
+        check=owner_check(request, 'You can only add lessons to your own courses')
+    )
+
 @swagger_auto_schema(method='put', request_body=LessonSerializer)
 @api_view(['GET', 'PUT', 'DELETE'])
 def lesson_detail(request, pk):
     try:
-        lesson = Lesson.objects.get(pk=pk)
+        lesson = Lesson.objects.select_related('course').get(pk=pk)
     except Lesson.DoesNotExist:
         return Response({'detail': 'Lesson not found'}, status=404)
 
     if request.method == 'GET':
-        course = lesson.course
-        is_teacher = request.user.is_authenticated and request.user.role == 'teacher' and request.user == course.teacher
-        is_admin = request.user.is_authenticated and request.user.role == 'admin'
-        is_enrolled = Enrollment.objects.filter(
-            student=request.user,
-            course=course,
-            status='active'
-        ).exists() if request.user.is_authenticated and request.user.role == 'student' else False
-
-        if not (is_teacher or is_admin or is_enrolled):
+        if not get_course_access(request, lesson.course).allowed:
             return Response({'detail': 'You do not have permission to view this lesson'}, status=403)
 
         serializer = LessonSerializer(lesson)
         return Response(serializer.data)
 
     elif request.method == 'PUT':
-        if not request.user.is_authenticated or request.user.role != 'teacher' or request.user != lesson.course.teacher:
+        if not get_course_access(request, lesson.course).is_owner:
             return Response({'detail': 'Only the course owner can update this lesson'}, status=403)
 
         serializer = LessonSerializer(lesson, data=request.data)
         if serializer.is_valid():
+            if not get_course_access(request, serializer.validated_data['course']).is_owner:
+                return Response({'detail': 'You can only move lessons to your own courses'}, status=403)
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'DELETE':
-        if not request.user.is_authenticated or request.user.role != 'teacher' or request.user != lesson.course.teacher:
+        if not get_course_access(request, lesson.course).is_owner:
             return Response({'detail': 'Only the course owner can delete this lesson'}, status=403)
 
         lesson.delete()
         return Response({'detail': 'Lesson deleted'}, status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def lesson_video(request, pk):
+    try:
+        lesson = Lesson.objects.select_related('course').get(pk=pk)
+    except Lesson.DoesNotExist:
+        return Response({'detail': 'Lesson not found'}, status=404)
+
+    if not get_course_access(request, lesson.course).allowed:
+        return Response({'detail': 'You do not have permission to view this lesson'}, status=403)
+
+    if not lesson.video:
+        return Response({'detail': 'Lesson has no video'}, status=404)
+    return serve_file(request, lesson.video)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def lesson_thumbnail(request, pk):
+    try:
+        lesson = Lesson.objects.select_related('course').get(pk=pk)
+    except Lesson.DoesNotExist:
+        return Response({'detail': 'Lesson not found'}, status=404)
+
+    if not get_course_access(request, lesson.course).allowed:
+        return Response({'detail': 'You do not have permission to view this lesson'}, status=403)
+
+    if not lesson.thumbnail:
+        return Response({'detail': 'Lesson has no thumbnail'}, status=404)
+    return serve_file(request, lesson.thumbnail)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def lesson_stream(request, pk, path):
+    try:
+        lesson = Lesson.objects.select_related('course').get(pk=pk)
+    except Lesson.DoesNotExist:
+        return Response({'detail': 'Lesson not found'}, status=404)
+
+    if not get_course_access(request, lesson.course).allowed:
+        return Response({'detail': 'You do not have permission to view this lesson'}, status=403)
+
+    if lesson.processing_status != 'ready' or not lesson.stream_manifest:
+        return Response({'detail': 'Stream is not ready'}, status=404)
+
+    # Playlists reference their renditions and segments relative to the
+    # master playlist, so they all resolve under this endpoint
+    stream_dir = os.path.dirname(lesson.stream_manifest.name)
+    file_path = resolve_within(os.path.dirname(lesson.stream_manifest.path), path)
+    if file_path is None:
+        return Response({'detail': 'Not found'}, status=404)
+    return serve_path(request, file_path, f'{stream_dir}/{path}')
     
 # ==================== MATERIALS ====================
 
@@ -218,24 +384,17 @@ def material_list_create(request):
             return Response({'detail': 'Lesson ID is required'}, status=400)
 
         try:
-            lesson = Lesson.objects.get(pk=lesson)
+            lesson = Lesson.objects.select_related('course').get(pk=lesson)
         except Lesson.DoesNotExist:
             return Response({'detail': 'Lesson not found'}, status=404)
 
         course = lesson.course
-        is_teacher = request.user.role == 'teacher' and request.user == course.teacher
-        is_admin = request.user.role == 'admin'
-        is_enrolled = Enrollment.objects.filter(
-            student=request.user, 
-            course=course, 
-            status='active'
-        ).exists() if request.user.role == 'student' else False
-
-        if not (is_teacher or is_admin or is_enrolled):
+        if not get_course_access(request, course).allowed:
             return Response({'detail': 'You do not have permission to view these materials'}, status=403)
 
-        materials = Material.objects.filter(lesson=lesson)
-        serializer = MaterialSerializer(materials, many=True)
+        serializer_class = list_serializer_class(request, MaterialSummarySerializer, MaterialSerializer)
+        materials = optimize_queryset(Material.objects.filter(course=course), serializer_class, context={'request': request})
+        serializer = serializer_class(materials, many=True, context={'request': request})
         return Response(serializer.data)
 
     elif request.method == 'POST':
@@ -244,62 +403,90 @@ def material_list_create(request):
 
         lesson = request.data.get('lesson')
         try:
-            lesson = Lesson.objects.get(pk=lesson)
+            lesson = Lesson.objects.select_related('course').get(pk=lesson)
         except Lesson.DoesNotExist:
             return Response({'detail': 'Lesson not found'}, status=404)
 
-        if request.user != lesson.course.teacher:
+        if not get_course_access(request, lesson.course).is_owner:
             return Response({'detail': 'You can only add materials to your own courses'}, status=403)
 
         serializer = MaterialSerializer(data=request.data)
         if serializer.is_valid():
+            # The material goes to the course in the payload, which must be
+            # the teacher's too
+            if not get_course_access(request, serializer.validated_data['course']).is_owner:
+                return Response({'detail': 'You can only add materials to your own courses'}, status=403)
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@swagger_auto_schema(method='post', request_body=MaterialSerializer(many=True))
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def material_bulk_create(request):
+    if request.user.role != 'teacher':
+        return Response({'detail': 'Only teachers can upload materials'}, status=403)
+
+    items, error = get_bulk_items(request)
+    if error:
+        return error
+
+    courses = Course.objects.select_related('category', 'instructor').in_bulk(collect_ids(items, 'course'))
+    return bulk_create_response(
+        request, items, MaterialSerializer, {'course': courses},
+        check=owner_check(request, 'You can only add materials to your own courses')
+    )
+
 @swagger_auto_schema(method='put', request_body=MaterialSerializer)
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def material_detail(request, pk):
     try:
-        material = Material.objects.get(pk=pk)
+        material = Material.objects.select_related('course').get(pk=pk)
     except Material.DoesNotExist:
         return Response({'detail': 'Material not found'}, status=404)
 
     if request.method == 'GET':
-        lesson = material.lesson
-        course = lesson.course
-        is_teacher = request.user.role == 'teacher' and request.user == course.teacher
-        is_admin = request.user.role == 'admin'
-        is_enrolled = Enrollment.objects.filter(
-            student=request.user, 
-            course=course, 
-            status='active'
-        ).exists() if request.user.role == 'student' else False
-
-        if not (is_teacher or is_admin or is_enrolled):
+        if not get_course_access(request, material.course).allowed:
             return Response({'detail': 'You do not have permission to view this material'}, status=403)
 
         serializer = MaterialSerializer(material)
         return Response(serializer.data)
 
     elif request.method == 'PUT':
-        if request.user.role != 'teacher' or request.user != material.lesson.course.teacher:
+        if not get_course_access(request, material.course).is_owner:
             return Response({'detail': 'Only the course owner can update this material'}, status=403)
 
         serializer = MaterialSerializer(material, data=request.data)
         if serializer.is_valid():
+            if not get_course_access(request, serializer.validated_data['course']).is_owner:
+                return Response({'detail': 'You can only move materials to your own courses'}, status=403)
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'DELETE':
-        if request.user.role != 'teacher' or request.user != material.lesson.course.teacher:
+        if not get_course_access(request, material.course).is_owner:
             return Response({'detail': 'Only the course owner can delete this material'}, status=403)
 
         material.delete()
         return Response({'detail': 'Material deleted'}, status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def material_file(request, pk):
+    try:
+        material = Material.objects.select_related('course').get(pk=pk)
+    except Material.DoesNotExist:
+        return Response({'detail': 'Material not found'}, status=404)
+
+    if not get_course_access(request, material.course).allowed:
+        return Response({'detail': 'You do not have permission to view this material'}, status=403)
+
+    if not material.file:
+        return Response({'detail': 'Material has no file'}, status=404)
+    return serve_file(request, material.file)
+
 # ==================== ENROLLMENTS ====================
 
 @api_view(['GET'])
@@ -315,61 +502,133 @@ def enrollment_list(request):
         except Course.DoesNotExist:
             return Response({'detail': 'Course not found'}, status=404)
 
-        if request.user != course.teacher:
+        if not get_course_access(request, course).is_owner:
             return Response({'detail': 'You can only view enrollments for your own courses'}, status=403)
 
-        enrollments = Enrollment.objects.filter(course=course)
-        serializer = EnrollmentSerializer(enrollments, many=True)
-        return Response(serializer.data)
+        return paginated_enrollments(request, Enrollment.objects.filter(course=course))
 
     elif request.user.role == 'student':
-        enrollments = Enrollment.objects.filter(student=request.user)
-        serializer = EnrollmentSerializer(enrollments, many=True)
-        return Response(serializer.data)
+        return paginated_enrollments(request, Enrollment.objects.filter(student=request.user))
 
     elif request.user.role == 'admin':
-        course = request.query_params.get('course')
-        student = request.query_params.get('student')
+        return paginated_enrollments(request, admin_enrollments(request))
 
-        queryset = Enrollment.objects.all()
+    return Response({'detail': 'Unauthorized role'}, status=403)
 
-        if course:
-            queryset = queryset.filter(course__id=course)
-        if student:
-            queryset = queryset.filter(student__id=student)
+def admin_enrollments(request):
+    course = request.query_params.get('course')
+    student = request.query_params.get('student')
 
-        serializer = EnrollmentSerializer(queryset, many=True)
-        return Response(serializer.data)
+    queryset = Enrollment.objects.all()
 
-    return Response({'detail': 'Unauthorized role'}, status=403)
+    if course:
+        queryset = queryset.filter(course__id=course)
+    if student:
+        queryset = queryset.filter(student__id=student)
+    return queryset
+
+def paginated_enrollments(request, queryset):
+    serializer_class = list_serializer_class(request, EnrollmentSummarySerializer, EnrollmentSerializer)
+    paginator = KeysetPagination()
+    # Without ?expand= the rows are plain columns, built from .values()
+    builder = get_row_builder(serializer_class, {'request': request})
+    if builder is not None:
+        page = paginator.paginate_queryset(builder.values(queryset, 'created_at', 'id'), request)
+        return paginator.get_paginated_response(builder.build(page))
+
+    queryset = optimize_queryset(queryset, serializer_class, context={'request': request})
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 @swagger_auto_schema(method='post', request_body=EnrollmentSerializer)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([WriteRateThrottle, EnrollRateThrottle])
 def enroll_course(request):
     if request.user.role != 'student':
         return Response({'detail': 'Only students can enroll in courses'}, status=403)
 
     course = request.data.get('course')
-    payment_method = request.data.get('payment_method', 'free')
+    cache_key = idempotency_key(request, 'enroll')
+    fingerprint = str(course)
+    if cache_key:
+        replayed = replay(request, cache_key, fingerprint)
+        if replayed is not None:
+            return replayed
 
     try:
-        course = Course.objects.get(pk=course)
-    except Course.DoesNotExist:
+        course = Course.objects.select_related('category', 'instructor').get(pk=course)
+    except (Course.DoesNotExist, ValueError, TypeError):
         return Response({'detail': 'Course not found'}, status=404)
 
-    if Enrollment.objects.filter(student=request.user, course=course).exists():
-        return Response({'detail': 'You are already enrolled in this course'}, status=400)
+    # Insert first and let the (student, course) unique constraint catch
+    # repeats, instead of a racy exists() check before the insert. The
+    # student is set by id so an expanded student_details loads the row, not
+    # the token-backed request.user
+    enrollment = Enrollment(student_id=request.user.pk, course=course, price=course.price)
+    try:
+        with transaction.atomic():
+            enrollment.save()
+        response_status = status.HTTP_201_CREATED
+    except IntegrityError:
+        with transaction.atomic():
+            enrollment = Enrollment.objects.select_for_update().get(student=request.user, course=course)
+            if not enrollment.is_active:
+                # Re-enrolling after a deactivation reactivates the row, at
+                # today's price; progress is kept
+                enrollment.is_active = True
+                enrollment.price = course.price
+                enrollment.save(update_fields=['is_active', 'price', 'updated_at'])
+        enrollment.course = course
+        response_status = status.HTTP_200_OK
+
+    serializer = EnrollmentSerializer(enrollment, context={'request': request})
+    return remember(cache_key, fingerprint, Response(serializer.data, status=response_status))
+
+@swagger_auto_schema(method='post', request_body=EnrollmentSerializer(many=True))
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def enrollment_bulk_create(request):
+    if request.user.role != 'admin':
+        return Response({'detail': 'Only admins can enroll students in bulk'}, status=403)
+
+    items, error = get_bulk_items(request)
+    if error:
+        return error
+
+    courses = Course.objects.select_related('category', 'instructor').in_bulk(collect_ids(items, 'course'))
+    students = User.objects.filter(role='student').in_bulk(collect_ids(items, 'student'))
 
-    enrollment = Enrollment.objects.create(
-        student=request.user,
-        course=course,
-        payment_method=payment_method,
-        status='active'
+    def with_default_price(item):
+        # Students pay the course price unless the item says otherwise
+        if not isinstance(item, dict) or 'price' in item:
+            return item
+        course = courses.get(next(iter(collect_ids([item], 'course')), None))
+        return {**item, 'price': course.price} if course else item
+
+    items = [with_default_price(item) for item in items]
+
+    enrolled = set(
+        Enrollment.objects.filter(course_id__in=courses, student_id__in=students)
+        .values_list('student_id', 'course_id')
     )
 
-    serializer = EnrollmentSerializer(enrollment)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def check(attrs):
+        key = (attrs['student'].pk, attrs['course'].pk)
+        if key in enrolled:
+            return 409, 'Student is already enrolled in this course'
+        enrolled.add(key)
+        return None
+
+    def invalidate(created):
+        for enrollment in created:
+            invalidate_enrollment(enrollment.student_id, enrollment.course_id)
+
+    return bulk_create_response(
+        request, items, EnrollmentSerializer, {'course': courses, 'student': students},
+        check=check, invalidate=invalidate
+    )
 
 # ==================== QUESTIONS & ANSWERS ====================
 
@@ -384,25 +643,21 @@ def question_list_create(request):
             return Response({'detail': 'Lesson ID is required'}, status=400)
 
         try:
-            lesson = Lesson.objects.get(pk=lesson)
+            lesson = Lesson.objects.select_related('course').get(pk=lesson)
         except Lesson.DoesNotExist:
             return Response({'detail': 'Lesson not found'}, status=404)
 
-        course = lesson.course
-        is_teacher = request.user.role == 'teacher' and request.user == course.teacher
-        is_admin = request.user.role == 'admin'
-        is_enrolled = Enrollment.objects.filter(
-            student=request.user,
-            course=course,
-            status='active'
-        ).exists() if request.user.role == 'student' else False
-
-        if not (is_teacher or is_admin or is_enrolled):
+        if not get_course_access(request, lesson.course).allowed:
             return Response({'detail': 'You do not have permission to view these questions'}, status=403)
 
-        questions = QuestionAnswer.objects.filter(lesson=lesson)
-        serializer = QuestionAnswerSerializer(questions, many=True)
-        return Response(serializer.data)
+        serializer_class = list_serializer_class(request, QuestionAnswerSummarySerializer, QuestionAnswerSerializer)
+        questions = optimize_queryset(
+            QuestionAnswer.objects.filter(lesson=lesson), serializer_class, context={'request': request}
+        )
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(questions, request)
+        serializer = serializer_class(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     elif request.method == 'POST':
         if request.user.role != 'student':
@@ -410,20 +665,17 @@ def question_list_create(request):
 
         lesson = request.data.get('lesson')
         try:
-            lesson = Lesson.objects.get(pk=lesson)
+            lesson = Lesson.objects.select_related('course').get(pk=lesson)
         except Lesson.DoesNotExist:
             return Response({'detail': 'Lesson not found'}, status=404)
 
-        if not Enrollment.objects.filter(
-            student=request.user,
-            course=lesson.course,
-            status='active'
-        ).exists():
+        if not get_course_access(request, lesson.course).is_enrolled:
             return Response({'detail': 'You are not enrolled in this course'}, status=403)
 
         serializer = QuestionAnswerSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(student=request.user)
+            # By id: request.user only carries the token's claims
+            serializer.save(user_id=request.user.pk)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -432,31 +684,22 @@ def question_list_create(request):
 @permission_classes([IsAuthenticated])
 def question_detail(request, pk):
     try:
-        question = QuestionAnswer.objects.get(pk=pk)
+        question = QuestionAnswer.objects.select_related('lesson__course').get(pk=pk)
     except QuestionAnswer.DoesNotExist:
         return Response({'detail': 'Question not found'}, status=404)
 
+    course = question.lesson.course
+    is_asker = question.user_id == request.user.pk
+
     if request.method == 'GET':
-        lesson = question.lesson
-        course = lesson.course
-        is_teacher = request.user.role == 'teacher' and request.user == course.teacher
-        is_admin = request.user.role == 'admin'
-        is_enrolled = Enrollment.objects.filter(
-            student=request.user,
-            course=course,
-            status='active'
-        ).exists() if request.user.role == 'student' else False
-        is_asker = request.user == question.student
-
-        if not (is_teacher or is_admin or is_enrolled or is_asker):
+        if not (is_asker or get_course_access(request, course).allowed):
             return Response({'detail': 'You do not have permission to view this question'}, status=403)
 
         serializer = QuestionAnswerSerializer(question)
         return Response(serializer.data)
 
     elif request.method == 'PUT':
-        is_asker = request.user == question.student
-        is_teacher = request.user.role == 'teacher' and request.user == question.lesson.course.teacher
+        is_teacher = get_course_access(request, course).is_owner
 
         if not (is_asker or is_teacher):
             return Response({'detail': 'You do not have permission to update this question'}, status=403)
@@ -476,12 +719,132 @@ def question_detail(request, pk):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'DELETE':
-        is_asker = request.user == question.student
-        is_teacher = request.user.role == 'teacher' and request.user == question.lesson.course.teacher
-        is_admin = request.user.role == 'admin'
+        access = get_course_access(request, course)
 
-        if not (is_asker or is_teacher or is_admin):
+        if not (is_asker or access.is_owner or access.is_admin):
             return Response({'detail': 'You do not have permission to delete this question'}, status=403)
 
         question.delete()
         return Response({'detail': 'Question deleted'}, status=status.HTTP_204_NO_CONTENT)
+
+# ==================== UPLOADS ====================
+
+@swagger_auto_schema(method='post', request_body=UploadSessionSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_create(request):
+    if request.user.role != 'teacher':
+        return Response({'detail': 'Only teachers can upload files'}, status=403)
+
+    serializer = UploadSessionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    target = serializer.validated_data.get('lesson') or serializer.validated_data.get('material')
+    if not get_course_access(request, target.course).is_owner:
+        return Response({'detail': 'You can only upload files to your own courses'}, status=403)
+
+    session = serializer.save(user=request.user)
+    create_part_file(session)
+    response = Response(serializer.data, status=status.HTTP_201_CREATED)
+    response['Upload-Length'] = str(session.size)
+    response['Upload-Offset'] = '0'
+    return response
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_detail(request, pk):
+    try:
+        session = UploadSession.objects.get(pk=pk, user=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({'detail': 'Upload not found'}, status=404)
+
+    if request.method == 'GET':
+        # HEAD is answered from the same headers, as tus clients expect
+        ranges = received_ranges(session)
+        data = UploadSessionSerializer(session).data
+        data['received'] = ranges
+        data['offset'] = contiguous_offset(ranges)
+        response = Response(data)
+        response['Upload-Length'] = str(session.size)
+        response['Upload-Offset'] = str(data['offset'])
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    elif request.method == 'PUT':
+        if session.status != 'pending':
+            return Response({'detail': 'Upload is already complete'}, status=409)
+
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except KeyError:
+            return Response({'detail': 'Upload-Offset and Content-Length headers are required'}, status=411)
+        except ValueError:
+            return Response({'detail': 'Invalid Upload-Offset or Content-Length'}, status=400)
+
+        if length <= 0 or length > get_upload_settings()['MAX_CHUNK_SIZE']:
+            return Response({'detail': 'Invalid chunk size'}, status=413)
+        if offset < 0 or offset + length > session.size:
+            return Response({'detail': 'Chunk is outside the upload'}, status=416)
+
+        try:
+            expected = parse_checksum(request.headers.get('Upload-Checksum'))
+            # Read the raw body stream, not request.data, so the chunk goes
+            # straight to the part file instead of being parsed or buffered
+            checksum = write_chunk(session, offset, length, request._request, expected)
+        except UploadError as error:
+            return Response({'detail': error.detail}, status=error.status)
+        except FileNotFoundError:
+            return Response({'detail': 'Upload was completed or aborted'}, status=409)
+
+        UploadChunk.objects.update_or_create(
+            session=session, offset=offset,
+            defaults={'length': length, 'checksum': checksum}
+        )
+        response = Response({'offset': offset, 'length': length, 'checksum': checksum})
+        response['Upload-Offset'] = str(offset + length)
+        return response
+
+    elif request.method == 'DELETE':
+        # The post_delete signal removes the part file
+        session.delete()
+        return Response({'detail': 'Upload aborted'}, status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_complete(request, pk):
+    with transaction.atomic():
+        try:
+            session = UploadSession.objects.select_for_update().get(pk=pk, user=request.user)
+        except UploadSession.DoesNotExist:
+            return Response({'detail': 'Upload not found'}, status=404)
+
+        if session.status != 'pending':
+            return Response({'detail': 'Upload is already complete'}, status=409)
+
+        target, _ = get_target(session)
+        if not get_course_access(request, target.course).is_owner:
+            return Response({'detail': 'You can only upload files to your own courses'}, status=403)
+
+        try:
+            instance = finalize_upload(session)
+        except UploadError as error:
+            return Response({'detail': error.detail, 'received': received_ranges(session)}, status=error.status)
+
+    serializer_class = LessonSerializer if isinstance(instance, Lesson) else MaterialSerializer
+    return Response(serializer_class(instance).data)
+
+# ==================== METRICS ====================
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def metrics(request):
+    """This process's per-route request metrics (core/performance.py); DELETE resets them"""
+    if request.user.role != 'admin':
+        return Response({'detail': 'Only admins can view metrics'}, status=403)
+
+    if request.method == 'DELETE':
+        registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({'pid': os.getpid(), 'routes': registry.snapshot()})
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from core.performance import record_cache
+from .models import User
+
+ROLE_CLAIM = 'role'
+VERSION_CLAIM = 'ver'
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')]
+
+
+def token_version_key(user_id):
+    return f'token-version:{user_id}'
+
+
+def compute_token_version(user):
+    """
+    Short digest of the password generation and role, so it changes when
+    either does; empty (matching no token) for inactive users
+    """
+    if not user.is_active:
+        return ''
+    return salted_hmac('users.token-version', f'{user.token_generation}:{user.role}').hexdigest()[:16]
+
+
+def get_token_version(user_id):
+    """Current token version of a user, from the cache or one indexed lookup"""
+    cache = get_cache()
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    record_cache(version is not None)
+    if version is None:
+        # From the primary: a lagging replica would cache the version from
+        # before a revocation for AUTH_TOKEN_VERSION_SECONDS
+        user = (
+            User.objects.db_manager(DEFAULT_DB_ALIAS).filter(pk=user_id)
+            .only('token_generation', 'role', 'is_active').first()
+        )
+        version = compute_token_version(user) if user is not None else ''
+        cache.set(key, version, getattr(settings, 'AUTH_TOKEN_VERSION_SECONDS', 300))
+    return version
+
+
+def invalidate_token_version(user_id):
+    get_cache().delete(token_version_key(user_id))
+
+
+def add_token_claims(token, user):
+    token[ROLE_CLAIM] = user.role
+    token[VERSION_CLAIM] = compute_token_version(user)
+    return token
+
+
+def token_user(user_id, role):
+    """
+    Unsaved User carrying only the id and role, usable wherever the views
+    pass request.user to the ORM; views that need the other fields (or
+    save the user) must load the row
+    """
+    # simplejwt stores the id as a string; compared with foreign keys
+    # (course.instructor_id == user.pk) it must be the field's type
+    user_id = User._meta.get_field(api_settings.USER_ID_FIELD).to_python(user_id)
+    user = User(**{api_settings.USER_ID_FIELD: user_id}, role=role)
+    user._state.adding = False
+    user._state.db = DEFAULT_DB_ALIAS
+    return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user query: the role comes
+    from the token, and the token's version claim is checked against the
+    cached current version, so a role or password change (or deactivation)
+    revokes tokens issued before it. The signal handlers clear the cached
+    version; with an in-process cache other workers see the change after
+    AUTH_TOKEN_VERSION_SECONDS. Tokens without the claims are checked
+    against the database as before.
+    """
+
+    def get_user(self, validated_token):
+        if ROLE_CLAIM not in validated_token or VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        version = get_token_version(user_id)
+        if not version or version != validated_token[VERSION_CLAIM]:
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        return token_user(user_id, validated_token[ROLE_CLAIM])
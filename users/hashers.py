@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+
+# Hashers whose cost comes from settings. They keep the stock algorithm
+# names, so existing hashes verify, and must_update() compares each hash's
+# parameters with the settings: after a change, hashes are upgraded the
+# next time their user logs in.
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id at PASSWORD_ARGON2_TIME_COST passes over
+    PASSWORD_ARGON2_MEMORY_COST KiB with PASSWORD_ARGON2_PARALLELISM lanes
+    """
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_TIME_COST', 2)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', 19456)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', 1)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    scrypt at PASSWORD_SCRYPT_WORK_FACTOR (N), PASSWORD_SCRYPT_BLOCK_SIZE (r)
+    and PASSWORD_SCRYPT_PARALLELISM (p); each hash takes 128 * N * r bytes
+    and time proportional to N * r * p
+    """
+
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', 2**14)
+
+    @property
+    def block_size(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_BLOCK_SIZE', 8)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_PARALLELISM', 5)
+
+    # Only a ceiling: OpenSSL refuses more than 32 MiB unless told otherwise,
+    # and hashes made with a larger N than the current one must still verify
+    maxmem = 2**30
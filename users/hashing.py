@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework.exceptions import APIException
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PasswordHashingBusy(APIException):
+    """503 with Retry-After (set by DRF's handler from `wait`)"""
+    status_code = 503
+    default_detail = 'Too many password changes in progress, try again shortly.'
+    default_code = 'password_hashing_busy'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class HashingPool:
+    """
+    PASSWORD_HASH_THREADS threads hashing passwords, with room for
+    PASSWORD_HASH_QUEUE more waiting. The slow hashers spend their time in C
+    without the GIL, so the thread count is the number of cores hashing can
+    take from the rest of the traffic, and the queue bounds the request
+    threads left waiting on it; past the queue, requests are turned away
+    instead of piling up behind a registration burst.
+
+    The request thread still blocks until its hash is done: the pool bounds
+    how many hashes run at once, and so the CPU they take from other
+    requests, and sheds the excess; it does not free the worker thread.
+    """
+
+    def __init__(self, threads, queue):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(threads + queue)
+
+    def run(self, func, *args):
+        """Run func on the pool and wait for it, or raise PasswordHashingBusy"""
+        if not self.slots.acquire(blocking=False):
+            raise PasswordHashingBusy(getattr(settings, 'PASSWORD_HASH_RETRY_AFTER', 1))
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def make_password(self, password):
+        return self.run(make_password, password)
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                threads = getattr(settings, 'PASSWORD_HASH_THREADS', None) or max(1, (os.cpu_count() or 2) // 2)
+                queue = getattr(settings, 'PASSWORD_HASH_QUEUE', None)
+                _pool = HashingPool(threads, threads if queue is None else queue)
+    return _pool
+
+
+def hash_password(password):
+    """make_password through the bounded pool, or inline when it is disabled"""
+    if not getattr(settings, 'PASSWORD_HASH_POOL', True):
+        return make_password(password)
+    return get_pool().make_password(password)
+
+
+def verify_password(password, encoded, setter=None):
+    """
+    check_password through the bounded pool, or inline when it is disabled.
+    A hash upgrade (setter) runs in the calling thread, which owns the
+    database connection.
+    """
+    if not getattr(settings, 'PASSWORD_HASH_POOL', True):
+        return check_password(password, encoded, setter)
+    upgrade = []
+    is_correct = get_pool().run(check_password, password, encoded, upgrade.append)
+    if upgrade and setter:
+        setter(password)
+    return is_correct
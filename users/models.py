@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from .hashing import hash_password, verify_password
 
 USER_ROLES = (
     ('admin', 'admin'),
@@ -10,6 +11,33 @@ USER_ROLES = (
 class User(AbstractUser):
     role = models.CharField(max_length=10, choices=USER_ROLES)
     mobile_no = models.CharField(max_length=15, blank=True)
+    # Part of the token version (users/authentication.py); counts password
+    # changes, so hash upgrades on login leave other sessions signed in
+    token_generation = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        # _password is only set by set_password, not by check_password's
+        # hash upgrade
+        if self._password is not None:
+            self.token_generation += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_generation'}
+        super().save(*args, **kwargs)
+
+    # Hashing and verification, logins included, go through the bounded
+    # pool of users/hashing.py
+    def set_password(self, raw_password):
+        self.password = hash_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # A hash upgrade is not a password change
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return verify_password(raw_password, self.password, setter)
 
     def __str__(self):
         return f"{self.username} ({self.role})"
\ No newline at end of file
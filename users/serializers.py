@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from .models import User
-from django.contrib.auth.hashers import make_password 
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import VERSION_CLAIM, add_token_claims, get_token_version
+from .hashing import hash_password
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required = True)
@@ -10,5 +14,29 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'role', 'mobile_no','password']
     
     def create(self, validated_data):
-        validated_data['password'] = make_password(validated_data['password'])
-        return super().create(validated_data)
\ No newline at end of file
+        validated_data['password'] = hash_password(validated_data['password'])
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        if 'password' in validated_data:
+            instance.set_password(validated_data.pop('password'))
+        return super().update(instance, validated_data)
+
+
+class TokenObtainPairWithClaimsSerializer(TokenObtainPairSerializer):
+    """Issues tokens carrying the role and token version claims"""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_token_claims(super().get_token(user), user)
+
+
+class TokenRefreshWithClaimsSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens issued before a role or password change"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        version = refresh.get(VERSION_CLAIM)
+        if version is not None and version != get_token_version(refresh[api_settings.USER_ID_CLAIM]):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return super().validate(attrs)
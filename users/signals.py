@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import invalidate_token_version
+from .models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    user_id = instance.pk
+    invalidate_token_version(user_id)
+    # Again once committed, so a concurrent request cannot re-cache the
+    # pre-commit version
+    transaction.on_commit(lambda: invalidate_token_version(user_id))
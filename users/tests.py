@@ -1,3 +1,151 @@
-from django.test import TestCase
+from unittest import mock
+from django.contrib.auth.hashers import PBKDF2SHA1PasswordHasher
+from django.contrib.auth.tokens import default_token_generator
+from django.test import TestCase, override_settings
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient, APIRequestFactory
+from core.models import Category, Course
+from core.replicas import ReplicaRouter
+from core.throttling import LocalBucketStore
+from .authentication import StatelessJWTAuthentication, get_cache, get_token_version
+from .hashing import HashingPool
+from .models import User
 
-# Create your tests here.
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class StatelessJWTAuthenticationTestCase(TestCase):
+    """
+    Access tokens carry the role and a token version; changing either the
+    password or the role revokes the tokens issued before
+    """
+
+    def setUp(self):
+        patcher = mock.patch('core.throttling._store', LocalBucketStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='student', password='first password', role='student')
+
+    def obtain_token(self, password='first password'):
+        response = self.client.post('/api/token/', {'username': 'student', 'password': password}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def get_enrollments(self, access):
+        return self.client.get('/api/enrollments/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_valid_token_needs_no_user_lookup(self):
+        access = self.obtain_token()['access']
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        # The token version is looked up once, then cached
+        with self.assertNumQueries(1):
+            StatelessJWTAuthentication().authenticate(request)
+        with self.assertNumQueries(0):
+            user, _ = StatelessJWTAuthentication().authenticate(request)
+        self.assertEqual((user.pk, user.role), (self.user.pk, 'student'))
+        self.assertEqual(self.get_enrollments(access).status_code, 200)
+
+    def test_teacher_owns_courses(self):
+        teacher = User.objects.create_user(username='teacher', password='teacher password', role='teacher')
+        course = Course.objects.create(
+            title='Python', description='Python course', price=10, duration=5, is_active=True,
+            category=Category.objects.create(title='Programming'), instructor=teacher,
+        )
+        response = self.client.post('/api/token/', {'username': 'teacher', 'password': 'teacher password'}, format='json')
+        access = response.json()['access']
+        response = self.client.get('/api/enrollments/', {'course': course.pk}, HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_password_change_revokes_tokens(self):
+        tokens = self.obtain_token()
+        self.assertEqual(self.get_enrollments(tokens['access']).status_code, 200)
+
+        self.user.set_password('second password')
+        self.user.save()
+        response = self.get_enrollments(tokens['access'])
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_revoked')
+        refresh = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(refresh.status_code, 401)
+
+        self.assertEqual(self.get_enrollments(self.obtain_token('second password')['access']).status_code, 200)
+
+    def test_role_change_revokes_tokens(self):
+        access = self.obtain_token()['access']
+        self.user.role = 'admin'
+        self.user.save()
+        self.assertEqual(self.get_enrollments(access).status_code, 401)
+
+    def test_deactivation_revokes_tokens(self):
+        access = self.obtain_token()['access']
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_enrollments(access).status_code, 401)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.MD5PasswordHasher', 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    ])
+    def test_hash_upgrade_keeps_tokens(self):
+        access = self.obtain_token()['access']
+        hasher = PBKDF2SHA1PasswordHasher()
+        User.objects.filter(pk=self.user.pk).update(password=hasher.encode('first password', hasher.salt(), iterations=1))
+        # Logging in upgrades the hash to MD5
+        self.obtain_token()
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('md5$'))
+        self.assertEqual(self.get_enrollments(access).status_code, 200)
+
+    def test_version_read_from_primary(self):
+        get_cache().clear()
+        # Routed reads go to a replica that does not exist here
+        with mock.patch.object(ReplicaRouter, 'db_for_read', return_value='replica'):
+            self.assertTrue(get_token_version(self.user.pk))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class HashingPoolTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch('core.throttling._store', LocalBucketStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = HashingPool(threads=1, queue=0)
+        patcher = mock.patch('users.hashing._pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='student', password='first password', role='student')
+
+    def test_login_verifies_on_the_pool(self):
+        with mock.patch.object(self.pool, 'run', wraps=self.pool.run) as run:
+            self.assertTrue(self.user.check_password('first password'))
+            self.assertFalse(self.user.check_password('wrong password'))
+        self.assertEqual(run.call_count, 2)
+
+        # Every slot taken: logins are turned away, not queued
+        self.pool.slots.acquire()
+        self.addCleanup(self.pool.slots.release)
+        response = APIClient().post('/api/token/', {'username': 'student', 'password': 'first password'}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_password_reset_hashes_on_the_pool(self):
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        token = default_token_generator.make_token(self.user)
+        with mock.patch.object(self.pool, 'run', wraps=self.pool.run) as run:
+            response = APIClient().post(
+                f'/api/user/reset-password/{uid}/{token}/', {'new_password': 'second password'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(run.call_count, 1)
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('second password'))
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.MD5PasswordHasher', 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    ])
+    def test_hash_upgrade_saves_in_calling_thread(self):
+        hasher = PBKDF2SHA1PasswordHasher()
+        encoded = hasher.encode('first password', hasher.salt(), iterations=1)
+        User.objects.filter(pk=self.user.pk).update(password=encoded)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.check_password('first password'))
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('md5$'))
@@ -2,10 +2,11 @@ from django.shortcuts import render
 from django.shortcuts import render
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from .models import User
 from .serializers import UserSerializer
+from core.throttling import AuthRateThrottle
 from django.utils.http import urlsafe_base64_decode
 
 from django.contrib.auth import get_user_model
@@ -16,6 +17,7 @@ from django.contrib.auth.tokens import default_token_generator
 User = get_user_model()
 
 @api_view(['POST'])
+@throttle_classes([AuthRateThrottle])
 def forget_password(request):
     email = request.data.get('email')
     if not email:
@@ -41,6 +43,7 @@ def forget_password(request):
         })
     
 @api_view(['POST'])
+@throttle_classes([AuthRateThrottle])
 def password_reset_confirm(request, uidb64, token):
     try:
         uid = urlsafe_base64_decode(uidb64).decode()
@@ -61,6 +64,7 @@ def password_reset_confirm(request, uidb64, token):
     return Response({'message': 'Password has been reset successfully.'})
 
 @api_view(['GET', 'POST'])
+@throttle_classes([AuthRateThrottle])
 def user_list_create(request):
     if request.method == 'GET':
         if not request.user.is_authenticated :
@@ -86,9 +90,10 @@ def user_list_create(request):
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def student_profile(request):
-    user = request.user
-    if user.role != 'student':
+    if request.user.role != 'student':
         return Response({'detail': 'Not a student'}, status=status.HTTP_403_FORBIDDEN)
+    # request.user only carries the id and role under stateless JWT auth
+    user = User.objects.get(pk=request.user.pk)
     
     if request.method == 'GET':
         serializer = UserSerializer(user)
@@ -104,9 +109,10 @@ def student_profile(request):
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def teacher_profile(request):
-    user = request.user
-    if user.role != 'teacher':
+    if request.user.role != 'teacher':
         return Response({'detail': 'Not a teacher'}, status=status.HTTP_403_FORBIDDEN)
+    # request.user only carries the id and role under stateless JWT auth
+    user = User.objects.get(pk=request.user.pk)
     
     if request.method == 'GET':
         serializer = UserSerializer(user)